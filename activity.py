@@ -0,0 +1,106 @@
+"""Admin activity feed: an event bus backed by data/recent_activity.json.
+
+`publish()` appends an event (login, diagnosis, doctor or service change) to the
+file through `JsonPersistence` and wakes every waiting subscriber, so the admin
+dashboard can receive it over Server-Sent Events instead of polling.
+
+Events carry an increasing integer `id` (assigned under the file lock, so ids
+stay unique across worker processes in SHARED_STATE mode) which the SSE stream
+sends as the event id: a reconnecting browser sends it back as `Last-Event-ID`
+and `wait()` returns only what it missed. Subscribers of one worker are woken
+directly; events published by other workers are noticed through the file's
+revision, checked every `poll_interval` seconds (one stat()) while waiting.
+
+The file keeps the newest `max_events` entries, newest first, in the format the
+dashboard already used ({'icon', 'title', 'time'}, plus 'id', 'kind' and
+'timestamp').
+"""
+import threading
+import time
+from datetime import datetime
+
+
+def _with_ids(events):
+    """Events of the file, giving entries written before ids existed ids by age (oldest = 1)."""
+    if all(isinstance(e.get('id'), int) for e in events):
+        return events
+    count = len(events)
+    return [dict(e, id=e['id'] if isinstance(e.get('id'), int) else count - i) for i, e in enumerate(events)]
+
+
+class ActivityFeed:
+    def __init__(self, persistence, path, max_events=50, poll_interval=2.0):
+        self.persistence = persistence
+        self.path = path
+        self.max_events = max_events
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._events = []
+        self._revision = None
+
+    def _sync(self):
+        """Reload the events if the file changed (in this process or another one)."""
+        revision = self.persistence.revision(self.path, default=[])
+        if revision == self._revision:
+            return
+        events = self.persistence.read(self.path, default=[])
+        events = _with_ids([e for e in events if isinstance(e, dict)] if isinstance(events, list) else [])
+        with self._cond:
+            if self._revision is not None and revision <= self._revision:
+                return
+            self._events = events
+            self._revision = revision
+            self._cond.notify_all()
+
+    def recent(self):
+        """The stored events, newest first."""
+        self._sync()
+        return list(self._events)
+
+    def last_id(self):
+        self._sync()
+        return self._events[0]['id'] if self._events else 0
+
+    def publish(self, icon, title, kind=''):
+        """Record an event and wake the subscribers. Never raises: activity is best effort."""
+        now = datetime.now()
+
+        def append(events):
+            events[:] = _with_ids(events)
+            event = {
+                'id': max((e['id'] for e in events), default=0) + 1,
+                'icon': icon,
+                'title': title,
+                'time': now.strftime('%d/%m/%Y %H:%M'),
+                'kind': kind,
+                'timestamp': now.isoformat(timespec='seconds')
+            }
+            events.insert(0, event)
+            del events[self.max_events:]
+            return event
+
+        try:
+            event = self.persistence.update(self.path, append, default=[])
+            self._sync()
+            return event
+        except Exception as e:
+            print(f"Warning: could not record activity '{title}': {e}")
+            return None
+
+    def wait(self, last_id, timeout):
+        """Events newer than `last_id`, oldest first, waiting up to `timeout` seconds for one."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._sync()
+            with self._cond:
+                events = self._events
+                if events and events[0]['id'] < last_id:
+                    # The file was reset or replaced: resend what it holds now
+                    last_id = 0
+                newer = [e for e in events if e['id'] > last_id]
+                if newer:
+                    return newer[::-1]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(min(remaining, self.poll_interval))
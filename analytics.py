@@ -0,0 +1,159 @@
+"""Incrementally maintained diagnosis counters for the admin dashboard.
+
+Every diagnosis recorded by `result()` bumps one counter per dimension (disease,
+service, doctor, day) in `data/stats.json`, held in memory and written behind by
+`persistence.JsonPersistence`. Statistics are therefore read in O(number of
+buckets) instead of rescanning the patient history. If the file is lost or
+drifts, `scripts/rebuild_analytics.py` recomputes it from the history store.
+
+When the file does not exist yet, `ensure_built()` rebuilds it once in the
+background at worker startup (see app.create_app), under a cross-process lock so
+concurrent workers do not each rescan the history. The rebuild counts the rows up
+to the history's high-water id; diagnoses recorded meanwhile are held back and
+those above that id are merged into the rebuilt counters, so none is lost or
+counted twice (the JSON backend has no ids: its few held-back entries are all
+merged).
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+
+from history_store import DISPLAY_DATE_FORMAT
+from persistence import _process_lock
+
+
+DIMENSIONS = ('disease', 'service', 'doctor', 'day')
+
+
+def empty_stats():
+    stats = {dimension: {} for dimension in DIMENSIONS}
+    stats['total'] = 0
+    return stats
+
+
+def _day_of(entry):
+    try:
+        return datetime.strptime(entry.get('date') or '', DISPLAY_DATE_FORMAT).strftime('%Y-%m-%d')
+    except ValueError:
+        return datetime.now().strftime('%Y-%m-%d')
+
+
+def _bucket_keys(entry):
+    return {
+        'disease': entry.get('disease') or 'Inconnu',
+        'service': entry.get('service') or 'Inconnu',
+        'doctor': entry.get('doctor') or 'Inconnu',
+        'day': _day_of(entry)
+    }
+
+
+def _add(stats, entry):
+    for dimension, key in _bucket_keys(entry).items():
+        counters = stats.setdefault(dimension, {})
+        counters[key] = counters.get(key, 0) + 1
+    stats['total'] = stats.get('total', 0) + 1
+
+
+class DiagnosisStats:
+    def __init__(self, persistence, path):
+        self.persistence = persistence
+        self.path = path
+        # Set by ensure_built() until the rebuilt counters are written; record() then
+        # holds entries back in `_pending` for the rebuild to merge
+        self.rebuilding = False
+        self._pending = []
+        self._pending_lock = threading.Lock()
+
+    def record(self, entry, entry_id=None):
+        """Count one patient history entry (same dict as stored by `history_store`, `entry_id` its id)."""
+        with self._pending_lock:
+            if self.rebuilding:
+                self._pending.append((entry_id, entry))
+                return
+        self.persistence.update(self.path, lambda stats: _add(stats, entry), default=empty_stats())
+
+    def snapshot(self):
+        return self.persistence.read(self.path, default=empty_stats())
+
+    def summary(self, days=30, today=None):
+        """Rollups plus a zero-filled per-day series for the last `days` days."""
+        stats = self.snapshot()
+        today = today or datetime.now().date()
+        per_day = stats.get('day', {})
+        series = []
+        for offset in range(days - 1, -1, -1):
+            day = (today - timedelta(days=offset)).strftime('%Y-%m-%d')
+            series.append({'day': day, 'count': per_day.get(day, 0)})
+        month_prefix = today.strftime('%Y-%m')
+        return {
+            'total': stats.get('total', 0),
+            'month': sum(n for day, n in per_day.items() if day.startswith(month_prefix)),
+            'week': sum(item['count'] for item in series[-7:]),
+            'by_disease': stats.get('disease', {}),
+            'by_service': stats.get('service', {}),
+            'by_doctor': stats.get('doctor', {}),
+            'by_day': series,
+            'rebuilt_at': stats.get('rebuilt_at')
+        }
+
+    def rebuild(self, entries, through_id=None):
+        """Recompute every counter from an iterable of history entries. Returns the total.
+
+        `through_id` records the highest history id the entries cover (see ensure_built).
+        """
+        stats = empty_stats()
+        for entry in entries:
+            _add(stats, entry)
+        stats['rebuilt_at'] = datetime.now().isoformat(timespec='seconds')
+        if through_id is not None:
+            stats['rebuilt_through_id'] = through_id
+        self.persistence.write(self.path, stats)
+        return stats['total']
+
+    def ensure_built(self, history):
+        """Rebuild the counters from `history` (a PatientHistoryStore) on a background thread
+        if the file does not exist yet.
+
+        The file is checked again under a cross-process lock, so when several workers start
+        together one rebuilds and the others wait for it. Returns the thread, or None if the
+        file already exists.
+        """
+        if os.path.exists(self.path):
+            return None
+        self.rebuilding = True
+        thread = threading.Thread(target=self._build, args=(history,), name='stats-rebuild', daemon=True)
+        thread.start()
+        return thread
+
+    def _build(self, history):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with _process_lock(self.path + '.rebuild'):
+                if not os.path.exists(self.path):
+                    print(f"Building {self.path} from patient history")
+                    through_id = history.high_water_id()
+                    entries = history.iter_entries(descending=False)
+                    if through_id is not None:
+                        # Rows added from now on are counted from `_pending` instead
+                        entries = (e for e in entries if e.get('id') is None or e['id'] <= through_id)
+                    self.rebuild(entries, through_id)
+                self._merge_pending()
+                # On disk before the lock is released, so the other workers see it
+                self.persistence.flush()
+        except Exception as e:
+            print(f"Warning: could not build diagnosis statistics (see scripts/rebuild_analytics.py): {e}")
+            # Count what was held back rather than lose it
+            self._merge_pending()
+
+    def _merge_pending(self):
+        """Add the entries held back during the rebuild that it did not read, and resume counting."""
+        def merge(stats):
+            through_id = stats.get('rebuilt_through_id')
+            # Under the file's lock: record() either appended before this point or waits to update after it
+            with self._pending_lock:
+                for entry_id, entry in self._pending:
+                    if through_id is None or entry_id is None or entry_id > through_id:
+                        _add(stats, entry)
+                self._pending = []
+                self.rebuilding = False
+        self.persistence.update(self.path, merge, default=empty_stats())
@@ -1,47 +1,173 @@
-from flask import Flask, render_template, request, session, redirect, url_for, flash, jsonify, make_response
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, session, redirect, url_for, flash, jsonify, make_response, stream_with_context, g, after_this_request
+from collections import Counter
 from datetime import datetime, timedelta
 from functools import wraps
-import pdfkit
 import os
 import json
-import pickle
-import pandas as pd
-import numpy as np
+import csv
+import io
 import uuid
 import re
+import hmac
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from model_registry import ModelRegistry
+from history_store import ENTRY_FIELDS, SORT_COLUMNS, create_history_store
+from persistence import Replace, create_persistence
+from activity import ActivityFeed
+from analytics import DiagnosisStats
+from http_cache import PayloadCache, conditional_json
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as metrics_registry
+from disease_catalog import DiseaseCatalog
+from explanations import ExplanationService
+from token_store import TokenStore
+from doctor_directory import DoctorDirectory, doctor_id, normalize_email
+from doctor_import import DoctorImportError, doctor_signature, import_doctors, parse_doctors_csv, username_base
+from password_pool import POOL_START_METHOD, PasswordPool, PoolBusy, hash_passwords
+from pdf_jobs import PdfCache, PdfJobQueue, QueueFull
+from profiling import RequestProfiler
+from report_archive import stream_report_zip
+from reports import create_report_renderer
 
 app = Flask(__name__)
 app.secret_key = 'votre_cle_secrete_ici'
 
-# Configure pdfkit
+# Metrics served by /metrics in the Prometheus text format (see metrics.py). JSON file
+# and PDF render timers live in persistence.py and pdf_jobs.py; the gauges are read
+# at scrape time. With METRICS_TOKEN set, scrapes need `Authorization: Bearer <token>`.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+http_request_seconds = metrics_registry.histogram('http_request_duration_seconds', 'Request latency by route',
+                                                  ('route', 'method', 'status'))
+http_requests_total = metrics_registry.counter('http_requests_total', 'Requests by route',
+                                               ('route', 'method', 'status'))
+inference_seconds = metrics_registry.histogram('model_inference_seconds', 'Time spent in the model runtime',
+                                               ('kind',))
+predictions_total = metrics_registry.counter('predictions_total', 'Predictions by disease class',
+                                             ('class', 'disease', 'source'))
+metrics_registry.gauge('pdf_queue_depth', 'PDF renders queued or running', callback=lambda: pdf_jobs.depth())
+metrics_registry.gauge('password_pool_depth', 'Password hashes/verifications queued or running',
+                       callback=lambda: password_pool.depth())
+metrics_registry.gauge('activity_streams', 'Open admin activity streams', callback=lambda: _activity_streams)
+metrics_registry.gauge('model_ready', '1 once a warmed-up model is serving',
+                       callback=lambda: int(model_registry.is_ready()))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # The URL rule, not the path, so ids in URLs do not multiply the series
+        labels = (request.url_rule.rule if request.url_rule else 'unmatched', request.method,
+                  str(response.status_code))
+        http_request_seconds.observe(time.perf_counter() - start, *labels)
+        http_requests_total.inc(*labels)
+    return response
+
+
+# Request profiling armed by admins through /api/admin/profiler (see profiling.py);
+# PROFILER_INTERVAL is the stack sampling period in seconds
+request_profiler = RequestProfiler(interval=float(os.environ.get('PROFILER_INTERVAL', '0.005')))
+
+
+@app.before_request
+def start_request_profile():
+    # Disarmed (the usual case), this is a single attribute read
+    if request_profiler.armed and request.url_rule is not None and request.endpoint not in PROFILER_ENDPOINTS:
+        g.request_profile = request_profiler.begin(request.url_rule.rule, request.method)
+
+
+@app.teardown_request
+def finish_request_profile(exc):
+    capture = g.pop('request_profile', None)
+    if capture is not None:
+        request_profiler.end(capture)
+
+
+# wkhtmltopdf is only needed for the 'wkhtmltopdf' report backend (see reports.py)
 wkhtml_cmd = os.environ.get('WKHTMLTOPDF_CMD', r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe')
-pdfkit_config = pdfkit.configuration(wkhtmltopdf=wkhtml_cmd)
 
-# Load the CatBoost model
+PDF_OPTIONS = {
+    'encoding': 'UTF-8',
+    'page-size': 'A4',
+    'margin-top': '1cm',
+    'margin-right': '1cm',
+    'margin-bottom': '1cm',
+    'margin-left': '1cm'
+}
+PDF_WAIT_TIMEOUT = float(os.environ.get('PDF_WAIT_TIMEOUT', '60'))  # seconds /download-pdf waits for its job
+
+
+def report_html(result_data):
+    # The report date is the diagnosis date when known, so a given result always renders to the same HTML
+    date = result_data.get('date') or datetime.now().strftime('%d/%m/%Y %H:%M')
+    return render_template('pdf_template.html', result=result_data, date=date)
+
+
+# PDF_BACKEND=builtin|wkhtmltopdf|auto; reports render on a bounded worker pool and
+# are cached on disk by document hash (see reports.py and pdf_jobs.py)
+report_renderer = create_report_renderer(report_html, wkhtml_cmd, PDF_OPTIONS)
+pdf_cache = PdfCache(os.path.join('data', 'pdf_cache'),
+                     int(os.environ.get('PDF_CACHE_MAX_MB', '200')) * 1024 * 1024)
+pdf_jobs = PdfJobQueue(report_renderer, pdf_cache,
+                       workers=int(os.environ.get('PDF_WORKERS', '2')),
+                       max_pending=int(os.environ.get('PDF_MAX_PENDING', '32')))
+
+# The CatBoost model and disease mapping are served by a registry that loads them on a
+# background thread (started by create_app() or the first prediction) and reloads them
+# when the files change (see model_registry.py)
 model_path = 'models/CatBoost_best_model.pkl'
-if os.path.exists(model_path):
-    try:
-        with open(model_path, 'rb') as f:
-            model = pickle.load(f)
-        print("CatBoost model loaded successfully")
-    except Exception as e:
-        print(f"Error loading model: {e}")
-        model = None
-else:
-    print("Model file not found")
-    model = None
-
-# Print feature names if model is loaded
-if model is not None:
-    feature_names = model.feature_names_
-    print(f"Feature names (CatBoost): {feature_names}")
-else:
-    print("No feature names available - model not loaded")
-
-# Load disease mapping
-with open('models/disease_mapping.json', 'r') as f:
-    disease_mapping = json.load(f)
+disease_mapping_path = os.path.join('models', 'disease_mapping.json')
+
+# Optional precomputed prediction table over the form's input space (see inference.PredictionTable)
+PREDICTION_TABLE = os.environ.get('PREDICTION_TABLE', '0') == '1'
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', '4096'))
+MODEL_CHECK_INTERVAL = float(os.environ.get('MODEL_CHECK_INTERVAL', '2.0'))  # seconds between checks of the model files
+MODEL_WAIT_TIMEOUT = float(os.environ.get('MODEL_WAIT_TIMEOUT', '30'))  # seconds a prediction waits for the first load
+
+model_registry = ModelRegistry(model_path, disease_mapping_path,
+                               precompute=PREDICTION_TABLE,
+                               cache_size=PREDICTION_CACHE_SIZE,
+                               check_interval=MODEL_CHECK_INTERVAL)
+# Services and recommendations use the mapping before (or without) a loaded model; each
+# model version then brings the catalog compiled from its mapping (see disease_catalog.py)
+with open(disease_mapping_path, 'r') as f:
+    disease_catalog = DiseaseCatalog(json.load(f))
+
+
+def _use_model_version(version):
+    global disease_catalog
+    disease_catalog = version.catalog
+
+
+model_registry.on_swap(_use_model_version)
+
+# Feature contributions of each diagnosis, computed after its response and cached (see explanations.py)
+explanations = ExplanationService(cache_size=int(os.environ.get('EXPLANATION_CACHE_SIZE', '4096')),
+                                  max_pending=int(os.environ.get('EXPLANATION_MAX_PENDING', '1024')))
+EXPLANATION_WAIT_TIMEOUT = float(os.environ.get('EXPLANATION_WAIT_TIMEOUT', '2'))  # seconds a PDF report waits for it
+
+# JSON data files are read and written through a write-behind cache (see persistence.py)
+persistence = create_persistence()
+services_path = os.path.join('data', 'services.json')
+
+# Patient diagnosis history (SQLite by default, see history_store.py)
+history_store = create_history_store(persistence=persistence)
+ADMIN_PATIENTS_PAGE_SIZE = 50
+ADMIN_PATIENTS_MAX_PAGE_SIZE = 500
+
+# Diagnosis counters per disease/service/doctor/day (see analytics.py)
+stats_path = os.path.join('data', 'stats.json')
+diagnosis_stats = DiagnosisStats(persistence, stats_path)
+# Admin activity feed (data/recent_activity.json), pushed to the dashboard over SSE
+activity_feed = ActivityFeed(persistence, os.path.join('data', 'recent_activity.json'))
 
 # Authentication decorator
 def login_required(f):
@@ -63,21 +189,12 @@ def admin_required(f):
         username = session.get('username')
         print(f"Checking admin rights for: {username}")  # Debug print
         
-        data_path = os.path.join('data', 'medecins.json')
         try:
-            # Prefer the in-memory `doctors` dict which is initialized from `data/medecins.json` at startup.
-            if username in doctors and doctors[username].get('is_admin', False):
-                print(f"Admin access granted for (in-memory): {username}")
+            # The directory tracks data/medecins.json, so its role is the file's role
+            if doctor_directory.is_admin(username):
+                print(f"Admin access granted for: {username}")  # Debug print
                 return f(*args, **kwargs)
 
-            # Fallback: check raw data file for role information
-            if os.path.exists(data_path):
-                with open(data_path, 'r', encoding='utf-8') as file:
-                    medecins = json.load(file)
-                    if username in medecins and medecins[username].get('role') == 'admin':
-                        print(f"Admin access granted for (file): {username}")  # Debug print
-                        return f(*args, **kwargs)
-
             print(f"Admin access denied for: {username}")  # Debug print
             flash('Vous n\'avez pas les droits administrateur nécessaires.', 'error')
             return redirect(url_for('index'))
@@ -102,7 +219,15 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         
-        if username in doctors and check_password_hash(doctors[username]['password'], password):
+        try:
+            # Hashing/verification runs on the password pool, never on this request thread
+            valid = username in doctors and password_pool.verify(
+                doctor_directory.password_hash(username, password_pool.hash), password)
+        except PoolBusy:
+            flash('Trop de connexions simultanées, veuillez réessayer dans quelques secondes.', 'error')
+            return render_template('login.html'), 503
+
+        if valid:
             if not doctors[username].get('is_active', True):
                 flash('Compte désactivé. Contactez l\'administrateur.', 'error')
                 return redirect(url_for('login'))
@@ -111,6 +236,7 @@ def login():
             session['nom_medecin'] = doctors[username]['nom']
             session['specialite'] = doctors[username]['specialite']
             session['is_admin'] = doctors[username].get('is_admin', False)
+            activity_feed.publish('🔒', f"{doctors[username]['nom']} s'est connecté", 'login')
             flash('Connexion réussie', 'success')
             return redirect(url_for('index'))
             
@@ -133,37 +259,31 @@ def admin_dashboard():
             flash('Veuillez vous connecter', 'error')
             return redirect(url_for('login'))
 
-        if username not in doctors or not doctors[username].get('is_admin', False):
+        if not doctor_directory.is_admin(username):
             flash('Accès non autorisé', 'error')
             return redirect(url_for('index'))
 
         print(f"Admin access granted for: {username}")
         print(f"Admin Dashboard - Loaded doctors: {doctors.keys()}")
 
-        # Load recent activity from data/recent_activity.json when available, otherwise provide sensible defaults
-        recent_activity_path = os.path.join('data', 'recent_activity.json')
+        # Recent activity from the feed (data/recent_activity.json); admin.js then follows its SSE stream
         recent_activity = []
         try:
-            if os.path.exists(recent_activity_path):
-                with open(recent_activity_path, 'r', encoding='utf-8') as rf:
-                    recent_activity = json.load(rf)
-            else:
-                # sample fallback entries (developer-friendly)
-                recent_activity = [
-                    {'icon': '🔒', 'title': "Dr. Martin s'est connecté", 'time': 'Il y a 2 heures'},
-                    {'icon': '📝', 'title': 'Nouveau diagnostic: Patient #A54781', 'time': "Aujourd'hui, 10:45"},
-                    {'icon': '👨‍⚕️', 'title': 'Nouveau médecin: Dr. Sarah Benani', 'time': 'Hier, 14:30'}
-                ]
+            recent_activity = activity_feed.recent()
         except Exception as e:
             print(f"Warning: could not load recent activity: {e}")
 
-        # Load patients for admin view (recent predictions)
+        stats_summary = None
+        try:
+            stats_summary = diagnosis_stats.summary(days=7)
+        except Exception as e:
+            print(f"Warning: could not load diagnosis statistics: {e}")
+
+        # Only the first page of patients is rendered; admin.js fetches the rest from /api/admin/patients
         patients = []
+        patients_next_cursor = None
         try:
-            patients_path = os.path.join('data', 'patients.json')
-            if os.path.exists(patients_path):
-                with open(patients_path, 'r', encoding='utf-8') as pf:
-                    patients = json.load(pf)
+            patients, patients_next_cursor = history_store.page(limit=ADMIN_PATIENTS_PAGE_SIZE)
         except Exception as e:
             print(f"Warning: could not load patients for admin dashboard: {e}")
 
@@ -171,6 +291,9 @@ def admin_dashboard():
                              doctors=doctors,
                              recent_activity=recent_activity,
                              patients=patients,
+                             patients_next_cursor=patients_next_cursor,
+                             stats=stats_summary,
+                             services_count=len(services_with_defaults(persistence.read(services_path, default=[]))),
                              current_user=username,
                              nom_medecin=session.get('nom_medecin'),
                              specialite=session.get('specialite'))
@@ -187,104 +310,261 @@ def admin_dashboard():
 @login_required
 def api_admin_recent_activity():
     """Return recent activity as JSON for the admin dashboard.
-    Requires login; returns the same payload used by the template.
+    Requires login; returns the same payload used by the template (304 when unchanged).
     """
     # Only allow admins to fetch detailed activity
     if not session.get('is_admin'):
         return jsonify({'error': 'Accès non autorisé'}), 403
 
-    recent_activity_path = os.path.join('data', 'recent_activity.json')
-    recent_activity = []
-    try:
-        if os.path.exists(recent_activity_path):
-            with open(recent_activity_path, 'r', encoding='utf-8') as rf:
-                recent_activity = json.load(rf)
-        else:
-            recent_activity = [
-                {'icon': '🔒', 'title': "Dr. Martin s'est connecté", 'time': 'Il y a 2 heures'},
-                {'icon': '📝', 'title': 'Nouveau diagnostic: Patient #A54781', 'time': "Aujourd'hui, 10:45"},
-                {'icon': '👨‍⚕️', 'title': 'Nouveau médecin: Dr. Sarah Benani', 'time': 'Hier, 14:30'}
-            ]
-    except Exception as e:
-        print(f"Warning: could not load recent activity for API: {e}")
+    def build():
         recent_activity = []
+        try:
+            recent_activity = activity_feed.recent()
+        except Exception as e:
+            print(f"Warning: could not load recent activity for API: {e}")
+        return {'recent_activity': recent_activity}
 
-    return jsonify({'recent_activity': recent_activity})
+    revision = persistence.revision(activity_feed.path, default=[])
+    return conditional_json(api_cache.get('recent_activity', revision, build))
 
 
-@app.route('/api/admin/services')
+ACTIVITY_HEARTBEAT = float(os.environ.get('ACTIVITY_HEARTBEAT', '15'))
+# Each open stream holds one request thread of this worker until the client leaves. Under
+# gunicorn (gthread) the pool is fixed, so streams may use all but ACTIVITY_FREE_THREADS of
+# its threads (gunicorn.conf.py exports SERVER_THREADS); past that the dashboard polls
+# /api/admin/recent-activity instead. The development server starts a thread per request.
+ACTIVITY_FREE_THREADS = 2
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '0'))
+ACTIVITY_MAX_STREAMS = int(os.environ.get('ACTIVITY_MAX_STREAMS', '50'))
+if SERVER_THREADS:
+    ACTIVITY_MAX_STREAMS = max(min(ACTIVITY_MAX_STREAMS, SERVER_THREADS - ACTIVITY_FREE_THREADS), 0)
+_activity_streams = 0
+_activity_streams_lock = threading.Lock()
+
+
+def sse_event(event, data, event_id=None):
+    """Format one Server-Sent Event."""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+@app.route('/api/admin/activity/stream')
 @login_required
-def api_admin_services():
-    """Return list of services for admin UI."""
+def api_admin_activity_stream():
+    """Server-Sent Events stream of the activity feed.
+
+    Without `Last-Event-ID` the stream starts with a `snapshot` event (the current
+    list); after that, and after a reconnection with `Last-Event-ID`, each new
+    entry is sent as an `activity` event. A comment line every ACTIVITY_HEARTBEAT
+    seconds keeps proxies from closing the connection and detects gone clients.
+    Each open stream holds one server thread, hence ACTIVITY_MAX_STREAMS: past it the
+    answer is a 503 and the dashboard falls back to polling `/api/admin/recent-activity`.
+    """
+    global _activity_streams
     if not session.get('is_admin'):
         return jsonify({'error': 'Accès non autorisé'}), 403
 
-    services_path = os.path.join('data', 'services.json')
-    services = []
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
     try:
-        if os.path.exists(services_path):
-            with open(services_path, 'r', encoding='utf-8') as sf:
-                services = json.load(sf)
-                if not isinstance(services, list):
-                    services = []
-        # If services file missing or empty, build default services from disease_mapping
-        if not services:
-            # disease_mapping is loaded earlier in module; collect unique service names
-            try:
-                uniq = {}
-                for entry in disease_mapping.values():
-                    svc_name = entry.get('service')
-                    if not svc_name:
-                        continue
-                    key = re.sub(r'[^A-Za-z0-9]', '', svc_name).lower()
-                    # ensure unique id
-                    sid = key or uuid.uuid4().hex[:6]
-                    suffix = 1
-                    while sid in uniq:
-                        suffix += 1
-                        sid = f"{key}{suffix}"
-                    uniq[sid] = {
-                        'id': sid,
-                        'name': svc_name,
-                        'code': '',
-                        'description': f"Service auto-généré à partir des mappings de maladies"
-                    }
-                services = list(uniq.values())
-                # persist defaults so admin can later manage them
-                os.makedirs(os.path.dirname(services_path), exist_ok=True)
-                with open(services_path, 'w', encoding='utf-8') as sf:
-                    json.dump(services, sf, ensure_ascii=False, indent=4)
-            except Exception as e:
-                print(f"Warning: could not build default services from disease_mapping: {e}")
-                services = []
-    except Exception as e:
-        print(f"Warning: could not load services: {e}")
-        services = []
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    with _activity_streams_lock:
+        if _activity_streams >= ACTIVITY_MAX_STREAMS:
+            return jsonify({'error': 'Trop de connexions au flux d\'activité',
+                            'fallback': url_for('api_admin_recent_activity')}), 503
+        _activity_streams += 1
+
+    def generate():
+        yield "retry: 3000\n\n"
+        last_id = last_event_id
+        if last_id is None:
+            events = activity_feed.recent()
+            last_id = events[0]['id'] if events else 0
+            yield sse_event('snapshot', events, last_id)
+        while True:
+            events = activity_feed.wait(last_id, ACTIVITY_HEARTBEAT)
+            if not events:
+                yield ': keepalive\n\n'
+            for event in events:
+                last_id = event['id']
+                yield sse_event('activity', event, last_id)
+
+    def release_stream():
+        global _activity_streams
+        with _activity_streams_lock:
+            _activity_streams -= 1
+
+    response = app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+    # Runs when the server closes the response, including when the client went away
+    response.call_on_close(release_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Let nginx and similar proxies pass events through as they are written
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def patient_filters_from_request():
+    """Filters shared by the admin patient listing endpoints."""
+    filters = {key: request.args.get(key, '').strip() or None
+               for key in ('doctor', 'service', 'disease', 'cin', 'date_from', 'date_to')}
+    for key in ('date_from', 'date_to'):
+        if filters[key]:
+            datetime.strptime(filters[key], '%Y-%m-%d')
+    return filters
+
+
+@app.route('/api/admin/patients')
+@login_required
+def api_admin_patients():
+    """Cursor-paginated patient history for the admin dashboard.
+
+    Query parameters: doctor, service, disease, cin, date_from / date_to (YYYY-MM-DD),
+    sort (date, nom, doctor, service, disease), order (asc|desc), limit, cursor.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Accès non autorisé'}), 403
 
-    # Deduplicate services by id and by case-insensitive name, preserving first occurrence
     try:
-        deduped = []
-        seen_ids = set()
-        seen_names = set()
-        for s in services:
-            if not isinstance(s, dict):
-                continue
-            sid = s.get('id')
-            name = (s.get('name') or '').strip().lower()
-            if sid and sid in seen_ids:
-                continue
-            if name and name in seen_names:
-                continue
-            if sid:
-                seen_ids.add(sid)
-            if name:
-                seen_names.add(name)
-            deduped.append(s)
-        services = deduped
-    except Exception as e:
-        print(f"Warning: could not deduplicate services: {e}")
+        filters = patient_filters_from_request()
+        sort = request.args.get('sort', 'date')
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f'Tri inconnu: {sort}')
+        limit = min(max(int(request.args.get('limit', ADMIN_PATIENTS_PAGE_SIZE)), 1), ADMIN_PATIENTS_MAX_PAGE_SIZE)
+        patients, next_cursor = history_store.page(filters=filters,
+                                                   sort=sort,
+                                                   descending=request.args.get('order', 'desc') != 'asc',
+                                                   cursor=request.args.get('cursor') or None,
+                                                   limit=limit)
+    except ValueError as e:
+        return jsonify({'error': f'Paramètre invalide: {e}'}), 400
+
+    return jsonify({'patients': patients, 'next_cursor': next_cursor})
+
+
+EXPORT_BATCH_SIZE = 500  # history rows read and sent per chunk
+
+
+@app.route('/api/admin/patients/export')
+@login_required
+def export_patients():
+    """Stream the patient history as CSV (default) or NDJSON with `?format=ndjson`.
+
+    Takes the filters and sort parameters of /api/admin/patients. Rows are read
+    page by page from the history store and sent as they are read.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Accès non autorisé'}), 403
+
+    export_format = request.args.get('format', 'csv')
+    try:
+        if export_format not in ('csv', 'ndjson'):
+            raise ValueError(f'Format inconnu: {export_format}')
+        filters = patient_filters_from_request()
+        sort = request.args.get('sort', 'date')
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f'Tri inconnu: {sort}')
+    except ValueError as e:
+        return jsonify({'error': f'Paramètre invalide: {e}'}), 400
+    entries = history_store.iter_entries(filters=filters, sort=sort,
+                                         descending=request.args.get('order', 'desc') != 'asc',
+                                         batch_size=EXPORT_BATCH_SIZE)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if export_format == 'csv' else None
+        if writer:
+            writer.writerow(ENTRY_FIELDS)
+        for count, entry in enumerate(entries, start=1):
+            row = [entry.get(field, '') for field in ENTRY_FIELDS]
+            if writer:
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(ENTRY_FIELDS, row)), ensure_ascii=False) + '\n')
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename=patients_{datetime.now().strftime("%Y%m%d_%H%M")}.{export_format}')
+    return response
+
+
+@app.route('/api/admin/stats')
+@login_required
+def api_admin_stats():
+    """Diagnosis rollups per disease, service, doctor and day (last `days` days, default 30)."""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Accès non autorisé'}), 403
+    try:
+        days = min(max(int(request.args.get('days', 30)), 7), 366)
+    except ValueError:
+        return jsonify({'error': 'Paramètre invalide: days'}), 400
+    return jsonify(diagnosis_stats.summary(days=days))
+
+
+def services_with_defaults(services):
+    """`services` from services.json, or the catalog's services while it is empty."""
+    return services if services else disease_catalog.default_services()
+
+
+def dedupe_services(services):
+    """Deduplicate services by id and by case-insensitive name, preserving first occurrence."""
+    deduped = []
+    seen_ids = set()
+    seen_names = set()
+    for s in services:
+        if not isinstance(s, dict):
+            continue
+        sid = s.get('id')
+        name = (s.get('name') or '').strip().lower()
+        if sid and sid in seen_ids:
+            continue
+        if name and name in seen_names:
+            continue
+        if sid:
+            seen_ids.add(sid)
+        if name:
+            seen_names.add(name)
+        deduped.append(s)
+    return deduped
+
+
+# Serialized admin API payloads with their ETag/Last-Modified, rebuilt only when the data changes
+api_cache = PayloadCache()
+
+
+def mapping_revision():
+    version = model_registry.current()
+    return version.mapping_version if version else None
+
+
+@app.route('/api/admin/services')
+@login_required
+def api_admin_services():
+    """Return list of services for admin UI (304 when the client's ETag is current)."""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Accès non autorisé'}), 403
+
+    def build():
+        services = []
+        try:
+            # While services.json is empty the list comes from the disease catalog; it is only
+            # written once an admin edits the services (see add_service)
+            services = services_with_defaults(persistence.read(services_path, default=[]))
+        except Exception as e:
+            print(f"Warning: could not load services: {e}")
+        return {'services': dedupe_services(services)}
 
-    return jsonify({'services': services})
+    revision = (persistence.revision(services_path, default=[]), mapping_revision())
+    return conditional_json(api_cache.get('services', revision, build))
 
 
 @app.route('/admin/add-service', methods=['POST'])
@@ -313,38 +593,30 @@ def add_service():
     if not name:
         return ('Le nom du service est requis', 400)
 
-    services_path = os.path.join('data', 'services.json')
-    services = []
-    try:
-        if os.path.exists(services_path):
-            with open(services_path, 'r', encoding='utf-8') as sf:
-                services = json.load(sf)
-                if not isinstance(services, list):
-                    services = []
-    except Exception:
-        services = []
-
-    # create simple unique id
-    base = re.sub(r'[^A-Za-z0-9]', '', name).lower() or uuid.uuid4().hex[:6]
-    sid = base
-    suffix = 1
-    existing_ids = {s.get('id') for s in services if isinstance(s, dict) and s.get('id')}
-    while sid in existing_ids:
-        suffix += 1
-        sid = f"{base}{suffix}"
-
-    new_service = {
-        'id': sid,
-        'name': name,
-        'code': code,
-        'description': description
-    }
-    services.insert(0, new_service)
+    def insert_service(services):
+        # The first edit materializes the default services the admin was looking at
+        if not services:
+            services.extend(disease_catalog.default_services())
+        # create simple unique id
+        base = re.sub(r'[^A-Za-z0-9]', '', name).lower() or uuid.uuid4().hex[:6]
+        sid = base
+        suffix = 1
+        existing_ids = {s.get('id') for s in services if isinstance(s, dict) and s.get('id')}
+        while sid in existing_ids:
+            suffix += 1
+            sid = f"{base}{suffix}"
+
+        new_service = {
+            'id': sid,
+            'name': name,
+            'code': code,
+            'description': description
+        }
+        services.insert(0, new_service)
+        return new_service
 
     try:
-        os.makedirs(os.path.dirname(services_path), exist_ok=True)
-        with open(services_path, 'w', encoding='utf-8') as sf:
-            json.dump(services, sf, ensure_ascii=False, indent=4)
+        new_service = persistence.update(services_path, insert_service, default=[])
     except Exception as e:
         print(f"Warning: could not persist services: {e}")
         # if request.json was used, return 500
@@ -353,6 +625,7 @@ def add_service():
         flash('Le service a été créé en mémoire mais la sauvegarde a échoué', 'warning')
         return redirect(url_for('admin_dashboard'))
 
+    activity_feed.publish('🏥', f"Nouveau service: {name}", 'service')
     if request.is_json:
         return jsonify({'service': new_service}), 201
 
@@ -370,14 +643,11 @@ def delete_service():
         sid = payload.get('id')
         if not sid:
             return ('Missing id', 400)
-        services_path = os.path.join('data', 'services.json')
-        services = []
-        if os.path.exists(services_path):
-            with open(services_path, 'r', encoding='utf-8') as sf:
-                services = json.load(sf)
-        services = [s for s in services if s.get('id') != sid]
-        with open(services_path, 'w', encoding='utf-8') as sf:
-            json.dump(services, sf, ensure_ascii=False, indent=4)
+        persistence.update(services_path,
+                           lambda services: Replace([s for s in services_with_defaults(services)
+                                                     if s.get('id') != sid]),
+                           default=[])
+        activity_feed.publish('🗑️', f"Service supprimé: {sid}", 'service')
         return ('', 200)
     except Exception as e:
         print(f"Error deleting service: {e}")
@@ -390,30 +660,10 @@ def reload_services_from_mapping():
     if not session.get('is_admin'):
         return ('Accès non autorisé', 403)
 
-    services_path = os.path.join('data', 'services.json')
     try:
-        uniq = {}
-        for entry in disease_mapping.values():
-            svc_name = entry.get('service')
-            if not svc_name:
-                continue
-            key = re.sub(r'[^A-Za-z0-9]', '', svc_name).lower()
-            sid = key or uuid.uuid4().hex[:6]
-            suffix = 1
-            while sid in uniq:
-                suffix += 1
-                sid = f"{key}{suffix}"
-            uniq[sid] = {
-                'id': sid,
-                'name': svc_name,
-                'code': '',
-                'description': f"Service auto-généré à partir des mappings de maladies"
-            }
-
-        services = list(uniq.values())
-        os.makedirs(os.path.dirname(services_path), exist_ok=True)
-        with open(services_path, 'w', encoding='utf-8') as sf:
-            json.dump(services, sf, ensure_ascii=False, indent=4)
+        services = disease_catalog.default_services()
+        persistence.write(services_path, services)
+        activity_feed.publish('🔄', f"Services régénérés depuis le mapping ({len(services)})", 'service')
         return ('', 200)
     except Exception as e:
         print(f"Error reloading services from mapping: {e}")
@@ -421,15 +671,16 @@ def reload_services_from_mapping():
 
 def generate_pdf_report(prediction_result):
     try:
-        html = render_template('pdf_template.html',
-                             prediction_result=prediction_result,
-                             medecin_info={
-                                 'nom': session.get('nom_medecin'),
-                                 'specialite': session.get('specialite')
-                             },
-                             current_date=datetime.now().strftime('%d/%m/%Y %H:%M'))
-        
-        pdf = pdfkit.from_string(html, False, configuration=pdfkit_config)
+        report = dict(prediction_result)
+        report.setdefault('medecin', {
+            'nom': session.get('nom_medecin'),
+            'specialite': session.get('specialite')
+        })
+        job = pdf_jobs.submit(report_renderer.document(report), owner=session.get('username'))
+        job.done.wait(PDF_WAIT_TIMEOUT)
+        pdf = pdf_jobs.result(job)
+        if pdf is None:
+            raise RuntimeError(job.error or 'délai de génération dépassé')
         
         response = make_response(pdf)
         response.headers['Content-Type'] = 'application/pdf'
@@ -441,188 +692,65 @@ def generate_pdf_report(prediction_result):
         flash('Erreur lors de la génération du PDF.', 'error')
         return redirect(url_for('index'))
 
-# Load doctors from data/medecins.json and normalize into the `doctors` dict used by the app
-doctors = {}
+# Doctors are normalized from data/medecins.json by `DoctorDirectory`, which indexes
+# them by username, id, email and numero_ordre and rebuilds whenever the file changes,
+# whether the change came from this worker or another one. `doctors` is its record
+# dict (updated in place), kept under this name for the handlers and templates.
 data_medecins_path = os.path.join('data', 'medecins.json')
-def is_hashed_password(pwd: str) -> bool:
-    """Return True if `pwd` looks like a Werkzeug/secure hash we accept."""
-    if not isinstance(pwd, str):
-        return False
-    # common Werkzeug prefixes or scrypt used by current environment
-    return pwd.startswith('pbkdf2:') or pwd.startswith('scrypt:') or pwd.startswith('argon2:')
-if os.path.exists(data_medecins_path):
-    try:
-        with open(data_medecins_path, 'r', encoding='utf-8') as f:
-            raw = json.load(f)
-        for username, info in raw.items():
-            pwd = info.get('password', '')
-            if is_hashed_password(pwd):
-                stored_pwd = pwd
-            else:
-                # Found plaintext or unsupported hash: warn and hash in-memory
-                print(f"Warning: password for {username} does not appear hashed. Hashing in-memory (not persisted).")
-                stored_pwd = generate_password_hash(pwd or 'password123')
-
-            doctors[username] = {
-                'password': stored_pwd,
-                'nom': info.get('nom_complet') or info.get('nom') or username,
-                'specialite': info.get('specialite', ''),
-                'email': info.get('email', ''),
-                'is_active': info.get('is_active', True),
-                'is_admin': info.get('role', '') == 'admin'
-            }
-        print(f"Loaded {len(doctors)} doctors from {data_medecins_path}")
-    except Exception as e:
-        print(f"Error loading doctors from {data_medecins_path}: {e}")
-
-# Fallback hardcoded doctors (only used if file missing or empty)
-if not doctors:
-    doctors = {
-        'dr.smith': {
-            'password': generate_password_hash('password123'),
-            'nom': 'Dr. Smith',
-            'specialite': 'Cardiologue',
-            'is_active': True,
-            'is_admin': True
-        },
-        'dr.martin': {
-            'password': generate_password_hash('password123'),
-            'nom': 'Dr. Martin',
-            'specialite': 'Pneumologue',
-            'is_active': True,
-            'is_admin': False
-        }
-    }
-
-# Password reset tokens (file-backed): token -> {'username': str, 'expires': datetime}
-password_reset_tokens = {}
+doctor_directory = DoctorDirectory(persistence, data_medecins_path)
+# Password hashing/verification on a few low-priority processes, so login
+# bursts cannot take every request thread; excess requests are turned away at once
+password_pool = PasswordPool(
+    workers=int(os.environ.get('PASSWORD_WORKERS', str(max(1, (os.cpu_count() or 2) // 2)))),
+    max_pending=int(os.environ.get('PASSWORD_MAX_PENDING', '16')))
+DOCTOR_IMPORT_WORKERS = int(os.environ.get('DOCTOR_IMPORT_WORKERS', str(os.cpu_count() or 1)))
+doctors = doctor_directory.doctors
+doctor_directory.refresh()
+
+# Password reset tokens: an expiry heap and per-account index in memory, persisted as an
+# append-only journal (data/password_reset_tokens.journal) compacted into
+# data/password_reset_tokens.json; see token_store.py
 password_tokens_path = os.path.join('data', 'password_reset_tokens.json')
+PASSWORD_RESET_TTL = timedelta(minutes=15)
+password_tokens = TokenStore(password_tokens_path,
+                             max_per_user=int(os.environ.get('MAX_RESET_TOKENS_PER_USER', '3')),
+                             shared=persistence.shared)
+password_tokens.refresh()
 
 
-def _cleanup_expired_tokens_dict(tokens: dict) -> dict:
-    now = datetime.now()
-    return {t: v for t, v in tokens.items() if v.get('expires') and v['expires'] > now}
-
-
-def load_password_tokens():
-    global password_reset_tokens
-    if not os.path.exists(password_tokens_path):
-        password_reset_tokens = {}
-        return
-    try:
-        with open(password_tokens_path, 'r', encoding='utf-8') as f:
-            raw = json.load(f)
-        tokens = {}
-        for token, info in raw.items():
-            expires_raw = info.get('expires')
-            try:
-                expires_dt = datetime.fromisoformat(expires_raw) if expires_raw else None
-            except Exception:
-                expires_dt = None
-            tokens[token] = {'username': info.get('username'), 'expires': expires_dt}
-
-        # Remove expired
-        password_reset_tokens = _cleanup_expired_tokens_dict(tokens)
-    except Exception as e:
-        print(f"Warning: could not load password tokens: {e}")
-        password_reset_tokens = {}
-
-
-def save_password_tokens():
-    try:
-        serializable = {}
-        for token, info in password_reset_tokens.items():
-            expires = info.get('expires')
-            serializable[token] = {
-                'username': info.get('username'),
-                'expires': expires.isoformat() if expires else None
-            }
-        # ensure data dir exists
-        os.makedirs(os.path.dirname(password_tokens_path), exist_ok=True)
-        with open(password_tokens_path, 'w', encoding='utf-8') as f:
-            json.dump(serializable, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        print(f"Warning: could not save password tokens: {e}")
-
-
-# Load tokens at startup
-load_password_tokens()
+@app.before_request
+def refresh_shared_state():
+    """Pick up account and token changes written by other workers (one stat() per file)."""
+    doctor_directory.refresh()
+    password_tokens.refresh()
 
 # NOTE: `models/disease_mapping.json` is the authoritative mapping of class -> {name, examens, service}
-# The file is loaded near the top of this module into `disease_mapping`.
+# It is compiled into `disease_catalog` (indexed by class id, disease name and service).
 def get_recommended_service(disease_name):
-    for entry in disease_mapping.values():
-        if entry.get('name') == disease_name:
-            return entry.get('service', 'Service de Médecine Générale')
-    return 'Service de Médecine Générale'
+    return disease_catalog.service_for(disease_name)
 
 def get_recommended_exams(disease_name):
-    for entry in disease_mapping.values():
-        if entry.get('name') == disease_name:
-            return entry.get('examens', ['Consultation médicale approfondie'])
-    return ['Consultation médicale approfondie']
-
-
-# Build a mapping from alphanumeric id -> actual username key so users can use `id`
-ids_map = {}
-for username_key, info in doctors.items():
-    # prefer explicit 'id' from source file if present
-    explicit_id = None
-    try:
-        with open(data_medecins_path, 'r', encoding='utf-8') as f:
-            raw_file = json.load(f)
-            explicit_id = raw_file.get(username_key, {}).get('id')
-    except Exception:
-        explicit_id = None
+    return list(disease_catalog.exams_for(disease_name))
 
-    if explicit_id:
-        uid = explicit_id
-    else:
-        # derive id by removing non-alphanumeric chars
-        uid = re.sub(r'[^A-Za-z0-9]', '', username_key)
-
-    doctors[username_key]['id'] = uid
-    ids_map[uid] = username_key
 
 @app.route('/result', methods=['POST'])
 @login_required
 def result():
     if request.method == 'POST':
         try:
-            # Create features DataFrame
-            features = pd.DataFrame({
-                'Fever': [float(request.form.get('fever', 0))],
-                'Cough': [float(request.form.get('cough', 0))],
-                'Fatigue': [float(request.form.get('fatigue', 0))],
-                'Difficulty Breathing': [float(request.form.get('difficulty_breathing', 0))],
-                'Age': [float(request.form.get('age', 0))],
-                'Gender': [float(request.form.get('gender', 0))],
-                'Blood Pressure': [float(request.form.get('blood_pressure', 0))],
-                'Cholesterol Level': [float(request.form.get('cholesterol_level', 0))],
-                'Outcome Variable': [0.0]  # Required by model, will be ignored for prediction
-            })
-
-            # Ensure column order matches model's expectations
-            features = features[model.feature_names_]
-            
-            # Make prediction
-            raw_prediction = model.predict(features)
-            probabilities = model.predict_proba(features)
-            
-            # Convert prediction to string for dictionary lookup
-            disease_class = str(int(raw_prediction.item()))
-            confidence = float(np.max(probabilities[0])) * 100
-
-            # Map class -> disease entry from models/disease_mapping.json
-            d_entry = disease_mapping.get(disease_class)
-            if d_entry:
-                disease_name = d_entry.get('name', 'Maladie inconnue')
-                service = d_entry.get('service', 'Service de Médecine Générale')
-                exams = d_entry.get('examens', ['Consultation médicale approfondie'])
-            else:
-                disease_name = 'Maladie inconnue'
-                service = 'Service de Médecine Générale'
-                exams = ['Consultation médicale approfondie']
+            # Single predict_proba call on a preallocated buffer in model.feature_names_ order
+            version = model_registry.current(wait=MODEL_WAIT_TIMEOUT)
+            if version is None:
+                flash('Modèle de diagnostic non disponible', 'error')
+                return redirect(url_for('index'))
+            with inference_seconds.time('form'):
+                vector = version.runtime.vector_from_form(request.form)
+                disease_class, confidence = version.runtime.predict_vector(vector)
+            features = vector[0].tolist()
+
+            # Map class -> disease entry of the same model version (models/disease_mapping.json)
+            disease_name, service, exams = describe_disease_class(disease_class, version.catalog)
+            predictions_total.inc(disease_class, disease_name, 'form')
 
             # Build result dictionary
             result_data = {
@@ -649,23 +777,13 @@ def result():
                 'medecin': {
                     'nom': session.get('nom_medecin', ''),
                     'specialite': session.get('specialite', '')
-                }
+                },
+                # Identifies the explanation the page polls for and the PDF report includes
+                'explication_ref': {'version': version.version, 'features': features}
             }
 
-            # Persist patient prediction to data/patients.json so admin can review per-doctor lists
+            # Persist patient prediction to the history store so admin can review per-doctor lists
             try:
-                patients_path = os.path.join('data', 'patients.json')
-                os.makedirs(os.path.dirname(patients_path), exist_ok=True)
-                patients = []
-                if os.path.exists(patients_path):
-                    try:
-                        with open(patients_path, 'r', encoding='utf-8') as pf:
-                            patients = json.load(pf)
-                            if not isinstance(patients, list):
-                                patients = []
-                    except Exception:
-                        patients = []
-
                 patient_entry = {
                     'nom': result_data['patient'].get('nom', ''),
                     'prenom': result_data['patient'].get('prenom', ''),
@@ -675,18 +793,25 @@ def result():
                     'disease': result_data['diagnostic'].get('maladie', ''),
                     'doctor': result_data['medecin'].get('nom', ''),
                     'service': result_data['diagnostic'].get('service', ''),
-                    'date': result_data.get('date', datetime.now().strftime('%d/%m/%Y %H:%M'))
+                    'date': result_data.get('date', datetime.now().strftime('%d/%m/%Y %H:%M')),
+                    'model_version': version.version
                 }
-
-                patients.insert(0, patient_entry)
-                # keep most recent 1000 entries to avoid unbounded growth
-                patients = patients[:1000]
-                with open(patients_path, 'w', encoding='utf-8') as pf:
-                    json.dump(patients, pf, ensure_ascii=False, indent=4)
+                entry_id = history_store.add(patient_entry)
+                diagnosis_stats.record(patient_entry, entry_id)
             except Exception as e:
                 print(f"Warning: could not persist patient entry: {e}")
+            patient = result_data['patient']
+            activity_feed.publish('📝', f"Nouveau diagnostic: {patient['prenom']} {patient['nom']} ({disease_name}) "
+                                        f"par {result_data['medecin']['nom']}", 'diagnosis')
 
             print("Debug - Result Data:", result_data)  # Debug print
+
+            @after_this_request
+            def queue_explanation(response):
+                # Queued once the page is rendered: the diagnosis never waits for ShapValues
+                explanations.submit(version, features)
+                return response
+
             return render_template('result.html', result=result_data)
 
         except Exception as e:
@@ -698,6 +823,257 @@ def result():
 
     return redirect(url_for('index'))
 
+
+BATCH_MAX_ROWS = int(os.environ.get('BATCH_MAX_ROWS', '50000'))
+
+
+def describe_disease_class(disease_class, catalog=None):
+    """Return (disease_name, service, exams) for a stringified model class."""
+    name, service, exams = (catalog or disease_catalog).describe(disease_class)
+    return name, service, list(exams)
+
+
+def predict_batch(version, rows, explain=False):
+    """Score a list of row dicts with a single `predict_proba` call of one model version.
+
+    Rows use the same field names as the diagnostic form (`fever`, `age`, ...) or the
+    model column names (`Fever`, `Age`, ...). Missing values default to 0 like `/result`.
+    With `explain`, each result also gets the feature contributions to its class, all
+    rows being explained by one ShapValues call.
+    """
+    runtime = version.runtime
+    matrix = runtime.matrix_from_rows(rows)
+    with inference_seconds.time('batch'):
+        disease_classes, confidences = runtime.predict_matrix(matrix)
+
+    results = []
+    predicted = Counter()
+    for i, row in enumerate(rows):
+        disease_name, service, exams = describe_disease_class(disease_classes[i], version.catalog)
+        predicted[disease_classes[i], disease_name] += 1
+        results.append({
+            'index': i,
+            'nom': row.get('LastName', row.get('nom', '')),
+            'prenom': row.get('FirstName', row.get('prenom', '')),
+            'cne': row.get('CNE', row.get('cne', '')),
+            'classe': disease_classes[i],
+            'maladie': disease_name,
+            'confiance': f"{confidences[i]:.1f}%",
+            'service': service,
+            'examens': exams,
+            'model_version': version.version
+        })
+    for (disease_class, disease_name), count in predicted.items():
+        predictions_total.inc(disease_class, disease_name, 'batch', amount=count)
+    if explain:
+        for item, explanation in zip(results, explanations.explain_matrix(version, matrix, disease_classes)):
+            item['explication'] = explanation
+    return results
+
+
+def _batch_rows_from_request():
+    """Read rows from an uploaded CSV (`file`) or a JSON array body."""
+    upload = request.files.get('file')
+    if upload:
+        # pandas is only needed for CSV uploads; importing it lazily keeps worker startup fast
+        import pandas as pd
+        frame = pd.read_csv(upload, dtype=str, keep_default_na=False)
+        return frame.to_dict(orient='records')
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('patients')
+    if not isinstance(payload, list) or not all(isinstance(r, dict) for r in payload):
+        raise ValueError('Le corps doit être un tableau JSON de patients ou un fichier CSV')
+    return payload
+
+
+@app.route('/api/predict/batch', methods=['POST'])
+@app.route('/api/explain/batch', methods=['POST'], endpoint='api_explain_batch', defaults={'explain': True})
+@login_required
+def api_predict_batch(explain=False):
+    """Score many patients in one vectorized model call.
+
+    Accepts a JSON array (or `{"patients": [...]}`) or a multipart CSV upload named `file`.
+    Returns `{"results": [...]}`, or one JSON object per line with `?format=ndjson`.
+    `/api/explain/batch` also returns the feature contributions of every prediction.
+    """
+    version = model_registry.current(wait=MODEL_WAIT_TIMEOUT)
+    if version is None:
+        return jsonify({'error': 'Modèle non disponible'}), 503
+
+    try:
+        rows = _batch_rows_from_request()
+    except Exception as e:
+        return jsonify({'error': f'Requête invalide: {e}'}), 400
+
+    if not rows:
+        return jsonify({'results': []})
+    if len(rows) > BATCH_MAX_ROWS:
+        return jsonify({'error': f'Trop de lignes (maximum {BATCH_MAX_ROWS})'}), 413
+
+    try:
+        results = predict_batch(version, rows, explain=explain)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error during batch prediction: {e}")
+        return jsonify({'error': 'Erreur lors du diagnostic groupé'}), 500
+
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            for item in results:
+                yield json.dumps(item, ensure_ascii=False) + '\n'
+        return app.response_class(generate(), mimetype='application/x-ndjson')
+
+    return jsonify({'results': results})
+
+def _explanation_features(values, version=None):
+    """Parse a feature vector sent back by a client. Raises ValueError if it is not usable."""
+    features = [float(v) for v in values]
+    if not all(math.isfinite(v) for v in features):
+        raise ValueError('valeur non finie')
+    if version is not None and len(features) != len(version.runtime.feature_names):
+        raise ValueError('nombre de variables incorrect')
+    return features
+
+
+@app.route('/api/explanation')
+@login_required
+def api_explanation():
+    """Feature contributions of one diagnosis (`version` and comma-separated `features`).
+
+    200 with the explanation once computed, 202 while it is queued.
+    """
+    version_name = request.args.get('version', '')
+    try:
+        features = _explanation_features(request.args.get('features', '').split(','))
+    except ValueError:
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    explanation = explanations.lookup(version_name, features)
+    if explanation is not None:
+        return jsonify({'status': 'done', 'explication': explanation})
+
+    # Not cached by this worker (or evicted): queue it, if its model version is still serving
+    version = model_registry.current()
+    if version is None or version.version != version_name:
+        return jsonify({'error': 'Version du modèle non disponible'}), 404
+    try:
+        _explanation_features(features, version)
+    except ValueError:
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    if not explanations.submit(version, features):
+        return jsonify({'error': "Trop d'explications en attente, veuillez réessayer"}), 503
+    return jsonify({'status': 'pending'}), 202
+
+
+@app.route('/health')
+def health():
+    """Liveness: the process is up. Includes the active model version for monitoring."""
+    version = model_registry.current()
+    return jsonify({'status': 'ok', 'model_version': version.version if version else None})
+
+
+@app.route('/ready')
+def ready():
+    """Readiness: 200 once a warmed-up model is serving and the statistics are built, 503 before that."""
+    status = model_registry.status()
+    status['stats_ready'] = not diagnosis_stats.rebuilding
+    status['ready'] = status['ready'] and status['stats_ready']
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics of this worker process in the Prometheus text format."""
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                 f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'error': 'Accès non autorisé'}), 403
+    return app.response_class(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+def _optional_number(payload, key, cast):
+    value = payload.get(key)
+    return cast(value) if value not in (None, '') else None
+
+
+@app.route('/api/admin/profiler', methods=['GET', 'POST'])
+@login_required
+def api_admin_profiler():
+    """List the profiling sessions (GET) or arm a new one (POST).
+
+    POST fields (JSON or form): `route` (URL rule such as `/result`; empty for every
+    route), `requests` (how many requests to profile), `fraction` (0-1, share of the
+    matching requests to profile) and `mode` (`sample` or `cprofile`).
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Accès non autorisé'}), 403
+
+    routes = sorted({rule.rule for rule in app.url_map.iter_rules()
+                     if rule.endpoint not in PROFILER_ENDPOINTS and rule.endpoint != 'static'})
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or request.form
+        route = (payload.get('route') or '').strip() or None
+        if route is not None and route not in routes:
+            return jsonify({'error': f"Route inconnue : {route}"}), 400
+        try:
+            count = _optional_number(payload, 'requests', int)
+            fraction = _optional_number(payload, 'fraction', float)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Paramètres de profilage invalides'}), 400
+        try:
+            profile = request_profiler.arm(route, count, fraction, payload.get('mode') or 'sample')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        activity_feed.publish('⏱️', f"Profilage armé sur {profile.route or 'toutes les routes'} "
+                                   f"({profile.remaining} requêtes, {profile.mode})", 'profiler')
+        return jsonify(profile.to_dict()), 201
+
+    return jsonify({'armed': request_profiler.armed, 'sessions': request_profiler.sessions(), 'routes': routes})
+
+
+@app.route('/api/admin/profiler/<session_id>/stop', methods=['POST'])
+@login_required
+def api_admin_profiler_stop(session_id):
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Accès non autorisé'}), 403
+    if not request_profiler.stop(session_id):
+        return jsonify({'error': 'Session de profilage introuvable'}), 404
+    return jsonify(request_profiler.get(session_id).to_dict())
+
+
+@app.route('/api/admin/profiler/<session_id>/download')
+@login_required
+def api_admin_profiler_download(session_id):
+    """Results of a session: collapsed stacks (`sample`), or `.prof` stats / a text report (`cprofile`)."""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Accès non autorisé'}), 403
+    profile = request_profiler.get(session_id)
+    if profile is None:
+        return jsonify({'error': 'Session de profilage introuvable'}), 404
+
+    if profile.mode == 'sample':
+        body = request_profiler.collapsed(session_id)
+        response = make_response(body)
+        response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+        filename = f'profile_{session_id}.collapsed.txt'
+    elif request.args.get('format') == 'text':
+        response = make_response(request_profiler.pstats_report(session_id))
+        response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+        filename = f'profile_{session_id}.txt'
+    else:
+        body = request_profiler.pstats_dump(session_id)
+        if body is None:
+            return jsonify({'error': 'Aucune requête profilée pour le moment'}), 404
+        response = make_response(body)
+        response.headers['Content-Type'] = 'application/octet-stream'
+        filename = f'profile_{session_id}.prof'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+# The profiler's own API is never profiled
+PROFILER_ENDPOINTS = {'api_admin_profiler', 'api_admin_profiler_stop', 'api_admin_profiler_download'}
+
 @app.route('/admin/toggle-status', methods=['POST'])
 @login_required
 def toggle_doctor_status():
@@ -707,7 +1083,17 @@ def toggle_doctor_status():
     
     username = request.form.get('username')
     if username in doctors:
-        doctors[username]['is_active'] = not doctors[username].get('is_active', True)
+        is_active = not doctors[username].get('is_active', True)
+        doctors[username]['is_active'] = is_active
+
+        def set_status(raw):
+            if username in raw:
+                raw[username]['is_active'] = is_active
+
+        # Persist so the change survives restarts and reaches the other workers
+        persistence.update(data_medecins_path, set_status, default={})
+        activity_feed.publish('⚙️', f"Compte {'activé' if is_active else 'désactivé'}: {doctors[username]['nom']}",
+                              'doctor')
         flash(f'Statut du médecin {username} mis à jour', 'success')
     
     return redirect(url_for('admin_dashboard'))
@@ -724,72 +1110,43 @@ def add_doctor():
     password = request.form.get('password')
     email = request.form.get('email', '').strip()
 
-    # Generate signature and numero_ordre automatically
-    # Signature: standard block with doctor's name and specialty
-    generated_signature = f"Dr. {nom_complet}\n{specialite}\nCHU Mohammed VI Oujda"
-
-    # Generate a unique numeric 'numero_ordre'. Prefer incrementing existing numeric values.
-    generated_numero = ''
-    try:
-        existing_nums = [int(v.get('numero_ordre')) for v in raw.values() if v.get('numero_ordre') and str(v.get('numero_ordre')).isdigit()]
-        if existing_nums:
-            generated_numero = str(max(existing_nums) + 1)
-        else:
-            # start from 100000 + number of entries to reduce collision chance
-            generated_numero = str(100000 + len(raw) + 1)
-    except Exception:
-        generated_numero = str(100000 + len(raw) + 1)
-
     if not all([nom_complet, specialite, password]):
         flash('Les champs obligatoires (nom complet, spécialité, mot de passe) sont requis', 'error')
         return redirect(url_for('admin_dashboard'))
 
-    # Load persisted file to perform uniqueness checks
-    raw = {}
-    try:
-        if os.path.exists(data_medecins_path):
-            with open(data_medecins_path, 'r', encoding='utf-8') as f:
-                raw = json.load(f)
-    except Exception as e:
-        print(f"Warning: could not read {data_medecins_path} for uniqueness checks: {e}")
-
-    # Create a username key for internal storage: prefer 'dr.' + lowercase name with dots replacing spaces
-    base_key = 'dr.' + re.sub(r'[^A-Za-z0-9]+', '.', nom_complet.strip().lower()).strip('.')
-    username_key = base_key
-    suffix = 1
-    while username_key in doctors or username_key in raw:
-        suffix += 1
-        username_key = f"{base_key}{suffix}"
-
-    # Generate alphanumeric id (used for external id mapping). Start from username_key but remove non-alnum
-    generated_id = re.sub(r'[^A-Za-z0-9]', '', username_key).lower() or uuid.uuid4().hex[:8]
-    # Ensure id uniqueness in persisted records
-    id_suffix = 1
-    existing_ids = {v.get('id') for v in raw.values() if v.get('id')}
-    while generated_id in existing_ids:
-        id_suffix += 1
-        generated_id = f"{generated_id}{id_suffix}"
-
-    # Hash password and prepare in-memory entry
-    hashed = generate_password_hash(password)
-    doctors[username_key] = {
-        'password': hashed,
-        'nom': nom_complet,
-        'specialite': specialite,
-        'email': email,
-        'is_active': True,
-        'is_admin': False,
-        'id': generated_id,
-        'numero_ordre': generated_numero,
-        'signature': generated_signature
-    }
+    # Generate signature and numero_ordre automatically
+    # Signature: standard block with doctor's name and specialty
+    generated_signature = doctor_signature(nom_complet, specialite)
 
-    # Persist to data/medecins.json (preserve other entries)
+    # Hash outside the file lock: password hashing is deliberately slow
     try:
-        raw = {}
-        if os.path.exists(data_medecins_path):
-            with open(data_medecins_path, 'r', encoding='utf-8') as f:
-                raw = json.load(f)
+        hashed = password_pool.hash(password)
+    except PoolBusy:
+        flash('Serveur occupé, veuillez réessayer dans quelques secondes.', 'error')
+        return redirect(url_for('admin_dashboard'))
+
+    def insert_doctor(raw):
+        """Allocate key, id and numero_ordre and add the record, atomically w.r.t. other writers."""
+        # `raw` may have just been reloaded with another worker's changes: bring the indexes up to date
+        doctor_directory.refresh()
+        # Generate a unique numeric 'numero_ordre'. Prefer incrementing existing numeric values.
+        generated_numero = doctor_directory.next_numero_ordre()
+
+        # Create a username key for internal storage: prefer 'dr.' + lowercase name with dots replacing spaces
+        base_key = username_base(nom_complet)
+        username_key = base_key
+        suffix = 1
+        while username_key in doctor_directory or username_key in raw:
+            suffix += 1
+            username_key = f"{base_key}{suffix}"
+
+        # Generate alphanumeric id (used for external id mapping). Start from username_key but remove non-alnum
+        generated_id = doctor_id(username_key).lower() or uuid.uuid4().hex[:8]
+        # Ensure id uniqueness in persisted records
+        id_suffix = 1
+        while doctor_directory.id_taken(generated_id):
+            id_suffix += 1
+            generated_id = f"{generated_id}{id_suffix}"
 
         raw[username_key] = {
             'id': generated_id,
@@ -801,27 +1158,60 @@ def add_doctor():
             'signature': generated_signature,
             'role': 'medecin'
         }
+        return username_key, generated_id, generated_numero
 
-        # Backup existing file before overwriting
-        try:
-            if os.path.exists(data_medecins_path):
-                backup_path = data_medecins_path + ".bak"
-                with open(data_medecins_path, 'r', encoding='utf-8') as fsrc, open(backup_path, 'w', encoding='utf-8') as fdst:
-                    fdst.write(fsrc.read())
-        except Exception:
-            pass
+    # Persist to data/medecins.json (preserve other entries); the writer thread commits it
+    try:
+        username_key, generated_id, generated_numero = persistence.update(data_medecins_path, insert_doctor, default={})
+    except Exception as e:
+        print(f"Error persisting new doctor: {e}")
+        flash("Erreur lors de l'ajout du médecin", 'error')
+        return redirect(url_for('admin_dashboard'))
 
-        with open(data_medecins_path, 'w', encoding='utf-8') as f:
-            json.dump(raw, f, ensure_ascii=False, indent=4)
+    # Index the new account now so forgot-password and other flows can use its id immediately
+    doctor_directory.refresh()
+
+    activity_feed.publish('👨‍⚕️', f"Nouveau médecin: Dr. {nom_complet}", 'doctor')
+    flash(f'Médecin ajouté avec succès (identifiant généré: {generated_id})', 'success')
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/import-doctors', methods=['POST'])
+@login_required
+def import_doctors_csv():
+    if not session.get('is_admin'):
+        flash('Accès non autorisé', 'error')
+        return redirect(url_for('index'))
 
-        # Update ids_map so forget-password and other flows can use the new id immediately
-        ids_map[generated_id] = username_key
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Veuillez choisir un fichier CSV', 'error')
+        return redirect(url_for('admin_dashboard'))
+    data = upload.read()
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # Spreadsheet exports on Windows
+        text = data.decode('cp1252', errors='replace')
 
-        flash(f'Médecin ajouté avec succès (identifiant généré: {generated_id})', 'success')
+    try:
+        rows = parse_doctors_csv(text)
+        # Passwords are hashed on short-lived low-priority processes, then every account
+        # is added in one write of medecins.json
+        created = import_doctors(persistence, data_medecins_path, rows,
+                                 lambda passwords: hash_passwords(passwords, workers=DOCTOR_IMPORT_WORKERS))
+    except DoctorImportError as e:
+        shown = e.errors[:10]
+        more = f" (et {len(e.errors) - len(shown)} autres)" if len(e.errors) > len(shown) else ''
+        flash("Import annulé, aucun médecin ajouté : " + ' | '.join(shown) + more, 'error')
+        return redirect(url_for('admin_dashboard'))
     except Exception as e:
-        print(f"Error persisting new doctor: {e}")
-        flash('Médecin ajouté en mémoire mais la sauvegarde a échoué', 'warning')
+        print(f"Error importing doctors: {e}")
+        flash("Erreur lors de l'import des médecins", 'error')
+        return redirect(url_for('admin_dashboard'))
 
+    doctor_directory.refresh()
+    activity_feed.publish('📥', f"{len(created)} médecins importés", 'doctor')
+    flash(f'{len(created)} médecins importés avec succès', 'success')
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/reset-password', methods=['POST'])
@@ -834,7 +1224,19 @@ def reset_password():
     username = request.form.get('username')
     if username in doctors:
         new_password = 'password123'  # Default reset password
-        doctors[username]['password'] = generate_password_hash(new_password)
+        try:
+            hashed = password_pool.hash(new_password)
+        except PoolBusy:
+            flash('Serveur occupé, veuillez réessayer dans quelques secondes.', 'error')
+            return redirect(url_for('admin_dashboard'))
+        doctors[username]['password'] = hashed
+
+        def set_password(raw):
+            if username in raw:
+                raw[username]['password'] = hashed
+
+        persistence.update(data_medecins_path, set_password, default={})
+        activity_feed.publish('🔑', f"Mot de passe réinitialisé: {doctors[username]['nom']}", 'doctor')
         flash(f'Mot de passe réinitialisé pour {username}', 'success')
     
     return redirect(url_for('admin_dashboard'))
@@ -844,34 +1246,193 @@ def reset_password():
 def download_pdf():
     try:
         result_data = json.loads(request.form.get('result_data'))
+        job = submit_report_job(result_data)
+        # Rendering happens on the PDF workers; this thread only waits (cache hits return at once)
+        job.done.wait(PDF_WAIT_TIMEOUT)
+        pdf = pdf_jobs.result(job)
+        if pdf is None:
+            raise RuntimeError(job.error or 'délai de génération dépassé')
+        return pdf_response(pdf, job.filename)
         
-        html = render_template('pdf_template.html', 
-                             result=result_data,
-                             date=datetime.now().strftime('%d/%m/%Y %H:%M'))
-        
-        # Generate PDF
-        pdf = pdfkit.from_string(html, False, configuration=pdfkit_config, options={
-            'encoding': 'UTF-8',
-            'page-size': 'A4',
-            'margin-top': '1cm',
-            'margin-right': '1cm',
-            'margin-bottom': '1cm',
-            'margin-left': '1cm'
-        })
-        
-        # Create response
-        response = make_response(pdf)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=diagnostic_{result_data["patient"]["nom"]}_{datetime.now().strftime("%Y%m%d")}.pdf'
-        
-        return response
-        
+    except QueueFull:
+        flash("Trop de rapports PDF en cours de génération, veuillez réessayer dans un instant", 'error')
+        return redirect(url_for('index'))
     except Exception as e:
         print(f"Error generating PDF: {str(e)}")
         flash("Erreur lors de la génération du PDF", 'error')
         return redirect(url_for('index'))
 
 
+def report_filename(result_data):
+    nom = re.sub(r'[^\w-]', '_', str(result_data.get('patient', {}).get('nom', 'patient')))
+    return f'diagnostic_{nom}_{datetime.now().strftime("%Y%m%d")}.pdf'
+
+
+def attach_explanation(result_data):
+    """Set `result_data['explication']` from its `explication_ref`, waiting briefly if it is still computing."""
+    # Only the server's own explanation goes into the report
+    result_data.pop('explication', None)
+    ref = result_data.get('explication_ref')
+    if not isinstance(ref, dict):
+        return
+    version_name = str(ref.get('version', ''))
+    try:
+        features = _explanation_features(ref.get('features') or [])
+    except (TypeError, ValueError):
+        return
+    explanation = explanations.lookup(version_name, features)
+    if explanation is None:
+        version = model_registry.current()
+        if version is None or version.version != version_name:
+            return
+        try:
+            _explanation_features(features, version)
+        except ValueError:
+            return
+        explanations.submit(version, features)
+        explanation = explanations.wait(version_name, features, EXPLANATION_WAIT_TIMEOUT)
+    if explanation is not None:
+        result_data['explication'] = explanation
+
+
+def submit_report_job(result_data):
+    attach_explanation(result_data)
+    return pdf_jobs.submit(report_renderer.document(result_data), owner=session.get('username'),
+                           filename=report_filename(result_data))
+
+
+def pdf_response(pdf, filename):
+    response = make_response(pdf)
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+def _owned_pdf_job(job_id):
+    job = pdf_jobs.get(job_id)
+    if job is None or (job.owner != session.get('username') and not session.get('is_admin')):
+        return None
+    return job
+
+
+@app.route('/api/pdf-jobs', methods=['POST'])
+@login_required
+def create_pdf_job():
+    payload = request.get_json(silent=True)
+    if payload is None and request.form.get('result_data'):
+        try:
+            payload = json.loads(request.form['result_data'])
+        except ValueError:
+            payload = None
+    if not isinstance(payload, dict) or not isinstance(payload.get('patient'), dict):
+        return jsonify({'error': 'Données du rapport manquantes'}), 400
+    try:
+        job = submit_report_job(payload)
+    except QueueFull:
+        return jsonify({'error': 'Trop de rapports PDF en attente'}), 503
+    body = job.to_dict()
+    body['status_url'] = url_for('pdf_job_status', job_id=job.id)
+    body['download_url'] = url_for('pdf_job_download', job_id=job.id)
+    return jsonify(body), 202
+
+
+@app.route('/api/pdf-jobs/<job_id>')
+@login_required
+def pdf_job_status(job_id):
+    job = _owned_pdf_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Tâche introuvable'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/pdf-jobs/<job_id>/download')
+@login_required
+def pdf_job_download(job_id):
+    job = _owned_pdf_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Tâche introuvable'}), 404
+    if not job.done.is_set():
+        return jsonify(job.to_dict()), 409
+    pdf = pdf_jobs.result(job)
+    if pdf is None:
+        return jsonify({'error': job.error or 'PDF indisponible'}), 410
+    return pdf_response(pdf, job.filename or f'diagnostic_{job.id}.pdf')
+
+
+# Bulk exports render across processes; the pool is started by the first export
+REPORT_EXPORT_PROCESSES = int(os.environ.get('REPORT_EXPORT_PROCESSES', str(os.cpu_count() or 2)))
+_report_processes = None
+_report_processes_lock = threading.Lock()
+
+
+def get_report_processes():
+    global _report_processes
+    with _report_processes_lock:
+        if _report_processes is None:
+            # Not forked from this threaded worker, like the password pool (see password_pool.py)
+            _report_processes = ProcessPoolExecutor(max_workers=REPORT_EXPORT_PROCESSES,
+                                                    mp_context=multiprocessing.get_context(POOL_START_METHOD))
+        return _report_processes
+
+
+def report_from_history(entry):
+    """Rebuild a report's `result_data` from a stored history entry.
+
+    History keeps the patient, diagnosis and doctor but not the symptoms or the
+    model confidence, so those are marked as not recorded.
+    """
+    not_recorded = 'Non enregistré'
+    medecin = doctor_directory.by_name(entry.get('doctor')) or {}
+    return {
+        'patient': {
+            'nom': entry.get('nom', ''),
+            'prenom': entry.get('prenom', ''),
+            'cne': entry.get('cin', ''),
+            'age': entry.get('age', ''),
+            'genre': entry.get('sex', '')
+        },
+        'symptoms': {key: not_recorded for key in ('fievre', 'toux', 'fatigue', 'respiration')},
+        'diagnostic': {
+            'maladie': entry.get('disease', ''),
+            'confiance': not_recorded,
+            'service': entry.get('service', ''),
+            'examens': get_recommended_exams(entry.get('disease', ''))
+        },
+        'date': entry.get('date', ''),
+        'medecin': {
+            'nom': entry.get('doctor', ''),
+            'specialite': medecin.get('specialite', '')
+        }
+    }
+
+
+@app.route('/api/admin/reports/export')
+@login_required
+def export_reports_zip():
+    """ZIP of the PDF reports of every stored diagnosis matching the patient filters.
+
+    Query parameters are those of /api/admin/patients (doctor, service, disease, cin,
+    date_from, date_to). The archive is streamed while the reports render.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Accès non autorisé'}), 403
+    try:
+        filters = patient_filters_from_request()
+    except ValueError as e:
+        return jsonify({'error': f'Paramètre invalide: {e}'}), 400
+
+    def reports():
+        for i, entry in enumerate(history_store.iter_entries(filters=filters), start=1):
+            name = re.sub(r'[^\w-]', '_', f"{entry.get('nom', '')}_{entry.get('prenom', '')}_{entry.get('cin', '')}")
+            yield f'{i:05d}_{name}.pdf', report_renderer.document(report_from_history(entry))
+
+    archive = stream_report_zip(reports(), report_renderer, get_report_processes(), cache=pdf_cache,
+                                window=2 * REPORT_EXPORT_PROCESSES)
+    response = app.response_class(stream_with_context(archive), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename=rapports_{datetime.now().strftime("%Y%m%d_%H%M")}.zip'
+    return response
+
+
 @app.route('/forgot-password', methods=['GET', 'POST'])
 def forgot_password():
     if request.method == 'POST':
@@ -889,32 +1450,9 @@ def forgot_password():
             return render_template('forgot_password.html', current_year=datetime.now().year)
 
         # Verify username exists and email matches. Support alphanumeric `id` mapping.
-        found_user = None
-        # Direct key (unlikely because keys may contain dots)
-        if username_input in doctors:
-            if doctors[username_input].get('email', '').strip().lower() == email:
-                found_user = username_input
-        else:
-            # Check ids_map (id -> real username key)
-            mapped = ids_map.get(username_input)
-            if mapped and doctors.get(mapped, {}).get('email', '').strip().lower() == email:
-                found_user = mapped
-            else:
-                # fallback: check raw medecins.json for either key or id
-                try:
-                    with open(data_medecins_path, 'r', encoding='utf-8') as f:
-                        raw = json.load(f)
-                    # check if input matches a key and email
-                    if username_input in raw and raw[username_input].get('email', '').strip().lower() == email:
-                        found_user = username_input
-                    else:
-                        # check if matches an 'id' value in raw
-                        for k, v in raw.items():
-                            if v.get('id') == username_input and v.get('email', '').strip().lower() == email:
-                                found_user = k
-                                break
-                except Exception:
-                    pass
+        found_user = doctor_directory.resolve(username_input)
+        if found_user and normalize_email(doctors[found_user].get('email')) != email:
+            found_user = None
 
         if not found_user:
             flash('Identifiant et email ne correspondent pas à un compte valide.', 'error')
@@ -922,9 +1460,7 @@ def forgot_password():
 
         # Create token and continue as before
         token = uuid.uuid4().hex
-        expires = datetime.now() + timedelta(minutes=15)
-        password_reset_tokens[token] = {'username': found_user, 'expires': expires}
-        save_password_tokens()
+        password_tokens.issue(token, found_user, datetime.now() + PASSWORD_RESET_TTL)
         # Debug-mode immediate redirect for development convenience
         if app.debug:
             return redirect(url_for('reset_password_token', token=token))
@@ -932,50 +1468,17 @@ def forgot_password():
         flash('Un lien de réinitialisation a été envoyé (en dev il est affiché ci-dessous).', 'success')
         return render_template('forgot_password.html', reset_link=reset_link, current_year=datetime.now().year)
 
-        if not found_user:
-            # Try raw data file as fallback
-            try:
-                with open(data_medecins_path, 'r', encoding='utf-8') as f:
-                    raw = json.load(f)
-                for username, info in raw.items():
-                    if info.get('email', '').strip().lower() == email:
-                        found_user = username
-                        break
-            except Exception:
-                pass
-
-        if not found_user:
-            flash('Aucun compte trouvé pour cette adresse email.', 'error')
-            return render_template('forgot_password.html', current_year=datetime.now().year)
-
-        # Generate token and store with expiry (15 minutes)
-        token = uuid.uuid4().hex
-        expires = datetime.now() + timedelta(minutes=15)
-        password_reset_tokens[token] = {'username': found_user, 'expires': expires}
-        # save to disk so token survives restarts
-        save_password_tokens()
-
-        # Create reset link (for dev we render the link so developer can click it)
-        reset_link = url_for('reset_password_token', token=token, _external=True)
-        flash('Un lien de réinitialisation a été généré (en environnement de développement il est affiché ci-dessous).', 'success')
-        return render_template('forgot_password.html', reset_link=reset_link, current_year=datetime.now().year)
-
     return render_template('forgot_password.html', current_year=datetime.now().year)
 
 
 @app.route('/reset-password/<token>', methods=['GET', 'POST'])
 def reset_password_token(token):
-    info = password_reset_tokens.get(token)
+    # Unknown, used and expired tokens all come back as None (expired ones are purged lazily)
+    info = password_tokens.get(token)
     if not info:
         flash('Lien invalide ou expiré.', 'error')
         return redirect(url_for('forgot_password'))
 
-    if not info.get('expires') or datetime.now() > info['expires']:
-        password_reset_tokens.pop(token, None)
-        save_password_tokens()
-        flash('Le lien de réinitialisation a expiré.', 'error')
-        return redirect(url_for('forgot_password'))
-
     username = info['username']
     if request.method == 'POST':
         pwd = request.form.get('password')
@@ -984,28 +1487,66 @@ def reset_password_token(token):
             flash('Les mots de passe ne correspondent pas.', 'error')
             return render_template('reset_password.html')
 
+        try:
+            hashed = password_pool.hash(pwd)
+        except PoolBusy:
+            flash('Serveur occupé, veuillez réessayer dans quelques secondes.', 'error')
+            return render_template('reset_password.html'), 503
+
+        # Consume the token before saving so it cannot be used twice, even from another worker
+        if not password_tokens.consume(token):
+            flash('Lien invalide ou expiré.', 'error')
+            return redirect(url_for('forgot_password'))
         # Update in-memory
         if username in doctors:
-            doctors[username]['password'] = generate_password_hash(pwd)
-        # Persist to data file if present
+            doctors[username]['password'] = hashed
+
+        def set_password(raw):
+            if username in raw:
+                raw[username]['password'] = hashed
+
+        # Persist to data file
         try:
-            if os.path.exists(data_medecins_path):
-                with open(data_medecins_path, 'r', encoding='utf-8') as f:
-                    raw = json.load(f)
-                if username in raw:
-                    raw[username]['password'] = doctors.get(username, {}).get('password', generate_password_hash(pwd))
-                    with open(data_medecins_path, 'w', encoding='utf-8') as f:
-                        json.dump(raw, f, ensure_ascii=False, indent=4)
+            persistence.update(data_medecins_path, set_password, default={})
         except Exception as e:
             print(f"Warning: could not persist password to {data_medecins_path}: {e}")
 
-        # Consume token
-        password_reset_tokens.pop(token, None)
-        save_password_tokens()
         flash('Mot de passe réinitialisé avec succès. Vous pouvez maintenant vous connecter.', 'success')
         return redirect(url_for('login'))
 
     return render_template('reset_password.html')
 
+def create_app(preload=None):
+    """Return the app with its background services started.
+
+    Importing this module only reads small JSON files; the model loads and warms up
+    on a background thread started here (see /ready), and the PDF engine, pandas and
+    the report process pool load on first use. Serve with e.g.
+    `gunicorn 'app:create_app()'`.
+
+    With `preload` (default: PRELOAD_MODEL=1) the model is unpickled synchronously and
+    no thread is started, for servers that import the app once and then fork their
+    workers (see gunicorn.conf.py): no prediction runs before the fork, the workers
+    share the loaded model copy-on-write and call `start_worker()` after the fork,
+    which warms it up.
+    """
+    if preload is None:
+        preload = os.environ.get('PRELOAD_MODEL', '0') == '1'
+    if preload:
+        model_registry.load(warm_up=False)
+    else:
+        start_worker()
+    return app
+
+
+def start_worker():
+    """Start per-process background services in a freshly forked worker."""
+    # A version preloaded by the master runs its first predictions here, in the worker
+    model_registry.warm_up_current()
+    model_registry.start()
+    # A missing data/stats.json is rebuilt from the history once, by one worker (see analytics.py)
+    diagnosis_stats.ensure_built(history_store)
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
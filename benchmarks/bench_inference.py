@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: per-prediction latency of the old DataFrame path vs InferenceRuntime.
+
+Usage (from project root):
+  python benchmarks/bench_inference.py [--model models/CatBoost_best_model.pkl] [-n 2000]
+
+"before" reproduces what `/result` used to do: build a one-row DataFrame, reorder it
+with `model.feature_names_`, then call `predict` and `predict_proba`. "after" is
+`InferenceRuntime.predict_form` on the same form, with and without the
+precomputed prediction table (PREDICTION_TABLE=1). If the model file is missing a
+small stand-in CatBoost model is trained on random data so the script always runs.
+"""
+import argparse
+import os
+import pickle
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import train_standin_model  # noqa: E402
+from inference import InferenceRuntime  # noqa: E402
+
+
+FORM = {
+    'fever': '1', 'cough': '0', 'fatigue': '1', 'difficulty_breathing': '0',
+    'age': '42', 'gender': '1', 'blood_pressure': '2', 'cholesterol_level': '1'
+}
+
+
+def load_model(path):
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    print(f"{path} not found; training a stand-in model on random data")
+    return train_standin_model(12, iterations=100)
+
+
+def predict_dataframe(model, form):
+    features = pd.DataFrame({
+        'Fever': [float(form.get('fever', 0))],
+        'Cough': [float(form.get('cough', 0))],
+        'Fatigue': [float(form.get('fatigue', 0))],
+        'Difficulty Breathing': [float(form.get('difficulty_breathing', 0))],
+        'Age': [float(form.get('age', 0))],
+        'Gender': [float(form.get('gender', 0))],
+        'Blood Pressure': [float(form.get('blood_pressure', 0))],
+        'Cholesterol Level': [float(form.get('cholesterol_level', 0))],
+        'Outcome Variable': [0.0]
+    })
+    features = features[model.feature_names_]
+    raw_prediction = model.predict(features)
+    probabilities = model.predict_proba(features)
+    return str(int(raw_prediction.item())), float(np.max(probabilities[0])) * 100
+
+
+def measure(fn, n):
+    for _ in range(min(50, n)):
+        fn()
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        'mean_us': statistics.fmean(samples),
+        'p50_us': samples[len(samples) // 2],
+        'p95_us': samples[int(len(samples) * 0.95) - 1]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=os.path.join(ROOT, 'models', 'CatBoost_best_model.pkl'))
+    parser.add_argument('-n', type=int, default=2000, help='predictions per variant')
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    runtime = InferenceRuntime(model)
+    start = time.perf_counter()
+    table_runtime = InferenceRuntime(model, precompute=True)
+    print(f"Prediction table: {len(table_runtime.table)} entries built in {time.perf_counter() - start:.2f} s")
+
+    before = predict_dataframe(model, FORM)
+    for after in (runtime.predict_form(FORM), table_runtime.predict_form(FORM)):
+        if before[0] != after[0] or abs(before[1] - after[1]) > 1e-3:
+            print(f"Mismatch between paths: before={before} after={after}")
+            sys.exit(1)
+
+    results = {
+        'before (DataFrame + predict + predict_proba)': measure(lambda: predict_dataframe(model, FORM), args.n),
+        'after (InferenceRuntime.predict_form)': measure(lambda: runtime.predict_form(FORM), args.n),
+        'after (precomputed table lookup)': measure(lambda: table_runtime.predict_form(FORM), args.n)
+    }
+    for label, stats in results.items():
+        print(f"{label:48s} mean {stats['mean_us']:9.1f} us  p50 {stats['p50_us']:9.1f} us  p95 {stats['p95_us']:9.1f} us")
+    baseline = results['before (DataFrame + predict + predict_proba)']['mean_us']
+    print(f"Speedup (runtime): {baseline / results['after (InferenceRuntime.predict_form)']['mean_us']:.1f}x")
+    print(f"Speedup (table):   {baseline / results['after (precomputed table lookup)']['mean_us']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Load benchmark: throughput and latency percentiles of the main routes on a large data set.
+
+Usage (from project root):
+  python benchmarks/bench_load.py [--doctors 10000] [--diagnoses 1000000] [--diseases 1000]
+                                  [--fixture DIR] [--driver client|http|both] [--url URL]
+                                  [--threads 4] [--duration 10] [--warmup 2]
+                                  [--scenarios login,result,...] [--output results.json]
+                                  [--baseline previous.json]
+
+1. Builds (or reuses) a synthetic fixture with benchmarks/fixtures.py: accounts,
+   patient history, services, disease mapping and a stand-in CatBoost model, so
+   no real model file or data is needed.
+2. Copies it to a scratch directory, so every run starts from the same data
+   whatever the scenarios write, and imports the app there with the model
+   preloaded (PDF_BACKEND defaults to builtin).
+3. Runs each scenario for --duration seconds (after --warmup seconds that are
+   not recorded) from --threads threads, each with its own logged-in session:
+   - `client`: the Flask test client, in process (no network, no WSGI server);
+   - `http`: real HTTP requests through urllib to a threaded Werkzeug server
+     started on a free port, or to --url (a server already running on the
+     fixture, e.g. gunicorn; the fixture's accounts are used to log in).
+
+Scenarios: login, result, download_pdf, admin, admin_patients, admin_stats,
+admin_services, admin_activity, predict_batch, explain_batch (see SCENARIOS). A request counts
+as an error if its status is not the one the scenario expects.
+
+The report is printed and, with --output, written as JSON: one record per
+(scenario, driver) with requests, errors, throughput (successful requests per
+second) and mean/p50/p95/p99/max latency in milliseconds, plus the fixture and
+machine details. --baseline compares the run with an earlier JSON report.
+"""
+import argparse
+import contextlib
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import BENCH_ADMINS, PASSWORD, build_fixture, doctor_username  # noqa: E402
+
+FORM_FIELDS = ('fever', 'cough', 'fatigue', 'difficulty_breathing', 'gender', 'cholesterol_level')
+
+
+def random_form(rng):
+    form = {field: str(rng.randint(0, 1)) for field in FORM_FIELDS}
+    form.update(age=str(rng.randint(1, 95)), blood_pressure=str(rng.randint(0, 2)),
+                LastName=rng.choice(('Benali', 'Tazi', 'Alaoui')), FirstName=rng.choice(('Salma', 'Omar')),
+                CNE=f'LD{rng.randrange(10 ** 6):06d}')
+    return form
+
+
+def random_report(rng):
+    return {
+        'patient': {'nom': 'Benali', 'prenom': 'Salma', 'cne': f'LD{rng.randrange(10 ** 9):09d}',
+                    'age': str(rng.randint(1, 95)), 'genre': 'Femme'},
+        'symptoms': {'fievre': 'Oui', 'toux': 'Non', 'fatigue': 'Oui', 'respiration': 'Non'},
+        'diagnostic': {'maladie': 'Maladie synthétique 0001', 'confiance': '42.0%',
+                       'service': 'Service Synthétique 001', 'examens': ['Examen clinique', 'Test PCR']},
+        'date': '01/01/2026 10:00',
+        'medecin': {'nom': 'Dr. Bench', 'specialite': 'Médecine Générale'}
+    }
+
+
+# -- scenarios -------------------------------------------------------------
+# Each scenario is (role, expected status, request). `request(session, rng, ctx)`
+# performs one request and returns its status. Roles: 'doctor' and 'admin' sessions
+# are logged in before timing; 'anonymous' sessions are not.
+
+def _login(session, rng, ctx):
+    username = doctor_username(rng.randrange(ctx['doctors']))
+    return session.post('/login', data={'username': username, 'password': PASSWORD})
+
+
+def _result(session, rng, ctx):
+    return session.post('/result', data=random_form(rng))
+
+
+def _download_pdf(session, rng, ctx):
+    # A new patient each time: measures rendering, not the PDF cache
+    return session.post('/download-pdf', data={'result_data': json.dumps(random_report(rng), ensure_ascii=False)})
+
+
+def _admin(session, rng, ctx):
+    return session.get('/admin')
+
+
+def _admin_patients(session, rng, ctx):
+    query = {'limit': 50}
+    if rng.random() < 0.5:
+        query['doctor'] = rng.choice(ctx['doctor_names'])
+    return session.get('/api/admin/patients?' + urllib.parse.urlencode(query))
+
+
+def _admin_stats(session, rng, ctx):
+    return session.get('/api/admin/stats?days=30')
+
+
+def _admin_services(session, rng, ctx):
+    return session.get('/api/admin/services')
+
+
+def _admin_activity(session, rng, ctx):
+    return session.get('/api/admin/recent-activity')
+
+
+def _predict_batch(session, rng, ctx):
+    rows = [random_form(rng) for _ in range(100)]
+    return session.post('/api/predict/batch', json=rows)
+
+
+def _explain_batch(session, rng, ctx):
+    rows = [random_form(rng) for _ in range(100)]
+    return session.post('/api/explain/batch', json=rows)
+
+
+SCENARIOS = {
+    'login': ('anonymous', 302, _login),
+    'result': ('doctor', 200, _result),
+    'download_pdf': ('doctor', 200, _download_pdf),
+    'admin': ('admin', 200, _admin),
+    'admin_patients': ('admin', 200, _admin_patients),
+    'admin_stats': ('admin', 200, _admin_stats),
+    'admin_services': ('admin', 200, _admin_services),
+    'admin_activity': ('admin', 200, _admin_activity),
+    'predict_batch': ('doctor', 200, _predict_batch),
+    'explain_batch': ('doctor', 200, _explain_batch),
+}
+
+
+# -- drivers ---------------------------------------------------------------
+
+class ClientSession:
+    """Flask test client; logged-in sessions are set directly, as login() would."""
+
+    def __init__(self, app, doctors, username=None):
+        self.client = app.test_client()
+        if username is not None:
+            doctor = doctors[username]
+            with self.client.session_transaction() as s:
+                s['username'] = username
+                s['nom_medecin'] = doctor['nom']
+                s['specialite'] = doctor['specialite']
+                s['is_admin'] = doctor.get('is_admin', False)
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data=None, json=None):
+        return self.client.post(path, data=data, json=json).status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """urllib with its own cookie jar; redirects are returned, not followed."""
+
+    def __init__(self, base_url, username=None):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+        if username is not None:
+            status = self.post('/login', data={'username': username, 'password': PASSWORD})
+            if status != 302:
+                raise RuntimeError(f"login of {username} failed with status {status}")
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data=None, json=None):
+        if json is not None:
+            body = _json_bytes(json)
+            headers = {'Content-Type': 'application/json'}
+        else:
+            body = urllib.parse.urlencode(data or {}).encode('utf-8')
+            headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        return self._open(urllib.request.Request(self.base_url + path, data=body, headers=headers))
+
+
+def _json_bytes(value):
+    return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+def start_server(app):
+    """Serve `app` on a free local port from a background thread. Returns (base_url, server)."""
+    import logging
+    from werkzeug.serving import make_server
+
+    # One access log line per request would cost more than some of the routes
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-http', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+# -- measurement -----------------------------------------------------------
+
+def percentile(samples, q):
+    """Nearest-rank percentile of sorted `samples`."""
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, max(0, int(round(q / 100 * len(samples))) - 1))]
+
+
+def run_scenario(name, make_session, threads, duration, warmup, ctx, seed):
+    role, expected, request = SCENARIOS[name]
+    sessions = []
+    for i in range(threads):
+        if role == 'admin':
+            username = doctor_username(i % BENCH_ADMINS)
+        elif role == 'doctor':
+            username = doctor_username(BENCH_ADMINS + i % max(1, ctx['doctors'] - BENCH_ADMINS))
+        else:
+            username = None
+        sessions.append(make_session(username))
+
+    results = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index, session):
+        rng = random.Random(seed * 7919 + index)
+        latencies, statuses = [], {}
+        barrier.wait()
+        measure_from = time.perf_counter() + warmup
+        stop_at = measure_from + duration
+        while True:
+            start = time.perf_counter()
+            if start >= stop_at:
+                break
+            status = request(session, rng, ctx)
+            end = time.perf_counter()
+            if start >= measure_from:
+                latencies.append((end - start) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+        with lock:
+            results.append((latencies, statuses))
+
+    workers = [threading.Thread(target=worker, args=(i, s)) for i, s in enumerate(sessions)]
+    for t in workers:
+        t.start()
+    barrier.wait()
+    for t in workers:
+        t.join()
+
+    latencies = sorted(x for lat, _ in results for x in lat)
+    statuses = {}
+    for _, counts in results:
+        for status, count in counts.items():
+            statuses[status] = statuses.get(status, 0) + count
+    ok = statuses.get(expected, 0)
+    return {
+        'scenario': name,
+        'threads': threads,
+        'duration_s': duration,
+        'requests': len(latencies),
+        'errors': len(latencies) - ok,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'throughput_rps': round(ok / duration, 2),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'p50': _round(percentile(latencies, 50)),
+            'p95': _round(percentile(latencies, 95)),
+            'p99': _round(percentile(latencies, 99)),
+            'max': _round(latencies[-1] if latencies else None)
+        }
+    }
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def print_report(records, baseline=None):
+    previous = {(r['scenario'], r['driver']): r for r in (baseline or {}).get('results', [])}
+    print(f"{'scenario':16s} {'driver':7s} {'req/s':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} "
+          f"{'errors':>7s}" + ('   vs baseline (req/s, p95)' if previous else ''))
+    for r in records:
+        lat = r['latency_ms']
+        line = (f"{r['scenario']:16s} {r['driver']:7s} {r['throughput_rps']:9.1f} {_fmt(lat['p50'])} "
+                f"{_fmt(lat['p95'])} {_fmt(lat['p99'])} {r['errors']:7d}")
+        before = previous.get((r['scenario'], r['driver']))
+        if before:
+            line += f"   {_delta(before['throughput_rps'], r['throughput_rps'])} " \
+                    f"{_delta(before['latency_ms']['p95'], lat['p95'])}"
+        print(line)
+
+
+def _fmt(value):
+    return f"{value:9.2f}" if value is not None else f"{'-':>9s}"
+
+
+def _delta(before, after):
+    if not before or after is None:
+        return f"{'-':>8s}"
+    return f"{(after - before) / before * 100:+7.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--doctors', type=int, default=10000)
+    parser.add_argument('--diagnoses', type=int, default=1000000)
+    parser.add_argument('--diseases', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fixture', help='fixture directory (default: one per size under the temp directory)')
+    parser.add_argument('--driver', choices=('client', 'http', 'both'), default='both')
+    parser.add_argument('--url', help='benchmark this running server instead of starting one (http driver)')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--baseline', help='earlier JSON report to compare with')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch copy of the fixture')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (available: {', '.join(SCENARIOS)})")
+    if args.driver == 'client' and args.url:
+        parser.error('--url needs the http driver')
+
+    fixture = args.fixture or os.path.join(
+        tempfile.gettempdir(), f'medical_bench_{args.doctors}_{args.diagnoses}_{args.diseases}_{args.seed}')
+    manifest = build_fixture(fixture, args.doctors, args.diagnoses, args.diseases, args.seed)
+
+    # A scratch copy: scenarios add diagnoses, activity and PDF files
+    workdir = tempfile.mkdtemp(prefix='medical_bench_run_')
+    for sub in ('data', 'models'):
+        shutil.copytree(os.path.join(fixture, sub), os.path.join(workdir, sub))
+    os.chdir(workdir)
+    os.environ.setdefault('PDF_BACKEND', 'builtin')
+
+    start = time.perf_counter()
+    import app as appmod
+    # What a gunicorn worker does: preload in the master, warm up after the fork
+    application = appmod.create_app(preload=True)
+    appmod.start_worker()
+    startup_s = time.perf_counter() - start
+    if not appmod.model_registry.is_ready():
+        sys.exit('The stand-in model did not load')
+
+    doctors = appmod.doctors
+    ctx = {'doctors': manifest['doctors'],
+           'doctor_names': [doctors[doctor_username(i)]['nom'] for i in range(min(200, manifest['doctors']))]}
+    drivers = ['client', 'http'] if args.driver == 'both' else [args.driver]
+    server = None
+    records = []
+    # The app prints per-request debug lines; keep them out of the report
+    devnull = open(os.devnull, 'w')
+    quiet = contextlib.redirect_stdout(devnull)
+    try:
+        for driver in drivers:
+            if driver == 'client':
+                def make_session(username):
+                    return ClientSession(application, doctors, username)
+            else:
+                base_url = args.url
+                if base_url is None:
+                    base_url, server = start_server(application)
+
+                def make_session(username, base_url=base_url):
+                    return HttpSession(base_url, username)
+            for name in scenarios:
+                print(f"{name} ({driver}, {args.threads} threads, {args.duration:g} s)...", file=sys.stderr)
+                with quiet:
+                    record = run_scenario(name, make_session, args.threads, args.duration, args.warmup,
+                                          ctx, args.seed)
+                record['driver'] = driver
+                records.append(record)
+    finally:
+        if server is not None:
+            server.shutdown()
+        appmod.persistence.stop()
+        devnull.close()
+        if not args.keep:
+            os.chdir(ROOT)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'fixture': {k: manifest[k] for k in ('doctors', 'diagnoses', 'diseases', 'seed')},
+            'threads': args.threads,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'startup_s': round(startup_s, 3),
+            'url': args.url,
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'results': records
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(records, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark: login throughput and its effect on diagnoses.
+
+Usage (from project root):
+  python benchmarks/bench_login.py [--seconds 5] [--workers 1,2,4] [--app]
+
+1. Password verification throughput of `password_pool.PasswordPool`, for each
+   pool size in --workers, with enough concurrent callers to keep it saturated.
+   Reports logins/s and logins/s per core (per pool process), plus the
+   rejections of callers turned away by the queue-depth limit. "inline" is
+   `check_password_hash` on the calling thread, for reference.
+2. With --app, the latency of POST /api/predict/batch (one row) through the
+   Flask test client, alone and then during a storm of logins from 4x as many
+   threads as there are pool processes. The batch API is used because it does
+   not write patient history; the login account is created in memory only.
+
+Hashes use Werkzeug's default method (scrypt on Werkzeug 3, pbkdf2 before), as
+`add_doctor` does.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+
+from password_pool import PasswordPool, PoolBusy  # noqa: E402
+
+PASSWORD = 'password123'
+
+
+def run_callers(callers, seconds, fn):
+    """Call `fn()` from `callers` threads for `seconds`; return (ok, rejected) counts."""
+    counts = {'ok': 0, 'rejected': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def loop():
+        ok = rejected = 0
+        while time.perf_counter() < deadline:
+            try:
+                fn()
+                ok += 1
+            except PoolBusy:
+                rejected += 1
+                time.sleep(0.001)
+        with lock:
+            counts['ok'] += ok
+            counts['rejected'] += rejected
+
+    threads = [threading.Thread(target=loop) for _ in range(callers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return counts['ok'], counts['rejected']
+
+
+def bench_pool(pwhash, worker_counts, seconds, max_pending):
+    ok, _ = run_callers(1, seconds, lambda: check_password_hash(pwhash, PASSWORD))
+    print(f"{'inline':10s} {ok / seconds:8.1f} logins/s  {ok / seconds:8.1f} per core")
+    for workers in worker_counts:
+        pool = PasswordPool(workers=workers, max_pending=max_pending, nice=0)
+        pool.verify(pwhash, PASSWORD)  # start the processes outside the timing
+        ok, rejected = run_callers(max_pending, seconds, lambda: pool.verify(pwhash, PASSWORD))
+        pool.shutdown()
+        print(f"{f'{workers} proc':10s} {ok / seconds:8.1f} logins/s  {ok / seconds / workers:8.1f} per core  "
+              f"({rejected} rejected)")
+
+
+def bench_app(pwhash, seconds):
+    import app as appmod
+
+    application = appmod.create_app()
+    if not appmod.model_registry.current(wait=60):
+        print("Model not loaded; skipping the app benchmark")
+        return
+    appmod.doctors['bench.login'] = {'password': pwhash, 'nom': 'Bench', 'specialite': '', 'is_active': True,
+                                     'is_admin': False, 'id': 'benchlogin'}
+    client = application.test_client()
+    with client.session_transaction() as s:
+        s['username'] = 'benchmark'
+
+    def predict_latencies(duration):
+        samples = []
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.post('/api/predict/batch', json=[{'fever': 1, 'fatigue': 1, 'age': 40}])
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        return samples
+
+    def report(label, samples):
+        print(f"{label:22s} p50 {statistics.median(samples):7.2f} ms  "
+              f"p95 {samples[max(int(len(samples) * 0.95) - 1, 0)]:7.2f} ms  (n={len(samples)})")
+
+    report('predict, idle', predict_latencies(seconds))
+
+    stop = threading.Event()
+    outcomes = {}
+
+    def storm():
+        login_client = application.test_client()
+        while not stop.is_set():
+            status = login_client.post('/login', data={'username': 'bench.login', 'password': PASSWORD}).status_code
+            outcomes[status] = outcomes.get(status, 0) + 1
+
+    threads = [threading.Thread(target=storm) for _ in range(appmod.password_pool.workers * 4)]
+    for t in threads:
+        t.start()
+    samples = predict_latencies(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    report('predict, login storm', samples)
+    print(f"Logins during the storm: {outcomes.get(302, 0) / seconds:.1f}/s accepted, "
+          f"{outcomes.get(503, 0)} turned away (503)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--workers', default=','.join(str(n) for n in sorted({1, max(1, (os.cpu_count() or 2) // 2),
+                                                                              os.cpu_count() or 2})))
+    parser.add_argument('--max-pending', type=int, default=16)
+    parser.add_argument('--app', action='store_true', help='also measure diagnoses during a login storm')
+    args = parser.parse_args()
+
+    pwhash = generate_password_hash(PASSWORD)
+    print(f"Hash method: {pwhash.split('$')[0]}  (cores: {os.cpu_count()})")
+    bench_pool(pwhash, [int(n) for n in args.workers.split(',')], args.seconds, args.max_pending)
+    if args.app:
+        os.chdir(ROOT)
+        bench_app(pwhash, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: time to render one diagnostic report with each PDF backend.
+
+Usage (from project root):
+  python benchmarks/bench_reports.py [-n 200] [--wkhtmltopdf /usr/bin/wkhtmltopdf]
+
+"builtin" is `reports.BuiltinReportRenderer` (in-process PDF layout). "wkhtmltopdf"
+renders templates/pdf_template.html and converts it with pdfkit, which is what
+`/download-pdf` always did; it is skipped when the binary cannot be found
+(set WKHTMLTOPDF_CMD or pass --wkhtmltopdf). Both timings cover document
+preparation and rendering, without the PDF cache.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from jinja2 import Environment, FileSystemLoader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from reports import BuiltinReportRenderer, WkhtmltopdfReportRenderer, wkhtmltopdf_available  # noqa: E402
+
+
+RESULT = {
+    'patient': {'nom': 'Benali', 'prenom': 'Salma', 'cne': 'AB123456', 'age': '42', 'genre': 'Femme'},
+    'symptoms': {'fievre': 'Oui', 'toux': 'Non', 'fatigue': 'Oui', 'respiration': 'Non'},
+    'diagnostic': {
+        'maladie': 'Pneumonie',
+        'confiance': '87.5%',
+        'service': 'Service Pneumologie',
+        'examens': ['Radiographie thoracique', 'Numération formule sanguine', 'Hémocultures']
+    },
+    'date': '18/10/2026 09:30',
+    'medecin': {'nom': 'Dr. Marie Martin', 'specialite': 'Médecine générale'}
+}
+
+PDF_OPTIONS = {
+    'encoding': 'UTF-8',
+    'page-size': 'A4',
+    'margin-top': '1cm',
+    'margin-right': '1cm',
+    'margin-bottom': '1cm',
+    'margin-left': '1cm'
+}
+
+
+def measure(renderer, n):
+    renderer.render(renderer.document(RESULT))
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        pdf = renderer.render(renderer.document(RESULT))
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'mean_ms': statistics.fmean(samples),
+        'p50_ms': samples[len(samples) // 2],
+        'p95_ms': samples[max(int(len(samples) * 0.95) - 1, 0)],
+        'bytes': len(pdf)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=200, help='reports per backend')
+    parser.add_argument('--wkhtmltopdf', default=os.environ.get('WKHTMLTOPDF_CMD', 'wkhtmltopdf'))
+    args = parser.parse_args()
+
+    templates = Environment(loader=FileSystemLoader(os.path.join(ROOT, 'templates')), autoescape=True)
+    template = templates.get_template('pdf_template.html')
+
+    renderers = {'builtin': BuiltinReportRenderer()}
+    if wkhtmltopdf_available(args.wkhtmltopdf):
+        renderers['wkhtmltopdf'] = WkhtmltopdfReportRenderer(
+            lambda result: template.render(result=result, date=result['date']), args.wkhtmltopdf, PDF_OPTIONS)
+    else:
+        print(f"wkhtmltopdf not found at '{args.wkhtmltopdf}'; benchmarking the builtin backend only")
+
+    results = {}
+    for name, renderer in renderers.items():
+        # Each wkhtmltopdf render spawns a process; keep its sample count reasonable
+        n = args.n if name == 'builtin' else min(args.n, 50)
+        results[name] = stats = measure(renderer, n)
+        print(f"{name:12s} mean {stats['mean_ms']:8.2f} ms  p50 {stats['p50_ms']:8.2f} ms  "
+              f"p95 {stats['p95_ms']:8.2f} ms  ({stats['bytes']} bytes, n={n})")
+    if len(results) == 2:
+        print(f"Speedup (builtin vs wkhtmltopdf): {results['wkhtmltopdf']['mean_ms'] / results['builtin']['mean_ms']:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: worker startup cost of the app.
+
+Usage (from project root):
+  python benchmarks/bench_startup.py [--runs 5]
+
+Each run starts a fresh interpreter (as a new gunicorn worker would) in a scratch
+copy of the project's data/ and models/, so the history database and statistics
+the app creates on startup stay out of the checkout. It reports:
+  import        `import app`
+  create_app    `app.create_app()` (starts the background model load)
+  first page    first GET /login (template compilation)
+  ready         until /ready returns 200 (model loaded and warmed up)
+  first predict first POST /api/predict/batch with one row, issued right after
+                create_app(), so it includes waiting for the model
+
+The batch API is used for the prediction because it does not write patient history.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import json, sys, time
+timings = {}
+start = time.perf_counter()
+import app as appmod
+timings['import'] = time.perf_counter() - start
+
+start = time.perf_counter()
+application = appmod.create_app()
+timings['create_app'] = time.perf_counter() - start
+
+client = application.test_client()
+with client.session_transaction() as s:
+    s['username'] = 'benchmark'
+
+start = time.perf_counter()
+client.get('/login')
+timings['first page'] = time.perf_counter() - start
+
+ready_start = time.perf_counter()
+response = client.post('/api/predict/batch', json=[{'fever': 1, 'fatigue': 1, 'age': 40}])
+timings['first predict'] = time.perf_counter() - ready_start
+while client.get('/ready').status_code != 200 and time.perf_counter() - ready_start < 60:
+    time.sleep(0.01)
+timings['ready'] = time.perf_counter() - ready_start if appmod.model_registry.is_ready() else None
+timings['modules'] = sorted(m for m in ('numpy', 'pandas', 'catboost', 'pdfkit') if m in sys.modules)
+print('BENCH ' + json.dumps(timings))
+'''
+
+
+def run_once(workdir):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get('PYTHONPATH')))))
+    proc = subprocess.run([sys.executable, '-c', CHILD], cwd=workdir, env=env, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith('BENCH '):
+            return json.loads(line[len('BENCH '):])
+    raise RuntimeError(f"startup run failed:\n{proc.stdout}\n{proc.stderr}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='medical_bench_startup_')
+    try:
+        for sub in ('data', 'models'):
+            shutil.copytree(os.path.join(ROOT, sub), os.path.join(workdir, sub))
+        runs = [run_once(workdir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    for label in ('import', 'create_app', 'first page', 'ready', 'first predict'):
+        values = [r[label] * 1000 for r in runs if r.get(label) is not None]
+        if not values:
+            print(f"{label:14s} n/a (model not loaded)")
+            continue
+        print(f"{label:14s} median {statistics.median(values):8.1f} ms  min {min(values):8.1f} ms  max {max(values):8.1f} ms")
+    print(f"Modules loaded by then: {', '.join(runs[-1]['modules']) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
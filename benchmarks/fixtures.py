@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Synthetic data sets for the benchmarks: large data/ and models/ directories.
+
+Usage (from project root):
+  python benchmarks/fixtures.py OUTPUT_DIR [--doctors 10000] [--diagnoses 1000000]
+                                          [--diseases 1000] [--seed 0] [--force]
+
+OUTPUT_DIR gets the layout the app reads from its working directory:
+
+  data/medecins.json        --doctors accounts (dr.bench00000, ...), password
+                            `password123`; the first BENCH_ADMINS are admins
+  data/patients.json        --diagnoses entries, newest first (streamed to disk)
+  data/patients.db          the same history in the SQLite store, as the app
+                            would import it on first start
+  data/stats.json           diagnosis counters rebuilt from that history
+  data/services.json        the services of the disease mapping
+  models/disease_mapping.json  --diseases classes spread over DISEASES_PER_SERVICE services
+  models/CatBoost_best_model.pkl  a stand-in CatBoost model trained on random data
+                            with the real model's feature columns and one class per disease
+
+Everything is derived from --seed, so two runs with the same arguments produce
+the same data (password salts aside). `fixture.json` records the arguments; a directory whose
+fixture.json matches is reused unless --force is given.
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from disease_catalog import DiseaseCatalog  # noqa: E402
+
+PASSWORD = 'password123'
+BENCH_ADMINS = 10
+DISEASES_PER_SERVICE = 20
+# Feature columns of models/CatBoost_best_model.pkl (see benchmarks/bench_inference.py)
+FEATURES = ['Fever', 'Cough', 'Fatigue', 'Difficulty Breathing', 'Age', 'Gender',
+            'Blood Pressure', 'Cholesterol Level', 'Outcome Variable']
+EXAMS = ['Examen clinique', 'Test PCR', 'Radiographie thoracique', 'Numération formule sanguine',
+         'IRM cérébrale', 'Échographie abdominale', 'Électrocardiogramme', 'Bilan thyroïdien',
+         'Scanner thoracique', 'Hémocultures', 'Consultation psychiatrique', 'Biopsie']
+SPECIALTIES = ['Médecine Générale', 'Cardiologie', 'Pneumologie', 'Neurologie', 'Oncologie',
+               'Infectiologie', 'Endocrinologie', 'Psychiatrie']
+FIRST_NAMES = ['Salma', 'Youssef', 'Amina', 'Karim', 'Nadia', 'Omar', 'Leila', 'Hassan', 'Sara', 'Mehdi']
+LAST_NAMES = ['Benali', 'El Idrissi', 'Alaoui', 'Bennani', 'Tazi', 'Chraibi', 'Berrada', 'Fassi', 'Lahlou', 'Amrani']
+BENCH_PREFIX = 'dr.bench'
+
+
+def doctor_username(i):
+    return f'{BENCH_PREFIX}{i:05d}'
+
+
+def generate_disease_mapping(count, seed=0):
+    """class id -> {name, examens, service}, as models/disease_mapping.json."""
+    rng = random.Random(seed)
+    services = max(1, count // DISEASES_PER_SERVICE)
+    return {
+        str(i): {
+            'name': f'Maladie synthétique {i:04d}',
+            'examens': rng.sample(EXAMS, rng.randint(1, 3)),
+            'service': f'Service Synthétique {i % services:03d}'
+        }
+        for i in range(count)
+    }
+
+
+def generate_doctors(count, seed=0):
+    """username -> account record, as data/medecins.json. All accounts share one password hash."""
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(seed)
+    # One hash for every account: hashing 10k passwords would dominate the generation time
+    password_hash = generate_password_hash(PASSWORD)
+    doctors = {}
+    for i in range(count):
+        name = f'Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i:05d}'
+        specialite = rng.choice(SPECIALTIES)
+        doctors[doctor_username(i)] = {
+            'id': f'drbench{i:05d}',
+            'password': password_hash,
+            'nom_complet': name,
+            'specialite': specialite,
+            'numero_ordre': str(200000 + i),
+            'email': f'bench{i:05d}@hopital.test',
+            'signature': f'{name}\n{specialite}\nCHU Mohammed VI Oujda',
+            'role': 'admin' if i < BENCH_ADMINS else 'medecin'
+        }
+    return doctors
+
+
+def iter_diagnoses(count, doctors, mapping, seed=0, days=365, newest_first=False):
+    """`count` history entries spread over the last `days` days, oldest first by default.
+
+    Entry `i` only depends on `seed` and `i`, so both orders yield the same entries.
+    """
+    names = [d['nom_complet'] for d in doctors.values()]
+    diseases = list(mapping.values())
+    start = datetime(2026, 1, 1) - timedelta(days=days)
+    step = days * 24 * 60 / max(count, 1)
+    for i in (reversed(range(count)) if newest_first else range(count)):
+        rng = random.Random(seed * 1000003 + i)
+        disease = rng.choice(diseases)
+        yield {
+            'nom': rng.choice(LAST_NAMES),
+            'prenom': rng.choice(FIRST_NAMES),
+            'cin': f'BK{rng.randrange(10 ** 6):06d}',
+            'age': str(rng.randint(1, 95)),
+            'sex': rng.choice(('Homme', 'Femme')),
+            'disease': disease['name'],
+            'doctor': rng.choice(names),
+            'service': disease['service'],
+            'date': (start + timedelta(minutes=int(i * step))).strftime('%d/%m/%Y %H:%M'),
+            'model_version': ''
+        }
+
+
+def write_json_list(path, entries):
+    """Stream `entries` to `path` as a JSON list, one entry per line."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        separator = '\n'
+        for entry in entries:
+            f.write(separator)
+            f.write(json.dumps(entry, ensure_ascii=False))
+            separator = ',\n'
+        f.write('\n]\n')
+
+
+def train_standin_model(n_classes, seed=0, iterations=30):
+    """CatBoost model with the real feature columns, trained on random rows, one class per disease."""
+    import numpy as np
+    import pandas as pd
+    from catboost import CatBoostClassifier
+
+    rng = np.random.default_rng(seed)
+    n_rows = max(2000, 3 * n_classes)
+    frame = pd.DataFrame({name: rng.integers(0, 2, n_rows).astype(float) for name in FEATURES})
+    frame['Age'] = rng.integers(1, 90, n_rows).astype(float)
+    frame['Blood Pressure'] = rng.integers(0, 3, n_rows).astype(float)
+    # Every class appears, so the model knows all of them
+    labels = np.arange(n_rows) % n_classes
+    rng.shuffle(labels)
+    model = CatBoostClassifier(iterations=iterations, depth=4, verbose=False, random_seed=seed,
+                               thread_count=-1, allow_writing_files=False)
+    model.fit(frame, labels)
+    return model
+
+
+def _step(label, fn):
+    start = time.perf_counter()
+    outcome = fn()
+    print(f"  {label:28s} {time.perf_counter() - start:7.1f} s")
+    return outcome
+
+
+def build_fixture(output, doctors=10000, diagnoses=1000000, diseases=1000, seed=0, force=False):
+    """Create (or reuse) a fixture directory. Returns its parameters (the fixture.json content)."""
+    params = {'doctors': doctors, 'diagnoses': diagnoses, 'diseases': diseases, 'seed': seed}
+    manifest_path = os.path.join(output, 'fixture.json')
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if {k: manifest.get(k) for k in params} == params:
+            return manifest
+
+    # The app's own modules write the SQLite history and the counters
+    from analytics import DiagnosisStats
+    from history_store import SqliteHistoryStore
+    from persistence import JsonPersistence
+
+    print(f"Building fixture in {output}: {params}")
+    for sub in ('data', 'models'):
+        shutil.rmtree(os.path.join(output, sub), ignore_errors=True)
+        os.makedirs(os.path.join(output, sub))
+    data_dir = os.path.join(output, 'data')
+
+    def dump(path, document):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False, indent=1)
+
+    mapping = _step('disease_mapping.json', lambda: generate_disease_mapping(diseases, seed))
+    dump(os.path.join(output, 'models', 'disease_mapping.json'), mapping)
+    dump(os.path.join(data_dir, 'services.json'), DiseaseCatalog(mapping).default_services())
+    model = _step('stand-in model', lambda: train_standin_model(diseases, seed))
+    with open(os.path.join(output, 'models', 'CatBoost_best_model.pkl'), 'wb') as f:
+        pickle.dump(model, f)
+
+    accounts = _step('medecins.json', lambda: generate_doctors(doctors, seed))
+    dump(os.path.join(data_dir, 'medecins.json'), accounts)
+
+    _step('patients.json', lambda: write_json_list(
+        os.path.join(data_dir, 'patients.json'),
+        iter_diagnoses(diagnoses, accounts, mapping, seed, newest_first=True)))
+
+    def fill_store():
+        store = SqliteHistoryStore(os.path.join(data_dir, 'patients.db'))
+        batch = []
+        for entry in iter_diagnoses(diagnoses, accounts, mapping, seed):
+            batch.append(entry)
+            if len(batch) == 10000:
+                store.add_many(batch)
+                batch = []
+        if batch:
+            store.add_many(batch)
+    _step('patients.db', fill_store)
+
+    def rebuild_stats():
+        persistence = JsonPersistence()
+        # Same entries as the store holds, without reading them back
+        DiagnosisStats(persistence, os.path.join(data_dir, 'stats.json')).rebuild(
+            iter_diagnoses(diagnoses, accounts, mapping, seed))
+        persistence.stop()
+    _step('stats.json', rebuild_stats)
+
+    manifest = dict(params, built_at=datetime.now().isoformat(timespec='seconds'), password=PASSWORD,
+                    admin=doctor_username(0))
+    dump(manifest_path, manifest)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output')
+    parser.add_argument('--doctors', type=int, default=10000)
+    parser.add_argument('--diagnoses', type=int, default=1000000)
+    parser.add_argument('--diseases', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--force', action='store_true', help='rebuild even if the directory matches')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    build_fixture(args.output, args.doctors, args.diagnoses, args.diseases, args.seed, args.force)
+    print(f"Fixture ready in {args.output} ({time.perf_counter() - start:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Disease catalog compiled from models/disease_mapping.json.
+
+The mapping (model class id -> {name, service, examens}) used to be scanned
+linearly for each recommendation, and the admin services were re-derived from it
+with regexes on every use. `DiseaseCatalog` is built once per mapping version
+(the model registry builds it when it loads the mapping, so it is reloaded with
+the file) and answers every lookup with a dict access:
+
+- `describe(class_id)` -> (name, service, exams) for a model prediction;
+- `by_name`, `service_for(name)`, `exams_for(name)` for stored diagnoses;
+- `diseases_of(service)` (reverse index) and `services`, the distinct services
+  with stable normalized ids, as the admin services list uses them.
+
+Exam lists are tuples shared by all lookups; copy them before modifying.
+"""
+import re
+
+DEFAULT_SERVICE = 'Service de Médecine Générale'
+DEFAULT_EXAMS = ('Consultation médicale approfondie',)
+UNKNOWN_DISEASE = 'Maladie inconnue'
+
+
+def service_key(name):
+    """Normalized id of a service name: its letters and digits, lowercased."""
+    return re.sub(r'[^A-Za-z0-9]', '', name).lower()
+
+
+class Disease:
+    __slots__ = ('class_id', 'name', 'service', 'exams')
+
+    def __init__(self, class_id, name, service, exams):
+        self.class_id = class_id
+        self.name = name
+        self.service = service
+        self.exams = exams
+
+
+class DiseaseCatalog:
+    def __init__(self, mapping, version=None):
+        self.version = version
+        self.by_class = {}
+        self.by_name = {}
+        self._by_service = {}
+        self.services = []
+        self.service_ids = {}
+        self._used_ids = set()
+
+        for class_id, entry in (mapping or {}).items():
+            if not isinstance(entry, dict):
+                continue
+            disease = Disease(str(class_id),
+                              entry.get('name', UNKNOWN_DISEASE),
+                              entry.get('service', DEFAULT_SERVICE),
+                              tuple(entry.get('examens', DEFAULT_EXAMS)))
+            self.by_class[disease.class_id] = disease
+            # The first class with a given name wins, as the linear scans did
+            self.by_name.setdefault(disease.name, disease)
+            if entry.get('service'):
+                self._add_service(entry['service'])
+                self._by_service[entry['service']].append(disease.name)
+
+    def _add_service(self, name):
+        if name in self._by_service:
+            return
+        self._by_service[name] = []
+        key = service_key(name)
+        base = sid = key or 'service'
+        suffix = 1
+        while sid in self._used_ids:
+            suffix += 1
+            sid = f"{base}{suffix}"
+        self._used_ids.add(sid)
+        self.service_ids[name] = sid
+        self.services.append({
+            'id': sid,
+            'name': name,
+            'code': '',
+            'description': "Service auto-généré à partir des mappings de maladies"
+        })
+
+    def __len__(self):
+        return len(self.by_class)
+
+    def describe(self, class_id):
+        """(disease name, service, exams) for a stringified model class."""
+        disease = self.by_class.get(class_id)
+        if disease is None:
+            return UNKNOWN_DISEASE, DEFAULT_SERVICE, DEFAULT_EXAMS
+        return disease.name, disease.service, disease.exams
+
+    def service_for(self, disease_name):
+        disease = self.by_name.get(disease_name)
+        return disease.service if disease else DEFAULT_SERVICE
+
+    def exams_for(self, disease_name):
+        disease = self.by_name.get(disease_name)
+        return disease.exams if disease else DEFAULT_EXAMS
+
+    def diseases_of(self, service_name):
+        """Names of the diseases referred to `service_name`."""
+        return list(self._by_service.get(service_name, ()))
+
+    def default_services(self):
+        """The distinct services as admin service records (fresh dicts, safe to store)."""
+        return [dict(service) for service in self.services]
@@ -0,0 +1,187 @@
+"""In-memory directory of doctor accounts, indexed and rebuilt when medecins.json changes.
+
+The login, admin and password-reset handlers used to look accounts up in several
+ways: the `doctors` dict, an `ids_map`, and re-reading `data/medecins.json` to
+scan it for a matching `id`, email or role. `DoctorDirectory` parses the file
+once into normalized records (`doctors`, the dict the templates use) plus
+secondary indexes by alphanumeric id, email, `numero_ordre` and display name,
+so every lookup is a dict access.
+
+`refresh()` costs one stat() when the file is unchanged (it compares the
+`JsonPersistence` revision) and rebuilds everything otherwise, whether the change
+came from this process, another worker or an edit on disk. The rebuilt indexes
+are swapped in while `doctors` is updated in place, so code holding a reference
+to it keeps seeing current accounts.
+"""
+import re
+import threading
+
+# Used only when medecins.json is missing or empty
+FALLBACK_DOCTORS = {
+    'dr.smith': {'nom_complet': 'Dr. Smith', 'specialite': 'Cardiologue', 'role': 'admin'},
+    'dr.martin': {'nom_complet': 'Dr. Martin', 'specialite': 'Pneumologue', 'role': 'medecin'}
+}
+DEFAULT_PASSWORD = 'password123'
+
+
+def is_hashed_password(pwd: str) -> bool:
+    """Return True if `pwd` looks like a Werkzeug/secure hash we accept."""
+    if not isinstance(pwd, str):
+        return False
+    # common Werkzeug prefixes or scrypt used by current environment
+    return pwd.startswith('pbkdf2:') or pwd.startswith('scrypt:') or pwd.startswith('argon2:')
+
+
+def doctor_id(username):
+    """Default alphanumeric id of an account without an explicit `id`."""
+    return re.sub(r'[^A-Za-z0-9]', '', username)
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+class _Indexes:
+    __slots__ = ('doctors', 'by_id', 'by_email', 'by_numero', 'by_name', 'max_numero', 'plaintext')
+
+    def __init__(self, raw):
+        self.doctors = {}
+        self.by_id = {}
+        self.by_email = {}
+        self.by_numero = {}
+        self.by_name = {}
+        self.max_numero = None
+        # Plaintext passwords are hashed on first login rather than here, since each
+        # (deliberately slow) hash would add to every reload
+        self.plaintext = {}
+
+        records = raw or FALLBACK_DOCTORS
+        for username, info in records.items():
+            pwd = info.get('password', '')
+            if is_hashed_password(pwd):
+                stored_pwd = pwd
+            else:
+                if raw:
+                    print(f"Warning: password for {username} does not appear hashed. "
+                          f"Hashing in-memory on first login (not persisted).")
+                stored_pwd = None
+                self.plaintext[username] = pwd or DEFAULT_PASSWORD
+
+            record = {
+                'password': stored_pwd,
+                'nom': info.get('nom_complet') or info.get('nom') or username,
+                'specialite': info.get('specialite', ''),
+                'email': info.get('email', ''),
+                'is_active': info.get('is_active', True),
+                'is_admin': info.get('role', '') == 'admin',
+                # prefer explicit 'id' from source file if present, else remove non-alphanumeric chars
+                'id': info.get('id') or doctor_id(username)
+            }
+            for field in ('numero_ordre', 'signature'):
+                if info.get(field):
+                    record[field] = info[field]
+            self.doctors[username] = record
+
+            self.by_id.setdefault(record['id'], username)
+            email = normalize_email(record['email'])
+            if email:
+                self.by_email.setdefault(email, username)
+            self.by_name.setdefault(record['nom'], username)
+            numero = str(info.get('numero_ordre') or '')
+            if numero:
+                self.by_numero.setdefault(numero, username)
+                if numero.isdigit() and (self.max_numero is None or int(numero) > self.max_numero):
+                    self.max_numero = int(numero)
+
+
+class DoctorDirectory:
+    def __init__(self, persistence, path):
+        self.persistence = persistence
+        self.path = path
+        self.doctors = {}
+        self._indexes = _Indexes({})
+        self._revision = None
+        self._lock = threading.Lock()
+        self._password_lock = threading.Lock()
+
+    def refresh(self):
+        """Rebuild the records and indexes if the file changed. Returns True if it did."""
+        revision = self.persistence.revision(self.path, default={})
+        if revision == self._revision:
+            return False
+        # Read outside our lock: persistence.update() callers may refresh while holding the file's lock
+        try:
+            raw = self.persistence.read(self.path, default={})
+            indexes = _Indexes(raw)
+        except Exception as e:
+            print(f"Error loading doctors from {self.path}: {e}")
+            return False
+        with self._lock:
+            if self._revision is not None and revision <= self._revision:
+                return False
+            # Update in place, then drop removed keys, so concurrent readers never see an empty dict
+            self.doctors.update(indexes.doctors)
+            for username in set(self.doctors) - set(indexes.doctors):
+                del self.doctors[username]
+            self._indexes = indexes
+            self._revision = revision
+        print(f"Loaded {len(self.doctors)} doctors from {self.path}")
+        return True
+
+    # -- lookups ---------------------------------------------------------
+
+    def __contains__(self, username):
+        return username in self.doctors
+
+    def get(self, username):
+        return self.doctors.get(username)
+
+    def resolve(self, identifier):
+        """Username for a login key or an alphanumeric `id`, or None."""
+        if identifier in self.doctors:
+            return identifier
+        return self._indexes.by_id.get(identifier)
+
+    def by_email(self, email):
+        return self._indexes.by_email.get(normalize_email(email))
+
+    def by_numero_ordre(self, numero):
+        return self._indexes.by_numero.get(str(numero))
+
+    def by_name(self, nom):
+        """The record whose display name is `nom` (as stored in patient history), or None."""
+        username = self._indexes.by_name.get(nom)
+        return self.doctors.get(username) if username else None
+
+    def id_taken(self, uid):
+        return uid in self._indexes.by_id
+
+    def next_numero_ordre(self):
+        """A fresh numeric `numero_ordre`: one more than the largest numeric one in use."""
+        indexes = self._indexes
+        if indexes.max_numero is not None:
+            return str(indexes.max_numero + 1)
+        # start from 100000 + number of entries to reduce collision chance
+        return str(100000 + len(indexes.doctors) + 1)
+
+    def is_admin(self, username):
+        record = self.doctors.get(username)
+        return bool(record and record.get('is_admin'))
+
+    # -- passwords -------------------------------------------------------
+
+    def password_hash(self, username, hasher=None):
+        """Return the password hash of `username`, hashing a pending plaintext password once.
+
+        `hasher(password)` defaults to Werkzeug's `generate_password_hash`.
+        """
+        record = self.doctors[username]
+        if record.get('password') is None:
+            if hasher is None:
+                from werkzeug.security import generate_password_hash as hasher
+            with self._password_lock:
+                if record.get('password') is None:
+                    plaintext = self._indexes.plaintext.get(username, DEFAULT_PASSWORD)
+                    record['password'] = hasher(plaintext)
+                    self._indexes.plaintext.pop(username, None)
+        return record['password']
@@ -0,0 +1,175 @@
+"""Bulk creation of doctor accounts from a CSV file.
+
+Used by the admin upload (`/admin/import-doctors`) and by
+`scripts/import_doctors.py`. The CSV needs the columns `nom_complet`,
+`specialite` and `password`; `email`, `role` (medecin/admin) and `numero_ordre`
+are optional. `,` and `;` separators are both accepted.
+
+An import is all or nothing:
+
+1. `parse_doctors_csv` checks every row (required fields, email format, role,
+   duplicates within the file) and reports all problems with their line numbers;
+2. `import_doctors` checks the rows against the existing accounts, hashes the
+   passwords in parallel (outside any lock), then allocates usernames, ids and
+   `numero_ordre` values and adds every record in a single
+   `JsonPersistence.update`, i.e. one atomic rewrite of medecins.json.
+"""
+import csv
+import io
+import re
+
+from doctor_directory import doctor_id, normalize_email
+
+REQUIRED_COLUMNS = ('nom_complet', 'specialite', 'password')
+OPTIONAL_COLUMNS = ('email', 'role', 'numero_ordre')
+ROLES = ('medecin', 'admin')
+MAX_ROWS = 5000
+
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+class DoctorImportError(Exception):
+    """Raised when an import is rejected; `errors` lists the problems (French, for display)."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+def username_base(nom_complet):
+    """Preferred username for a new account: 'dr.' + lowercase name with dots replacing spaces."""
+    return 'dr.' + re.sub(r'[^A-Za-z0-9]+', '.', nom_complet.strip().lower()).strip('.')
+
+
+def doctor_signature(nom_complet, specialite):
+    """Standard signature block with the doctor's name and specialty."""
+    return f"Dr. {nom_complet}\n{specialite}\nCHU Mohammed VI Oujda"
+
+
+def parse_doctors_csv(text):
+    """Return the validated rows of a doctors CSV. Raises DoctorImportError listing every problem."""
+    text = text.lstrip('\ufeff')
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    columns = [c.strip().lower() for c in (reader.fieldnames or [])]
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise DoctorImportError([f"Colonnes manquantes : {', '.join(missing)}"])
+    reader.fieldnames = columns
+
+    rows, errors = [], []
+    emails, numeros = {}, {}
+    for line, record in enumerate(reader, start=2):
+        if len(rows) >= MAX_ROWS:
+            errors.append(f"Trop de lignes (maximum {MAX_ROWS})")
+            break
+        row = {c: (record.get(c) or '').strip() for c in REQUIRED_COLUMNS + OPTIONAL_COLUMNS}
+        if not any(row.values()):
+            continue
+        row['line'] = line
+        for column in REQUIRED_COLUMNS:
+            if not row[column]:
+                errors.append(f"Ligne {line} : champ '{column}' manquant")
+        row['role'] = row['role'].lower() or 'medecin'
+        if row['role'] not in ROLES:
+            errors.append(f"Ligne {line} : rôle inconnu '{row['role']}'")
+        email = normalize_email(row['email'])
+        if email:
+            if not _EMAIL_RE.match(email):
+                errors.append(f"Ligne {line} : email invalide '{row['email']}'")
+            elif email in emails:
+                errors.append(f"Ligne {line} : email déjà utilisé ligne {emails[email]}")
+            emails.setdefault(email, line)
+        numero = row['numero_ordre']
+        if numero:
+            if numero in numeros:
+                errors.append(f"Ligne {line} : numéro d'ordre déjà utilisé ligne {numeros[numero]}")
+            numeros.setdefault(numero, line)
+        rows.append(row)
+
+    if not rows and not errors:
+        errors.append("Aucun médecin dans le fichier")
+    if errors:
+        raise DoctorImportError(errors)
+    return rows
+
+
+def _conflicts(raw, rows):
+    """Problems between the rows and the accounts already in `raw`."""
+    emails = {normalize_email(v.get('email')) for v in raw.values()} - {''}
+    numeros = {str(v.get('numero_ordre')) for v in raw.values() if v.get('numero_ordre')}
+    errors = []
+    for row in rows:
+        if normalize_email(row['email']) in emails:
+            errors.append(f"Ligne {row['line']} : un compte existe déjà avec l'email {row['email']}")
+        if row['numero_ordre'] and row['numero_ordre'] in numeros:
+            errors.append(f"Ligne {row['line']} : numéro d'ordre {row['numero_ordre']} déjà attribué")
+    return errors
+
+
+def _allocate(raw, rows, hashes):
+    """Add one record per row to `raw`, with unique usernames, ids and numero_ordre. Returns (username, id) pairs."""
+    ids = {v.get('id') or doctor_id(k) for k, v in raw.items()}
+    numbers = [int(v['numero_ordre']) for v in raw.values() if str(v.get('numero_ordre', '')).isdigit()]
+    numbers += [int(row['numero_ordre']) for row in rows if row['numero_ordre'].isdigit()]
+    # start from 100000 + number of entries to reduce collision chance
+    next_numero = max(numbers) + 1 if numbers else 100000 + len(raw) + 1
+
+    created = []
+    for row, hashed in zip(rows, hashes):
+        base_key = username_base(row['nom_complet'])
+        username_key, suffix = base_key, 1
+        while username_key in raw:
+            suffix += 1
+            username_key = f"{base_key}{suffix}"
+        generated_id = doctor_id(username_key).lower()
+        base_id, id_suffix = generated_id, 1
+        while generated_id in ids:
+            id_suffix += 1
+            generated_id = f"{base_id}{id_suffix}"
+        ids.add(generated_id)
+        numero = row['numero_ordre']
+        if not numero:
+            numero = str(next_numero)
+            next_numero += 1
+
+        raw[username_key] = {
+            'id': generated_id,
+            'password': hashed,
+            'nom_complet': row['nom_complet'],
+            'specialite': row['specialite'],
+            'numero_ordre': numero,
+            'email': row['email'],
+            'signature': doctor_signature(row['nom_complet'], row['specialite']),
+            'role': row['role']
+        }
+        created.append((username_key, generated_id))
+    return created
+
+
+def import_doctors(persistence, path, rows, hasher):
+    """Create the accounts for `rows` (from `parse_doctors_csv`) in one commit.
+
+    `hasher(passwords)` returns the hashes in order (see `password_pool.hash_passwords`).
+    Returns the created (username, id) pairs; raises DoctorImportError if a row clashes
+    with an existing account, in which case nothing is written.
+    """
+    errors = _conflicts(persistence.read(path, default={}), rows)
+    if errors:
+        raise DoctorImportError(errors)
+    hashes = hasher([row['password'] for row in rows])
+
+    def insert_all(raw):
+        # Another request may have added a clashing account while we were hashing
+        clashes = _conflicts(raw, rows)
+        if clashes:
+            return DoctorImportError(clashes)
+        return _allocate(raw, rows, hashes)
+
+    outcome = persistence.update(path, insert_all, default={})
+    if isinstance(outcome, DoctorImportError):
+        raise outcome
+    return outcome
@@ -0,0 +1,198 @@
+"""Per-prediction feature contributions from CatBoost's native ShapValues.
+
+`/result` must not wait for explanations, so they are computed off the request
+path and cached by (model version, feature vector):
+
+- `submit(version, vector)` queues a form's vector once its response is built;
+  a background thread drains the queue and explains every pending vector of a
+  model version with one `get_feature_importance(type='ShapValues')` call;
+- the result page polls `lookup()` (through `/api/explanation`) and the PDF
+  report waits briefly for the same entry with `wait()`;
+- `explain_matrix(version, matrix)` explains many rows synchronously for the
+  batch API, again with a single call for all the rows missing from the cache.
+
+For a multiclass model ShapValues has shape [rows, classes, features + 1]: the
+contributions of each feature to each class' raw score (log-odds), the last
+column being the expected value. Only the predicted class is kept. Contributions
+of columns the form never sets (the dummy 'Outcome Variable') are left out.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+import numpy as np
+
+from inference import FORM_FEATURE_FIELDS, LRUCache
+from metrics import REGISTRY
+
+# Model column -> label shown on the result page and the report
+FEATURE_LABELS = {
+    'Fever': 'Fièvre',
+    'Cough': 'Toux',
+    'Fatigue': 'Fatigue',
+    'Difficulty Breathing': 'Difficulté respiratoire',
+    'Age': 'Âge',
+    'Gender': 'Sexe',
+    'Blood Pressure': 'Pression artérielle',
+    'Cholesterol Level': 'Cholestérol'
+}
+# Model column -> option labels of templates/index.html, by value
+VALUE_LABELS = {
+    'Fever': ('Non', 'Oui'),
+    'Cough': ('Non', 'Oui'),
+    'Fatigue': ('Non', 'Oui'),
+    'Difficulty Breathing': ('Non', 'Oui'),
+    'Gender': ('Homme', 'Femme'),
+    'Blood Pressure': ('Basse', 'Normale', 'Élevée'),
+    'Cholesterol Level': ('Normal', 'Haut')
+}
+EXPLAINED_COLUMNS = frozenset(FORM_FEATURE_FIELDS.values())
+
+explain_seconds = REGISTRY.histogram('explanation_seconds', 'ShapValues computation time per call', ('kind',))
+explanations_total = REGISTRY.counter('explanations_total', 'Explained feature vectors', ('outcome',))
+
+
+def value_label(column, value):
+    labels = VALUE_LABELS.get(column)
+    if labels is not None and float(value).is_integer() and 0 <= int(value) < len(labels):
+        return labels[int(value)]
+    if column == 'Age':
+        return f"{value:g} ans"
+    return f"{value:g}"
+
+
+def shap_values(model, matrix, feature_names):
+    """ShapValues of every row of `matrix`, as an array of shape [rows, classes, features + 1]."""
+    # catboost is already loaded with the model; the import is only needed for Pool
+    from catboost import Pool
+
+    # The current streams: CatBoost warns when another thread holds its logger and these differ
+    values = np.asarray(model.get_feature_importance(Pool(matrix, feature_names=feature_names),
+                                                     type='ShapValues', log_cout=sys.stdout, log_cerr=sys.stderr))
+    if values.ndim == 2:
+        # Binary models explain the raw score of class 1 only; class 0 gets its opposite
+        values = np.stack([-values, values], axis=1)
+    return values
+
+
+def contributions(feature_names, row, values, disease_class):
+    """The explanation of one row for `disease_class` (`values`: its ShapValues for that class)."""
+    items = [{
+        'feature': column,
+        'label': FEATURE_LABELS.get(column, column),
+        'valeur': value_label(column, row[j]),
+        'contribution': round(float(values[j]), 4)
+    } for j, column in enumerate(feature_names) if column in EXPLAINED_COLUMNS]
+    items.sort(key=lambda item: abs(item['contribution']), reverse=True)
+    return {'classe': disease_class, 'base': round(float(values[-1]), 4), 'contributions': items}
+
+
+class ExplanationService:
+    """Cache and background queue of explanations, keyed by (model version, feature tuple)."""
+
+    def __init__(self, cache_size=4096, max_pending=1024, batch_size=256):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._cache = LRUCache(cache_size)
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @staticmethod
+    def key(version_name, vector):
+        return version_name, tuple(float(v) for v in np.ravel(vector))
+
+    def lookup(self, version_name, vector):
+        """The cached explanation of `vector` under `version_name`, or None."""
+        return self._cache.get(self.key(version_name, vector))
+
+    def is_pending(self, version_name, vector):
+        with self._condition:
+            return self.key(version_name, vector) in self._pending
+
+    def submit(self, version, vector):
+        """Queue `vector` (one row) for explanation by `version`. False if the queue is full."""
+        key = self.key(version.version, vector)
+        if self._cache.get(key) is not None:
+            return True
+        with self._condition:
+            if key in self._pending:
+                return True
+            if len(self._pending) >= self.max_pending:
+                explanations_total.inc('dropped')
+                return False
+            self._pending[key] = version
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='explanations', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+        return True
+
+    def wait(self, version_name, vector, timeout):
+        """Wait up to `timeout` seconds for a submitted explanation. None if it is not ready."""
+        key = self.key(version_name, vector)
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                explanation = self._cache.get(key)
+                remaining = deadline - time.monotonic()
+                if explanation is not None or key not in self._pending or remaining <= 0:
+                    return explanation
+                self._condition.wait(remaining)
+
+    def explain_matrix(self, version, matrix, disease_classes=None, kind='batch'):
+        """Explanations of every row of `matrix` for its predicted class (or `disease_classes`).
+
+        Rows missing from the cache are explained with a single ShapValues call.
+        """
+        runtime = version.runtime
+        keys = [self.key(version.version, row) for row in matrix]
+        explanations = [self._cache.get(key) for key in keys]
+        # First row of each distinct vector missing from the cache
+        missing = {}
+        for i, explanation in enumerate(explanations):
+            if explanation is None:
+                missing.setdefault(keys[i], i)
+        explanations_total.inc('cached', amount=sum(e is not None for e in explanations))
+        if missing:
+            indices = list(missing.values())
+            rows = matrix[indices]
+            if disease_classes is None:
+                classes = runtime.predict_matrix(rows)[0]
+            else:
+                classes = [disease_classes[i] for i in indices]
+            with explain_seconds.time(kind):
+                values = shap_values(version.model, rows, runtime.feature_names)
+            class_index = {disease_class: c for c, disease_class in enumerate(runtime.classes)}
+            computed = {}
+            for k, key in enumerate(missing):
+                disease_class = str(classes[k])
+                computed[key] = contributions(runtime.feature_names, rows[k], values[k][class_index[disease_class]],
+                                              disease_class)
+                self._cache.put(key, computed[key])
+            explanations = [computed[key] if explanation is None else explanation
+                            for key, explanation in zip(keys, explanations)]
+            explanations_total.inc('computed', amount=len(missing))
+        return explanations
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                # Left in the queue until computed, so wait() keeps waiting for them
+                batch = list(islice(self._pending.items(), self.batch_size))
+            by_version = OrderedDict()
+            for key, version in batch:
+                by_version.setdefault(version, []).append(key)
+            for version, keys in by_version.items():
+                try:
+                    self.explain_matrix(version, np.array([key[1] for key in keys], dtype=np.float64), kind='async')
+                except Exception as e:
+                    print(f"Warning: could not explain {len(keys)} prediction(s): {e}")
+            with self._condition:
+                for key, _ in batch:
+                    self._pending.pop(key, None)
+                self._condition.notify_all()
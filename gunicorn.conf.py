@@ -0,0 +1,35 @@
+"""Gunicorn settings for running several workers against the same data directory.
+
+Usage (from project root):
+  gunicorn 'app:create_app()'
+
+- SHARED_STATE=1 makes every JSON file update take a cross-process lock and
+  reload the file first, so doctors, password reset tokens and services stay
+  coherent between workers (see persistence.py).
+- PRELOAD_MODEL=1 with preload_app unpickles the model once in the master;
+  workers inherit it copy-on-write. The master runs no prediction: CatBoost
+  starts its native thread pool on the first one, and threads do not survive
+  fork. Each worker therefore warms the model up (and builds the optional
+  prediction table) in post_fork, then starts its file watchers.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('SHARED_STATE', '1')
+os.environ.setdefault('PRELOAD_MODEL', '1')
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+# The activity stream (SSE) holds a request thread per open dashboard; app.py caps the
+# streams of a worker at `threads` - 2 so logins and diagnoses always find a thread
+os.environ['SERVER_THREADS'] = str(threads)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+preload_app = os.environ.get('PRELOAD_MODEL') == '1'
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork: each preloaded worker warms up the model and starts its own watchers
+    if preload_app:
+        import app
+        app.start_worker()
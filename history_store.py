@@ -0,0 +1,302 @@
+"""Patient history storage backends.
+
+`result()` records one entry per diagnosis and the admin views read them back.
+Entries are plain dicts with the keys used by `data/patients.json`:
+nom, prenom, cin, age, sex, disease, doctor, service, date ('%d/%m/%Y %H:%M'),
+plus model_version (the model that produced the diagnosis; empty for older rows).
+
+Two backends share the `PatientHistoryStore` interface:
+- `SqliteHistoryStore` (default): WAL-mode SQLite database, indexed on doctor,
+  service, disease, CIN and date, no size cap.
+- `JsonHistoryStore`: the original newest-first JSON list, capped at 1000 entries,
+  written behind through `persistence.JsonPersistence`.
+
+Select one with `PATIENT_STORE=sqlite|json` (see `create_history_store`).
+
+Listings use `page()`, which takes filters (doctor, service, disease, cin,
+date_from, date_to as 'YYYY-MM-DD'), a sort key from `SORT_COLUMNS` and an opaque
+cursor returned by the previous page. SQLite pages are keyset-paginated on
+(sort column, id), so fetching page N costs the same as fetching page 1.
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from persistence import JsonPersistence
+
+
+ENTRY_FIELDS = ('nom', 'prenom', 'cin', 'age', 'sex', 'disease', 'doctor', 'service', 'date', 'model_version')
+DISPLAY_DATE_FORMAT = '%d/%m/%Y %H:%M'
+FILTER_FIELDS = ('doctor', 'service', 'disease', 'cin')
+# Public sort key -> column
+SORT_COLUMNS = {
+    'date': 'created_at',
+    'nom': 'nom',
+    'doctor': 'doctor',
+    'service': 'service',
+    'disease': 'disease'
+}
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, keyset=True):
+    """Decode a cursor: a [value, id] pair when `keyset`, else a non-negative offset."""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Curseur invalide')
+    if keyset:
+        valid = (isinstance(value, list) and len(value) == 2
+                 and isinstance(value[0], (str, int, float)) and not isinstance(value[0], bool)
+                 and isinstance(value[1], int) and not isinstance(value[1], bool))
+    else:
+        valid = isinstance(value, int) and not isinstance(value, bool) and value >= 0
+    if not valid:
+        raise ValueError('Curseur invalide')
+    return value
+
+
+def _sortable_date(display_date):
+    """Convert a '%d/%m/%Y %H:%M' date to ISO so it sorts and range-filters as text."""
+    try:
+        return datetime.strptime(display_date or '', DISPLAY_DATE_FORMAT).strftime('%Y-%m-%d %H:%M')
+    except ValueError:
+        return datetime.now().strftime('%Y-%m-%d %H:%M')
+
+
+class PatientHistoryStore(ABC):
+    """Interface for diagnosis history backends."""
+
+    @abstractmethod
+    def add(self, entry):
+        """Record one diagnosis entry. Returns its id, or None if the backend has no ids."""
+
+    def high_water_id(self):
+        """Highest entry id so far (0 when empty), or None if the backend has no ids."""
+        return None
+
+    @abstractmethod
+    def page(self, filters=None, sort='date', descending=True, cursor=None, limit=50):
+        """Return (entries, next_cursor); next_cursor is None on the last page."""
+
+    def iter_entries(self, filters=None, sort='date', descending=True, batch_size=500):
+        """Yield every matching entry page by page, holding at most one page in memory."""
+        cursor = None
+        while True:
+            entries, cursor = self.page(filters=filters, sort=sort, descending=descending,
+                                        cursor=cursor, limit=batch_size)
+            yield from entries
+            if cursor is None:
+                return
+
+    def recent(self, limit=100, doctor=None, service=None, disease=None, cin=None):
+        """Return up to `limit` entries, newest first, matching every given filter."""
+        filters = {'doctor': doctor, 'service': service, 'disease': disease, 'cin': cin}
+        return self.page(filters=filters, limit=limit)[0]
+
+    @abstractmethod
+    def count(self):
+        """Number of stored entries."""
+
+
+class JsonHistoryStore(PatientHistoryStore):
+    """Newest-first list in a JSON file (legacy layout), committed by the background writer."""
+
+    def __init__(self, path, persistence=None, max_entries=1000):
+        self.path = path
+        self.persistence = persistence or JsonPersistence()
+        self.max_entries = max_entries
+
+    def _load(self):
+        return self.persistence.read(self.path, default=[])
+
+    def add(self, entry):
+        def prepend(patients):
+            patients.insert(0, entry)
+            # keep most recent entries to avoid unbounded growth
+            del patients[self.max_entries:]
+        self.persistence.update(self.path, prepend, default=[])
+
+    def page(self, filters=None, sort='date', descending=True, cursor=None, limit=50):
+        # The legacy file is capped at 1000 rows, so filter in memory and page by offset
+        filters = filters or {}
+        date_from = filters.get('date_from')
+        date_to = filters.get('date_to')
+        matches = []
+        for p in self._load():
+            if not all(filters.get(key) in (None, '') or p.get(key) == filters[key] for key in FILTER_FIELDS):
+                continue
+            created = _sortable_date(p.get('date'))
+            if (date_from and created < date_from) or (date_to and created > date_to + ' 23:59'):
+                continue
+            matches.append(p)
+        if sort != 'date' or not descending:
+            column = sort if sort in SORT_COLUMNS and sort != 'date' else None
+            matches.sort(key=lambda p: str(p.get(column, '')) if column else _sortable_date(p.get('date')),
+                         reverse=descending)
+        offset = decode_cursor(cursor, keyset=False) if cursor else 0
+        rows = matches[offset:offset + limit]
+        next_cursor = encode_cursor(offset + limit) if offset + limit < len(matches) else None
+        return rows, next_cursor
+
+    def count(self):
+        return len(self._load())
+
+
+class SqliteHistoryStore(PatientHistoryStore):
+    """SQLite-backed history. One connection per thread; WAL lets readers run during writes."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT, prenom TEXT, cin TEXT, age TEXT, sex TEXT,
+            disease TEXT, doctor TEXT, service TEXT,
+            date TEXT,
+            created_at TEXT NOT NULL,
+            model_version TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_patients_doctor ON patients(doctor, created_at);
+        CREATE INDEX IF NOT EXISTS idx_patients_service ON patients(service, created_at);
+        CREATE INDEX IF NOT EXISTS idx_patients_disease ON patients(disease, created_at);
+        CREATE INDEX IF NOT EXISTS idx_patients_cin ON patients(cin);
+        CREATE INDEX IF NOT EXISTS idx_patients_created_at ON patients(created_at);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(self.SCHEMA)
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(patients)')}
+        if 'model_version' not in columns:
+            # Databases created before diagnoses recorded their model version
+            with conn:
+                conn.execute('ALTER TABLE patients ADD COLUMN model_version TEXT')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid != os.getpid():
+            # Inherited across fork (gunicorn preload): SQLite handles must not be shared
+            conn = None
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    INSERT = (f"INSERT INTO patients ({', '.join(ENTRY_FIELDS)}, created_at) "
+              f"VALUES ({', '.join('?' * (len(ENTRY_FIELDS) + 1))})")
+
+    @staticmethod
+    def _row_values(entry):
+        return tuple(str(entry.get(k, '') or '') for k in ENTRY_FIELDS) + (_sortable_date(entry.get('date')),)
+
+    def add(self, entry):
+        conn = self._connection()
+        with conn:
+            return conn.execute(self.INSERT, self._row_values(entry)).lastrowid
+
+    def high_water_id(self):
+        return self._connection().execute('SELECT COALESCE(MAX(id), 0) FROM patients').fetchone()[0]
+
+    def add_many(self, entries):
+        """Insert `entries` (oldest first) in a single transaction."""
+        conn = self._connection()
+        with conn:
+            conn.executemany(self.INSERT, (self._row_values(e) for e in entries))
+
+    @staticmethod
+    def _filter_clauses(filters):
+        clauses, params = [], []
+        for column in FILTER_FIELDS:
+            value = filters.get(column)
+            if value not in (None, ''):
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if filters.get('date_from'):
+            clauses.append('created_at >= ?')
+            params.append(filters['date_from'])
+        if filters.get('date_to'):
+            clauses.append('created_at <= ?')
+            params.append(filters['date_to'] + ' 23:59')
+        return clauses, params
+
+    def page(self, filters=None, sort='date', descending=True, cursor=None, limit=50):
+        column = SORT_COLUMNS.get(sort, 'created_at')
+        clauses, params = self._filter_clauses(filters or {})
+        op, order = ('<', 'DESC') if descending else ('>', 'ASC')
+        if cursor:
+            # Keyset pagination: resume strictly after the last (column, id) pair served
+            last_value, last_id = decode_cursor(cursor)
+            clauses.append(f'({column} {op} ? OR ({column} = ? AND id {op} ?))')
+            params += [last_value, last_value, last_id]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._connection().execute(
+            f'SELECT * FROM patients {where} ORDER BY {column} {order}, id {order} LIMIT ?',
+            params + [int(limit) + 1]).fetchall()
+        entries = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = entries[-1]
+            next_cursor = encode_cursor([last[column], last['id']])
+        return entries, next_cursor
+
+    def count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM patients').fetchone()[0]
+
+    def import_json(self, json_path):
+        """Copy every entry of a legacy newest-first patients.json into an empty table.
+
+        The emptiness check and the inserts share one `BEGIN IMMEDIATE` transaction, so
+        when several workers start on a new database only the first one imports.
+        Returns the number imported (0 if the table already had rows).
+        """
+        with open(json_path, 'r', encoding='utf-8') as pf:
+            patients = json.load(pf)
+        if not isinstance(patients, list):
+            return 0
+        entries = [p for p in reversed(patients) if isinstance(p, dict)]
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM patients LIMIT 1').fetchone() is not None:
+                conn.rollback()
+                return 0
+            conn.executemany(self.INSERT, (self._row_values(e) for e in entries))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return len(entries)
+
+
+def create_history_store(backend=None, data_dir='data', persistence=None):
+    """Build the store selected by `backend` or the PATIENT_STORE environment variable."""
+    backend = backend or os.environ.get('PATIENT_STORE', 'sqlite')
+    json_path = os.path.join(data_dir, 'patients.json')
+    if backend == 'json':
+        return JsonHistoryStore(json_path, persistence=persistence)
+
+    db_path = os.environ.get('PATIENT_DB_PATH', os.path.join(data_dir, 'patients.db'))
+    fresh = not os.path.exists(db_path)
+    store = SqliteHistoryStore(db_path)
+    if fresh and os.path.exists(json_path):
+        # First start on SQLite: carry the existing JSON history over once
+        try:
+            imported = store.import_json(json_path)
+            if imported:
+                print(f"Imported {imported} patients from {json_path} into {db_path}")
+        except Exception as e:
+            print(f"Warning: could not import {json_path}: {e}")
+    return store
@@ -0,0 +1,66 @@
+"""Conditional JSON responses (ETag / Last-Modified / 304) for the admin APIs.
+
+`PayloadCache.get(name, revision, build)` keeps the serialized body of each API
+together with its validators, and calls `build()` (which loads and shapes the
+data) only when `revision` (from `JsonPersistence.revision`, a stat() when the
+file is unchanged) differs from the cached one. `conditional_json` then answers
+`If-None-Match` / `If-Modified-Since` with a bodyless 304, so a repeat fetch
+costs a stat and a string comparison: no file read, no deduplication, no JSON
+encoding.
+
+The ETag is a hash of the body, so every worker process serving the same data
+hands out the same tag, whatever its local revision counter.
+"""
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+from flask import current_app, request
+
+
+class CachedPayload:
+    __slots__ = ('revision', 'body', 'etag', 'last_modified')
+
+    def __init__(self, revision, body, last_modified):
+        self.revision = revision
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.last_modified = last_modified
+
+
+class PayloadCache:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, revision, build):
+        """The CachedPayload of `name` at `revision`, building it with `build()` if needed."""
+        entry = self._entries.get(name)
+        if entry is not None and entry.revision == revision:
+            return entry
+        body = current_app.json.dumps(build()).encode('utf-8')
+        entry = CachedPayload(revision, body, datetime.now(timezone.utc).replace(microsecond=0))
+        with self._lock:
+            current = self._entries.get(name)
+            if current is not None and current.revision == revision and current.etag == entry.etag:
+                # Another thread built the same version first: keep its Last-Modified
+                return current
+            self._entries[name] = entry
+        return entry
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+
+def conditional_json(entry):
+    """200 with `entry`'s body and validators, or 304 if the client's copy is current."""
+    response = current_app.response_class(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    # Private (admin data) and always revalidated, which is what the 304s make cheap
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
@@ -0,0 +1,206 @@
+"""Preloaded inference runtime around the CatBoost model.
+
+`/result` used to build a one-row pandas DataFrame per request, reorder it with
+`model.feature_names_` and call both `predict` and `predict_proba`. The runtime
+resolves the feature order once, fills a reusable numpy buffer straight from the
+form and derives the class and the confidence from a single `predict_proba` call.
+
+Optionally the runtime precomputes a `PredictionTable` over every input the
+diagnostic form can produce, so most predictions become array lookups, and keeps
+a bounded LRU cache for the remaining (out-of-range) inputs.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Form field name -> model feature column. Rows sent to the batch API may use either spelling.
+FORM_FEATURE_FIELDS = {
+    'fever': 'Fever',
+    'cough': 'Cough',
+    'fatigue': 'Fatigue',
+    'difficulty_breathing': 'Difficulty Breathing',
+    'age': 'Age',
+    'gender': 'Gender',
+    'blood_pressure': 'Blood Pressure',
+    'cholesterol_level': 'Cholesterol Level'
+}
+
+# Inclusive integer bounds of each feature as collected by templates/index.html.
+# The precomputed table covers the cartesian product of these ranges.
+TABLE_DOMAINS = {
+    'Fever': (0, 1),
+    'Cough': (0, 1),
+    'Fatigue': (0, 1),
+    'Difficulty Breathing': (0, 1),
+    'Age': (0, 150),
+    'Gender': (0, 1),
+    'Blood Pressure': (0, 2),
+    'Cholesterol Level': (0, 1)
+}
+
+
+def _field_value(row, field, column):
+    raw = row.get(field, row.get(column))
+    if raw is None or raw == '':
+        return 0.0
+    return float(raw)
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping of feature tuples to (disease_class, confidence)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PredictionTable:
+    """Best class and confidence for every point of the `TABLE_DOMAINS` grid.
+
+    Rows are laid out in C order over the table axes, so a feature vector maps to
+    its row with one dot product against `strides`. Features outside the domains
+    (the dummy 'Outcome Variable') are held at 0, as the form never sets them.
+    """
+
+    def __init__(self, model, feature_names, domains=None):
+        domains = TABLE_DOMAINS if domains is None else domains
+        n_features = len(feature_names)
+        self.columns = np.array([j for j, name in enumerate(feature_names) if name in domains], dtype=np.intp)
+        self.fixed = np.array([j for j in range(n_features) if feature_names[j] not in domains], dtype=np.intp)
+        self.low = np.array([domains[feature_names[j]][0] for j in self.columns], dtype=np.float64)
+        self.high = np.array([domains[feature_names[j]][1] for j in self.columns], dtype=np.float64)
+        shape = tuple(int(h - l) + 1 for l, h in zip(self.low, self.high))
+        self.strides = np.array([int(np.prod(shape[k + 1:])) for k in range(len(shape))], dtype=np.int64)
+
+        grid = np.zeros((int(np.prod(shape)), n_features), dtype=np.float64)
+        grid[:, self.columns] = np.indices(shape).reshape(len(shape), -1).T + self.low
+        probabilities = model.predict_proba(grid)
+        best = probabilities.argmax(axis=1)
+        self.best = best.astype(np.int16)
+        self.confidence = (probabilities[np.arange(len(best)), best] * 100).astype(np.float32)
+
+    def __len__(self):
+        return len(self.best)
+
+    def rows_for(self, matrix):
+        """Return table row indices for `matrix`, with -1 where a row falls outside the grid."""
+        values = matrix[:, self.columns]
+        inside = ((values == np.floor(values)) & (values >= self.low) & (values <= self.high)).all(axis=1)
+        if len(self.fixed):
+            inside &= (matrix[:, self.fixed] == 0).all(axis=1)
+        rows = np.full(len(matrix), -1, dtype=np.int64)
+        rows[inside] = (values[inside] - self.low).astype(np.int64) @ self.strides
+        return rows
+
+
+class InferenceRuntime:
+    """Wraps a loaded CatBoost model with a cached feature layout.
+
+    Columns the form does not provide (e.g. the dummy 'Outcome Variable') stay at 0.
+    Each thread gets its own one-row buffer so concurrent requests never share state.
+    With `precompute=True` predictions are served from a `PredictionTable`, falling
+    back to an LRU cache of `cache_size` entries and then to the model itself.
+    """
+
+    def __init__(self, model, precompute=False, cache_size=4096):
+        self.model = model
+        self.feature_names = list(model.feature_names_)
+        self.classes = [str(int(c)) for c in model.classes_]
+        self._slots = [(self.feature_names.index(column), field, column)
+                       for field, column in FORM_FEATURE_FIELDS.items()
+                       if column in self.feature_names]
+        self._local = threading.local()
+        self.table = PredictionTable(model, self.feature_names) if precompute else None
+        self.cache = LRUCache(cache_size) if precompute else None
+
+    def _buffer(self):
+        buf = getattr(self._local, 'buffer', None)
+        if buf is None:
+            buf = np.zeros((1, len(self.feature_names)), dtype=np.float64)
+            self._local.buffer = buf
+        # CatBoost marks arrays it predicts on as read-only; the buffer is ours to refill
+        buf.flags.writeable = True
+        return buf
+
+    def vector_from_form(self, form):
+        """Fill and return this thread's feature buffer from a form-like mapping."""
+        buf = self._buffer()
+        row = buf[0]
+        for j, field, column in self._slots:
+            row[j] = _field_value(form, field, column)
+        return buf
+
+    def matrix_from_rows(self, rows):
+        """Build an (n_rows, n_features) matrix from a list of row dicts."""
+        matrix = np.zeros((len(rows), len(self.feature_names)), dtype=np.float64)
+        for j, field, column in self._slots:
+            for i, row in enumerate(rows):
+                try:
+                    matrix[i, j] = _field_value(row, field, column)
+                except (TypeError, ValueError):
+                    raise ValueError(f"Ligne {i + 1}: valeur invalide pour '{field}'")
+        return matrix
+
+    def _predict_vector(self, vector):
+        probabilities = self.model.predict_proba(vector)[0]
+        best = int(probabilities.argmax())
+        return self.classes[best], float(probabilities[best]) * 100
+
+    def predict_form(self, form):
+        """Return (disease_class, confidence_percent) for one diagnostic form."""
+        return self.predict_vector(self.vector_from_form(form))
+
+    def predict_vector(self, vector):
+        """Return (disease_class, confidence_percent) for a (1, n_features) vector from `vector_from_form`."""
+        if self.table is None:
+            return self._predict_vector(vector)
+
+        row = int(self.table.rows_for(vector)[0])
+        if row >= 0:
+            return self.classes[self.table.best[row]], float(self.table.confidence[row])
+        key = tuple(vector[0].tolist())
+        cached = self.cache.get(key)
+        if cached is None:
+            cached = self._predict_vector(vector)
+            self.cache.put(key, cached)
+        return cached
+
+    def predict_matrix(self, matrix):
+        """Return (disease_classes, confidence_percents) for every row of `matrix`."""
+        best = np.zeros(len(matrix), dtype=np.int64)
+        confidences = np.zeros(len(matrix), dtype=np.float64)
+        pending = np.arange(len(matrix))
+        if self.table is not None:
+            rows = self.table.rows_for(matrix)
+            hits = rows >= 0
+            best[hits] = self.table.best[rows[hits]]
+            confidences[hits] = self.table.confidence[rows[hits]]
+            pending = pending[~hits]
+        if len(pending):
+            probabilities = self.model.predict_proba(matrix[pending])
+            top = probabilities.argmax(axis=1)
+            best[pending] = top
+            confidences[pending] = probabilities[np.arange(len(top)), top] * 100
+        return [self.classes[k] for k in best], confidences.tolist()
@@ -0,0 +1,286 @@
+"""Model registry: versioned, warmed-up CatBoost models swapped in without downtime.
+
+The app used to unpickle `models/CatBoost_best_model.pkl` and read
+`models/disease_mapping.json` once at import, so deploying a retrained model
+meant restarting every worker. `ModelRegistry` holds the active `ModelVersion`
+(model, `InferenceRuntime`, disease mapping and the `DiseaseCatalog` compiled
+from it) and a background thread watches both files:
+
+- a changed file is loaded only once its size and mtime are stable across two
+  checks, so a model still being copied is never unpickled;
+- the new runtime is warmed up with synthetic predictions before it is used;
+- the swap is a single reference assignment, so requests see either the old or
+  the new version, never a mix. A version that fails to load or warm up is
+  rejected and the previous one keeps serving.
+
+Versions are identified by the first 12 hex digits of the SHA-256 of the model
+file, so every worker serving the same file reports the same version.
+
+Nothing is loaded at construction: `start()` loads the first version on the
+watcher thread, and `current(wait=...)` starts it on demand. numpy, CatBoost and
+the model are therefore only imported once a worker actually needs them. Call
+`load()` to load synchronously instead. Before forking workers, use
+`load(warm_up=False)`: the model is only unpickled, no prediction runs, so
+CatBoost has started no threads in the parent; each worker then calls
+`warm_up_current()` after the fork.
+"""
+import hashlib
+import json
+import os
+import pickle
+import random
+import threading
+import time
+from datetime import datetime
+
+from disease_catalog import DiseaseCatalog
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+class ModelVersion:
+    __slots__ = ('version', 'model', 'runtime', 'disease_mapping', 'mapping_version', 'catalog',
+                 'loaded_at', 'warmup_ms')
+
+    def __init__(self, version, model, runtime, disease_mapping, mapping_version):
+        self.version = version
+        self.model = model
+        self.runtime = runtime
+        self.disease_mapping = disease_mapping
+        self.mapping_version = mapping_version
+        self.catalog = DiseaseCatalog(disease_mapping, mapping_version)
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+        self.warmup_ms = None
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'mapping_version': self.mapping_version,
+            'loaded_at': self.loaded_at,
+            'warmup_ms': self.warmup_ms,
+            'classes': len(self.runtime.classes),
+            'catalog_diseases': len(self.catalog),
+            'prediction_table': self.runtime.table is not None
+        }
+
+
+def synthetic_forms(count, seed=0):
+    """Random diagnostic forms spanning the input domains, for warm-up."""
+    from inference import FORM_FEATURE_FIELDS, TABLE_DOMAINS
+
+    rng = random.Random(seed)
+    columns = {column: field for field, column in FORM_FEATURE_FIELDS.items()}
+    return [{columns[column]: str(rng.randint(low, high)) for column, (low, high) in TABLE_DOMAINS.items()}
+            for _ in range(count)]
+
+
+class ModelRegistry:
+    def __init__(self, model_path, mapping_path, precompute=False, cache_size=4096,
+                 check_interval=2.0, warmup_predictions=32):
+        self.model_path = model_path
+        self.mapping_path = mapping_path
+        self.precompute = precompute
+        self.cache_size = cache_size
+        self.check_interval = check_interval
+        self.warmup_predictions = warmup_predictions
+        self._current = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._signatures = (None, None)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        # Set once the first load attempt has finished, successfully or not
+        self._first_load_done = threading.Event()
+        self.state = 'starting'  # starting | loading | warming | loaded (not warmed up) | ready | failed
+        self.last_error = None
+        self.swaps = 0
+
+    # -- access ----------------------------------------------------------
+
+    def current(self, wait=None):
+        """The active ModelVersion, or None before the first successful load.
+
+        With `wait` (seconds), start the registry if needed and block until the
+        first load attempt finishes or the timeout expires.
+        """
+        if self._current is None and wait:
+            self.start()
+            self._first_load_done.wait(wait)
+        return self._current
+
+    def on_swap(self, callback):
+        """Call `callback(version)` after every swap (and now, if a version is active)."""
+        self._listeners.append(callback)
+        if self._current is not None:
+            callback(self._current)
+
+    def is_ready(self):
+        return self._current is not None
+
+    def status(self):
+        current = self._current
+        return {
+            'ready': current is not None,
+            'state': self.state,
+            'model': current.to_dict() if current else None,
+            'swaps': self.swaps,
+            'last_error': self.last_error
+        }
+
+    # -- loading ---------------------------------------------------------
+
+    def _read_mapping(self):
+        with open(self.mapping_path, 'rb') as f:
+            data = f.read()
+        return json.loads(data.decode('utf-8')), hashlib.sha256(data).hexdigest()[:12]
+
+    def _read_model(self):
+        with open(self.model_path, 'rb') as f:
+            data = f.read()
+        return pickle.loads(data), hashlib.sha256(data).hexdigest()[:12]
+
+    def warm_up(self, version):
+        """Run synthetic predictions through the new runtime before it serves requests."""
+        start = time.perf_counter()
+        runtime = version.runtime
+        forms = synthetic_forms(self.warmup_predictions)
+        for form in forms:
+            disease_class, _ = runtime.predict_form(form)
+            if disease_class not in runtime.classes:
+                raise ValueError(f'classe inattendue: {disease_class}')
+        runtime.predict_matrix(runtime.matrix_from_rows(forms))
+        version.warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    def load(self, warm_up=True):
+        """Load, warm up and activate the files on disk now. Returns True on success.
+
+        With `warm_up=False` the model is activated without running any prediction (no
+        warm-up, no prediction table); `warm_up_current()` finishes it later.
+        """
+        try:
+            return self._load(warm_up)
+        finally:
+            self._first_load_done.set()
+
+    def warm_up_current(self):
+        """Build the prediction table of a version activated by `load(warm_up=False)` and warm it up.
+
+        Failures are logged and leave the unwarmed version serving: it predicts without the table.
+        """
+        from inference import InferenceRuntime
+
+        with self._lock:
+            current = self._current
+            if current is None or current.warmup_ms is not None:
+                return
+            self.state = 'warming'
+        # The table build takes seconds: outside the lock so status() and the watcher are not held up
+        try:
+            runtime = InferenceRuntime(current.model, precompute=self.precompute, cache_size=self.cache_size)
+            version = ModelVersion(current.version, current.model, runtime,
+                                   current.disease_mapping, current.mapping_version)
+            self.warm_up(version)
+        except Exception as e:
+            with self._lock:
+                self.last_error = f'{type(e).__name__}: {e}'
+                self.state = 'ready'
+            print(f"Warning: could not warm up model version {current.version}: {self.last_error}")
+            return
+        with self._lock:
+            latest = self._current
+            if latest.model is not current.model:
+                # Swapped meanwhile by the watcher: the new model was loaded warmed up
+                return
+            # Keep a disease mapping reloaded meanwhile
+            warmed = ModelVersion(latest.version, latest.model, runtime, latest.disease_mapping, latest.mapping_version)
+            warmed.warmup_ms = version.warmup_ms
+            self._current = version = warmed
+            self.last_error = None
+            self.state = 'ready'
+        print(f"Model version {version.version} warmed up ({version.warmup_ms} ms)")
+
+    def _load(self, warm_up=True):
+        # numpy/CatBoost are imported here, on the first load, rather than with the app
+        from inference import InferenceRuntime
+
+        with self._lock:
+            signatures = (_signature(self.model_path), _signature(self.mapping_path))
+            current = self._current
+            try:
+                self.state = 'loading'
+                disease_mapping, mapping_version = self._read_mapping()
+                if current is not None and signatures[0] == self._signatures[0]:
+                    # Only the mapping changed: keep the warmed runtime
+                    version = ModelVersion(current.version, current.model, current.runtime,
+                                           disease_mapping, mapping_version)
+                    version.warmup_ms = current.warmup_ms
+                else:
+                    if signatures[0] is None:
+                        raise FileNotFoundError(self.model_path)
+                    model, model_version = self._read_model()
+                    # The prediction table is built with predictions too, so it waits for the warm-up
+                    runtime = InferenceRuntime(model, precompute=self.precompute and warm_up,
+                                               cache_size=self.cache_size)
+                    version = ModelVersion(model_version, model, runtime, disease_mapping, mapping_version)
+                    if warm_up:
+                        self.state = 'warming'
+                        self.warm_up(version)
+            except Exception as e:
+                self.last_error = f'{type(e).__name__}: {e}'
+                self.state = 'ready' if current is not None else 'failed'
+                print(f"Warning: could not load model {self.model_path}: {self.last_error}")
+                # Remember the files so a broken deploy is not retried every check
+                self._signatures = signatures
+                return False
+
+            self._signatures = signatures
+            self._current = version
+            self.swaps += 1
+            self.last_error = None
+            self.state = 'ready' if version.warmup_ms is not None else 'loaded'
+        warmed = f"warm-up {version.warmup_ms} ms" if version.warmup_ms is not None else "not warmed up yet"
+        print(f"Model version {version.version} active (mapping {version.mapping_version}, {warmed})")
+        for callback in self._listeners:
+            try:
+                callback(version)
+            except Exception as e:
+                print(f"Warning: model swap listener failed: {e}")
+        return True
+
+    # -- watching --------------------------------------------------------
+
+    def start(self):
+        """Load the first version (if none is active) and watch the files, from a daemon thread."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._watch, name='model-registry', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _watch(self):
+        if self._current is None:
+            self.load()
+        previous = None
+        while not self._stopping.wait(self.check_interval):
+            signatures = (_signature(self.model_path), _signature(self.mapping_path))
+            if signatures == self._signatures:
+                previous = None
+                continue
+            if signatures != previous:
+                # Changed since the last check: wait until the files stop changing
+                previous = signatures
+                continue
+            previous = None
+            print("Model files changed on disk, loading new version")
+            self.load()
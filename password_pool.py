@@ -0,0 +1,157 @@
+"""Password hashing and verification on a bounded process pool.
+
+Password hashes (`scrypt:32768:8:1`, `pbkdf2:sha256:600000`) take tens of
+milliseconds of CPU each, by design. Run on the request threads, a burst of logins at shift change
+occupies every request thread and core of the web workers, and diagnoses queue
+behind them. `PasswordPool` moves the work to a few separate processes:
+
+- at most `max_pending` hashes/verifications are queued or running; past that,
+  `verify` and `hash` raise `PoolBusy` at once instead of queueing, so the caller
+  can answer "retry later" while the request threads stay free;
+- the pool processes run at a lower scheduling priority (`nice`), so under
+  saturation the OS still favours the web workers serving diagnoses;
+- the processes are started on first use, from a clean forkserver (spawn where
+  it is unavailable) rather than forked from a threaded web worker, and a pool
+  whose process died is replaced on the next call.
+
+With `workers=0` the work runs on the calling thread (still bounded by
+`max_pending`), e.g. on platforms where a process pool is not wanted.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Forking a web worker copies its threads' held locks into the child: start pool processes clean
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class PoolBusy(Exception):
+    """Raised when too many password operations are already waiting."""
+
+
+def _lower_priority(increment):
+    try:
+        os.nice(increment)
+    except (AttributeError, OSError):
+        pass
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+def _hash(password):
+    return generate_password_hash(password)
+
+
+def hash_passwords(passwords, workers=None, nice=5):
+    """Hash `passwords` in parallel on a dedicated pool of `workers` processes, in order.
+
+    For bulk imports: the batch gets its own short-lived processes so it does not
+    queue in front of the logins waiting on a `PasswordPool`.
+    """
+    passwords = list(passwords)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(passwords)))
+    if workers == 1:
+        return [_hash(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD),
+                             initializer=_lower_priority, initargs=(nice,)) as executor:
+        return list(executor.map(_hash, passwords, chunksize=chunksize))
+
+
+class PasswordPool:
+    def __init__(self, workers=2, max_pending=32, timeout=10.0, nice=5):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.nice = nice
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context(POOL_START_METHOD),
+                                                     initializer=_lower_priority, initargs=(self.nice,))
+            return self._executor
+
+    def _reset_executor(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusy()
+        with self._lock:
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def _call(self, fn, *args):
+        self._acquire()
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                self._release()
+        executor = self._get_executor()
+        try:
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # A pool process died (e.g. OOM-killed) since the last call: start a fresh pool
+                self._reset_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        # The slot is held until the work finishes, even if this caller stops waiting
+        future.add_done_callback(self._release)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            raise PoolBusy()
+        except BrokenProcessPool:
+            print("Warning: password pool process died, restarting the pool")
+            self._reset_executor(executor)
+            raise PoolBusy()
+
+    def verify(self, pwhash, password):
+        """`check_password_hash(pwhash, password)` on the pool. Raises PoolBusy when saturated."""
+        if not pwhash or password is None:
+            return False
+        return self._call(_verify, pwhash, password)
+
+    def hash(self, password):
+        """`generate_password_hash(password)` on the pool. Raises PoolBusy when saturated."""
+        return self._call(_hash, password)
+
+    def depth(self):
+        """Operations currently queued or running."""
+        return self._pending
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
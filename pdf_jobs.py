@@ -0,0 +1,223 @@
+"""PDF rendering jobs and on-disk cache.
+
+Report rendering used to run inline in the request handler. Reports now go
+through `PdfJobQueue`, which renders documents with a `reports.ReportRenderer`:
+
+- the renderer's document (the report HTML or data) is hashed with SHA-256,
+  together with the backend's cache namespace;
+- if `PdfCache` already holds that hash the job completes immediately;
+- otherwise the job runs on a small bounded worker pool, so a burst of PDF
+  downloads never occupies more than `workers` renderers, and submissions beyond
+  `max_pending` are rejected with `QueueFull` instead of piling up;
+- identical reports requested while a render is in flight share that job.
+
+The cache evicts least recently used files once it exceeds `max_bytes`.
+Renders are timed in `pdf_render_seconds` and submissions counted by outcome in
+`pdf_jobs_total` (see metrics.py).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import REGISTRY
+
+pdf_render_seconds = REGISTRY.histogram('pdf_render_seconds', 'Time spent rendering a PDF report',
+                                        ('backend', 'status'))
+pdf_jobs_total = REGISTRY.counter('pdf_jobs_total', 'PDF job submissions by outcome', ('outcome',))
+
+
+class QueueFull(Exception):
+    """Raised when too many PDF jobs are already waiting."""
+
+
+def content_key(document, namespace=''):
+    digest = hashlib.sha256(namespace.encode('utf-8') + b'\0')
+    digest.update(document.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PdfCache:
+    """Directory of `<sha256>.pdf` files bounded by total size (LRU by mtime).
+
+    The directory is scanned on first use rather than at startup.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes = None
+        self._total = 0
+
+    def _index(self):
+        """Return the key -> size index, scanning the directory the first time. Caller holds the lock."""
+        if self._sizes is None:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith('.pdf'):
+                    st = os.stat(os.path.join(self.directory, name))
+                    entries.append((st.st_mtime, name[:-4], st.st_size))
+            self._sizes = OrderedDict((key, size) for _, key, size in sorted(entries))
+            self._total = sum(self._sizes.values())
+        return self._sizes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pdf')
+
+    def _lookup(self, key):
+        """Whether `key` is cached, adopting files written by other worker processes. Caller holds the lock."""
+        sizes = self._index()
+        if key not in sizes:
+            try:
+                size = os.stat(self._path(key)).st_size
+            except OSError:
+                return False
+            sizes[key] = size
+            self._total += size
+        sizes.move_to_end(key)
+        return True
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key)
+
+    def get(self, key):
+        """Return the cached PDF bytes for `key`, or None."""
+        with self._lock:
+            if not self._lookup(key):
+                return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+            os.utime(self._path(key))
+            return data
+        except OSError:
+            with self._lock:
+                self._total -= self._sizes.pop(key, 0)
+            return None
+
+    def put(self, key, data):
+        with self._lock:
+            sizes = self._index()
+        fd, tmp_path = tempfile.mkstemp(prefix='.pdf-', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._total += len(data) - sizes.pop(key, 0)
+            sizes[key] = len(data)
+            while self._total > self.max_bytes and len(sizes) > 1:
+                old_key, size = sizes.popitem(last=False)
+                self._total -= size
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def size(self):
+        with self._lock:
+            self._index()
+            return self._total
+
+
+class PdfJob:
+    __slots__ = ('id', 'key', 'owner', 'filename', 'status', 'error', 'created', 'done')
+
+    def __init__(self, key, owner, filename=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.owner = owner
+        self.filename = filename
+        self.status = 'pending'
+        self.error = None
+        self.created = time.time()
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {'id': self.id, 'status': self.status, 'error': self.error}
+
+
+class PdfJobQueue:
+    def __init__(self, renderer, cache, workers=2, max_pending=32, max_jobs=1000):
+        self.renderer = renderer
+        self.cache = cache
+        self.max_pending = max_pending
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pdf')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._inflight = {}
+        self._pending = 0
+
+    def submit(self, document, owner=None, filename=None):
+        """Queue a render of `document` and return its PdfJob (already done on a cache hit)."""
+        key = content_key(document, self.renderer.cache_namespace())
+        job = PdfJob(key, owner, filename)
+        with self._lock:
+            if key in self.cache:
+                job.status = 'done'
+                job.done.set()
+                self._remember(job)
+                pdf_jobs_total.inc('cached')
+                return job
+            followers = self._inflight.get(key)
+            if followers is not None:
+                # Same report already rendering: complete together with it
+                job.status = followers[0].status
+                followers.append(job)
+                self._remember(job)
+                pdf_jobs_total.inc('shared')
+                return job
+            if self._pending >= self.max_pending:
+                pdf_jobs_total.inc('rejected')
+                raise QueueFull('Trop de PDF en attente')
+            self._pending += 1
+            self._inflight[key] = [job]
+            self._remember(job)
+        pdf_jobs_total.inc('queued')
+        self._executor.submit(self._run, key, document)
+        return job
+
+    def _remember(self, job):
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def _run(self, key, document):
+        with self._lock:
+            for job in self._inflight.get(key, []):
+                job.status = 'running'
+        error = None
+        start = time.perf_counter()
+        try:
+            self.cache.put(key, self.renderer.render(document))
+        except Exception as e:
+            print(f"Error generating PDF: {e}")
+            error = str(e)
+        pdf_render_seconds.observe(time.perf_counter() - start, self.renderer.name or type(self.renderer).__name__,
+                                   'error' if error else 'ok')
+        with self._lock:
+            self._pending -= 1
+            followers = self._inflight.pop(key, [])
+        for job in followers:
+            job.status = 'error' if error else 'done'
+            job.error = error
+            job.done.set()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def result(self, job):
+        """PDF bytes of a finished job (None if it failed or the file was evicted)."""
+        return self.cache.get(job.key) if job.status == 'done' else None
+
+    def depth(self):
+        with self._lock:
+            return self._pending
@@ -0,0 +1,265 @@
+"""Write-behind persistence for the JSON data files under `data/`.
+
+Request handlers used to read, modify and rewrite `services.json`, `medecins.json`,
+`patients.json` and `password_reset_tokens.json` synchronously, with no locking,
+so concurrent requests could overwrite each other's changes. `JsonPersistence`
+keeps the parsed document of each file in memory:
+
+- `read(path)` returns a copy of the current document (pending changes included);
+- `update(path, fn)` applies `fn(document)` under the file's lock and marks it dirty;
+- a background thread commits dirty documents every `interval` seconds, each file
+  through a temporary file and `os.replace`, so readers never see a partial file.
+
+Several mutations to the same file between two commits are written once. Pending
+changes are flushed at interpreter exit. Edits made to a file by other tools are
+picked up on the next access when nothing is pending for it.
+
+With several worker processes (`shared=True`, `SHARED_STATE=1`) write-behind would
+let one worker overwrite another's changes, so every `update` instead takes an
+exclusive lock on `<path>.lock`, reloads the file if another process changed it,
+applies the mutation and commits before releasing the lock. Files are compared by
+inode, mtime and size, so each commit (a new file via `os.replace`) is detected.
+
+Each file load and commit is timed in the `json_file_seconds` histogram (see
+metrics.py), labelled with the file name and `load` / `dump`.
+"""
+import atexit
+import copy
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development server only
+    fcntl = None
+
+json_file_seconds = REGISTRY.histogram('json_file_seconds', 'Time spent loading or writing a JSON data file',
+                                       ('file', 'op'))
+
+
+class _Document:
+    __slots__ = ('lock', 'data', 'dirty', 'mtime', 'revision', 'backed_up')
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = None
+        self.dirty = False
+        self.mtime = None
+        self.revision = 0
+        self.backed_up = False
+
+
+@contextmanager
+def _process_lock(path):
+    """Exclusive advisory lock shared by every process using `path`."""
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class JsonPersistence:
+    def __init__(self, interval=0.2, backup_paths=(), shared=False):
+        self.interval = interval
+        # Several processes write the same files: lock and commit on every update
+        self.shared = shared
+        # Files copied to `<path>.bak` once per process, before their first commit
+        self.backup_paths = {os.path.abspath(p) for p in backup_paths}
+        self._docs = {}
+        self._docs_lock = threading.Lock()
+        # Held for a whole flush so an older snapshot can never replace a newer one
+        self._commit_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    # -- documents -------------------------------------------------------
+
+    def _doc(self, path):
+        key = os.path.abspath(path)
+        with self._docs_lock:
+            doc = self._docs.get(key)
+            if doc is None:
+                doc = self._docs[key] = _Document()
+        return key, doc
+
+    @staticmethod
+    def _file_stamp(key):
+        try:
+            st = os.stat(key)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _ensure_loaded(self, key, doc, default):
+        """Load (or reload after an external edit) unless changes are pending. Caller holds doc.lock."""
+        if doc.dirty:
+            return
+        mtime = self._file_stamp(key)
+        if doc.data is not None and mtime == doc.mtime:
+            return
+        data = None
+        if mtime is not None:
+            try:
+                with json_file_seconds.time(os.path.basename(key), 'load'), open(key, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"Warning: could not load {key}: {e}")
+        if data is None or (default is not None and not isinstance(data, type(default))):
+            data = copy.deepcopy(default)
+        doc.data = data
+        doc.mtime = mtime
+        doc.revision += 1
+
+    def read(self, path, default=None):
+        """Return a deep copy of the current document at `path` (or of `default`)."""
+        key, doc = self._doc(path)
+        with doc.lock:
+            self._ensure_loaded(key, doc, default)
+            return copy.deepcopy(doc.data)
+
+    def update(self, path, mutate, default=None):
+        """Apply `mutate(document)` atomically and schedule a commit.
+
+        `mutate` edits the document in place and/or returns a replacement wrapped as
+        `Replace(new_document)`. Any other return value is passed back to the caller.
+        """
+        key, doc = self._doc(path)
+        if self.shared:
+            os.makedirs(os.path.dirname(key), exist_ok=True)
+            with doc.lock, _process_lock(key):
+                outcome = self._apply(key, doc, mutate, default)
+                self._commit(key, doc)
+            if doc.dirty:
+                # The commit failed; let the writer thread retry it
+                self._schedule()
+            return outcome
+        with doc.lock:
+            outcome = self._apply(key, doc, mutate, default)
+        self._schedule()
+        return outcome
+
+    def _apply(self, key, doc, mutate, default):
+        self._ensure_loaded(key, doc, default)
+        outcome = mutate(doc.data)
+        if isinstance(outcome, Replace):
+            doc.data = outcome.data
+            outcome = outcome.data
+        doc.dirty = True
+        doc.revision += 1
+        return outcome
+
+    def write(self, path, data):
+        """Replace the whole document at `path` and schedule a commit."""
+        return self.update(path, lambda _: Replace(data))
+
+    def revision(self, path, default=None):
+        """Monotonic counter bumped on every change or reload of `path` in this process."""
+        key, doc = self._doc(path)
+        with doc.lock:
+            self._ensure_loaded(key, doc, default)
+            return doc.revision
+
+    # -- committing ------------------------------------------------------
+
+    def _schedule(self):
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        self._wakeup.set()
+
+    def start(self):
+        with self._docs_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='json-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Let further mutations accumulate so they share one write
+            time.sleep(self.interval)
+            self.flush()
+
+    def _commit(self, key, doc):
+        start = time.perf_counter()
+        with doc.lock:
+            if not doc.dirty:
+                return
+            payload = json.dumps(doc.data, ensure_ascii=False, indent=4)
+            doc.dirty = False
+        try:
+            directory = os.path.dirname(key)
+            os.makedirs(directory, exist_ok=True)
+            if key in self.backup_paths and not doc.backed_up and os.path.exists(key):
+                shutil.copyfile(key, key + '.bak')
+                doc.backed_up = True
+            fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(key) + '.', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, key)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            json_file_seconds.observe(time.perf_counter() - start, os.path.basename(key), 'dump')
+            with doc.lock:
+                if not doc.dirty:
+                    doc.mtime = self._file_stamp(key)
+        except Exception as e:
+            print(f"Warning: could not persist {key}: {e}")
+            with doc.lock:
+                doc.dirty = True
+
+    def flush(self):
+        """Commit every dirty document now (called by the writer thread and at exit)."""
+        with self._commit_lock:
+            with self._docs_lock:
+                pending = [(k, d) for k, d in self._docs.items() if d.dirty]
+            for key, doc in pending:
+                self._commit(key, doc)
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+
+class Replace:
+    """Return value for `JsonPersistence.update` mutators that build a new document."""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+def create_persistence(data_dir='data', interval=None, shared=None):
+    """Persistence shared by the app, flushed automatically at interpreter exit."""
+    if interval is None:
+        interval = float(os.environ.get('PERSIST_INTERVAL', '0.2'))
+    if shared is None:
+        shared = os.environ.get('SHARED_STATE', '0') == '1'
+    persistence = JsonPersistence(interval=interval,
+                                  backup_paths=[os.path.join(data_dir, 'medecins.json')],
+                                  shared=shared)
+    atexit.register(persistence.stop)
+    return persistence
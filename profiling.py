@@ -0,0 +1,252 @@
+"""On-demand profiling of live requests, armed from the admin API.
+
+An admin arms a `ProfileSession` for one route (or every route) and for the
+next N requests, optionally only a `fraction` of them. Each selected request is
+profiled in one of two modes:
+
+- `sample` (default): a sampler thread reads the stack of the request's thread
+  every `interval` seconds (`sys._current_frames()`), so wall-clock time spent
+  waiting (locks, PDF jobs, I/O) shows up as well as CPU time. Samples are
+  aggregated per session into collapsed stacks (`route;frame;frame... count`
+  lines), the input format of flamegraph.pl, speedscope and similar tools.
+  Requests much shorter than `interval` collect few samples; profile more of
+  them (or lower PROFILER_INTERVAL) to get a representative picture;
+- `cprofile`: a `cProfile.Profile` runs for the request's thread; the stats of
+  every profiled request are merged and downloadable as a `.prof` file (for
+  pstats, snakeviz, ...).
+
+While no session is armed, the request hooks only read `armed`, a plain
+attribute, so the facility can stay installed in production. The sampler
+thread runs only while a sampled request is in flight.
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+MODES = ('sample', 'cprofile')
+# Requests profiled by a `fraction` session armed without a request count
+DEFAULT_FRACTION_REQUESTS = 100
+
+
+def _frame_label(code):
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+def collapse_stack(frame, root):
+    """The collapsed-stack line of `frame` (outermost frame first), prefixed with `root`."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(root)
+    return ';'.join(reversed(labels))
+
+
+class ProfileSession:
+    def __init__(self, route, mode, requests, fraction):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.mode = mode
+        self.remaining = requests
+        self.fraction = fraction
+        self.created = time.time()
+        self.status = 'armed'
+        self.profiled = 0
+        self.running = 0
+        self.seconds = 0.0
+        self.samples = 0
+        self.stacks = Counter()
+        self.stats = None
+
+    def matches(self, route):
+        return self.status == 'armed' and (self.route is None or self.route == route)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'route': self.route,
+            'mode': self.mode,
+            'fraction': self.fraction,
+            'remaining': self.remaining,
+            'status': self.status,
+            'profiled': self.profiled,
+            'running': self.running,
+            'seconds': round(self.seconds, 3),
+            'samples': self.samples,
+            'created': time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(self.created))
+        }
+
+
+class _Capture:
+    """One profiled request."""
+    __slots__ = ('session', 'root', 'thread_id', 'start', 'stacks', 'samples', 'profile')
+
+    def __init__(self, session, root):
+        self.session = session
+        self.root = root
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self.profile = None
+
+
+class RequestProfiler:
+    def __init__(self, interval=0.005, max_sessions=20):
+        self.interval = interval
+        self.max_sessions = max_sessions
+        # Read without the lock on every request: the whole cost while disarmed
+        self.armed = False
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._sampling = {}
+        self._sampler = None
+
+    # -- sessions --------------------------------------------------------
+
+    def arm(self, route=None, requests=None, fraction=None, mode='sample'):
+        """Profile the next `requests` requests to `route` (None: any route), or a `fraction` of them."""
+        if mode not in MODES:
+            raise ValueError(f"Mode inconnu '{mode}' (attendu : {', '.join(MODES)})")
+        if fraction is not None and not 0 < fraction <= 1:
+            raise ValueError('La fraction doit être comprise entre 0 et 1')
+        if requests is not None and requests < 1:
+            raise ValueError('Le nombre de requêtes doit être positif')
+        if requests is None:
+            requests = DEFAULT_FRACTION_REQUESTS if fraction is not None else 1
+        session = ProfileSession(route, mode, requests, fraction)
+        with self._lock:
+            self._sessions[session.id] = session
+            finished = [s for s in self._sessions.values() if s.status != 'armed' and not s.running]
+            for old in finished[:max(len(self._sessions) - self.max_sessions, 0)]:
+                del self._sessions[old.id]
+            self._update_armed()
+        return session
+
+    def stop(self, session_id):
+        """Disarm a session; requests already being profiled still complete it. False if unknown."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            if session.status == 'armed':
+                session.status = 'stopped'
+            self._update_armed()
+            return True
+
+    def _update_armed(self):
+        self.armed = any(s.status == 'armed' for s in self._sessions.values())
+
+    def sessions(self):
+        with self._lock:
+            return [s.to_dict() for s in reversed(self._sessions.values())]
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    # -- requests --------------------------------------------------------
+
+    def begin(self, route, method):
+        """Start profiling the current request if an armed session selects it. Returns a handle or None."""
+        if not self.armed:
+            return None
+        with self._lock:
+            session = next((s for s in self._sessions.values() if s.matches(route)), None)
+            if session is None or (session.fraction is not None and random.random() >= session.fraction):
+                return None
+            session.remaining -= 1
+            if session.remaining <= 0:
+                session.status = 'done'
+                self._update_armed()
+            session.running += 1
+            capture = _Capture(session, f"{method} {route}")
+            if session.mode == 'sample':
+                self._sampling[capture.thread_id] = capture
+                if self._sampler is None:
+                    self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+                    self._sampler.start()
+        if session.mode == 'cprofile':
+            capture.profile = cProfile.Profile()
+            try:
+                capture.profile.enable()
+            except ValueError as e:
+                # Another profiler is already active on this thread
+                print(f"Warning: could not profile request: {e}")
+                capture.profile = None
+        return capture
+
+    def end(self, capture):
+        """Stop profiling the request of `capture` and merge its data into the session."""
+        if capture.profile is not None:
+            capture.profile.disable()
+        elapsed = time.perf_counter() - capture.start
+        with self._lock:
+            self._sampling.pop(capture.thread_id, None)
+            session = capture.session
+            session.running -= 1
+            session.profiled += 1
+            session.seconds += elapsed
+            session.samples += capture.samples
+            session.stacks.update(capture.stacks)
+        if capture.profile is not None:
+            stats = pstats.Stats(capture.profile)
+            with self._lock:
+                if session.stats is None:
+                    session.stats = stats
+                else:
+                    session.stats.add(stats)
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._sampling:
+                    self._sampler = None
+                    return
+                captures = list(self._sampling.values())
+            frames = sys._current_frames()
+            stacks = [(capture, collapse_stack(frames[capture.thread_id], capture.root))
+                      for capture in captures if capture.thread_id in frames]
+            del frames
+            with self._lock:
+                for capture, stack in stacks:
+                    # Skip requests that ended meanwhile: their samples are already merged
+                    if self._sampling.get(capture.thread_id) is capture:
+                        capture.stacks[stack] += 1
+                        capture.samples += 1
+
+    # -- results ---------------------------------------------------------
+
+    def collapsed(self, session_id):
+        """Collapsed stacks of a sampling session, heaviest first."""
+        session = self.get(session_id)
+        with self._lock:
+            stacks = session.stacks.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def pstats_dump(self, session_id):
+        """Merged cProfile stats of a session in the `.prof` format (what `Stats.dump_stats` writes)."""
+        session = self.get(session_id)
+        with self._lock:
+            return marshal.dumps(session.stats.stats) if session.stats is not None else None
+
+    def pstats_report(self, session_id, limit=40):
+        """Text summary of a cProfile session, by cumulative time."""
+        session = self.get(session_id)
+        if session is None or session.stats is None:
+            return ''
+        out = io.StringIO()
+        with self._lock:
+            session.stats.stream = out
+            session.stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
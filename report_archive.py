@@ -0,0 +1,87 @@
+"""Streamed ZIP archives of diagnostic reports.
+
+`stream_report_zip` takes an iterable of (filename, document) pairs, renders the
+documents on an executor (normally a process pool, so the builtin renderer uses
+every core) and yields ZIP bytes as each PDF completes. At most `window` renders
+are in flight and each finished PDF is written out and dropped right away, so
+memory stays bounded by `window` reports whatever the archive size. The archive
+is written with data descriptors, so it never needs to be seekable or buffered.
+"""
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from pdf_jobs import content_key
+
+
+class _ChunkBuffer:
+    """Write-only file object collecting what ZipFile writes until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_report_zip(reports, renderer, executor, cache=None, window=8):
+    """Yield a ZIP archive of the rendered `reports` in chunks, in completion order.
+
+    Reports already in `cache` (a `pdf_jobs.PdfCache`) are not rendered again and
+    new renders are added to it. A report that fails to render is replaced by an
+    `<name>.error.txt` entry so one bad row does not abort the whole download.
+    """
+    namespace = renderer.cache_namespace()
+    buffer = _ChunkBuffer()
+    archive = zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED)
+    pending = {}
+
+    def add(filename, pdf):
+        archive.writestr(zipfile.ZipInfo(filename, date_time=(1980, 1, 1, 0, 0, 0)), pdf)
+
+    def collect(done):
+        for future in done:
+            filename, key = pending.pop(future)
+            try:
+                pdf = future.result()
+            except Exception as e:
+                print(f"Error generating PDF {filename}: {e}")
+                add(filename + '.error.txt', f'Erreur lors de la génération du PDF: {e}\n'.encode('utf-8'))
+                continue
+            if cache is not None:
+                cache.put(key, pdf)
+            add(filename, pdf)
+
+    try:
+        for filename, document in reports:
+            key = content_key(document, namespace)
+            pdf = cache.get(key) if cache is not None else None
+            if pdf is not None:
+                add(filename, pdf)
+            else:
+                if len(pending) >= window:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending[executor.submit(renderer.render, document)] = (filename, key)
+            collect([future for future in pending if future.done()])
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+            yield buffer.drain()
+        archive.close()
+        yield buffer.drain()
+    finally:
+        # Client went away mid-download: drop renders that have not started
+        for future in pending:
+            future.cancel()
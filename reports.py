@@ -0,0 +1,327 @@
+"""Diagnostic report renderers.
+
+`download_pdf` and the PDF job API turn a `result_data` dict (the structure built
+by `/result`) into a PDF through a `ReportRenderer`:
+
+- `BuiltinReportRenderer` lays the report out directly as PDF drawing operators
+  using the standard Helvetica fonts. It runs in-process, needs no external
+  binary and renders a report in about a millisecond.
+- `WkhtmltopdfReportRenderer` renders `templates/pdf_template.html` and converts
+  it with pdfkit/wkhtmltopdf, as the app always did.
+
+A renderer splits the work in two steps: `document(result_data)` produces the
+text the PDF is built from (computed on the request thread, hashed for the PDF
+cache) and `render(document)` produces the bytes (run on the PDF workers).
+Select the backend with `PDF_BACKEND=builtin|wkhtmltopdf|auto` (see
+`create_report_renderer`); `auto` uses wkhtmltopdf only when its binary exists.
+"""
+import json
+import os
+import shutil
+import unicodedata
+import zlib
+from abc import ABC, abstractmethod
+
+
+# Advance widths (1/1000 em) of the printable ASCII range, from the Adobe core font metrics.
+# Accented letters have the width of their base letter.
+HELVETICA_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 222, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    222, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584
+)
+HELVETICA_BOLD_WIDTHS = (
+    278, 333, 474, 556, 556, 889, 722, 278, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    278, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584
+)
+
+PAGE_WIDTH = 595.28   # A4, in points
+PAGE_HEIGHT = 841.89
+MARGIN = 56.69        # 20mm, as the @page rule of pdf_template.html
+BODY_SIZE = 11
+LINE_HEIGHT = BODY_SIZE * 1.6
+# Bump when the builtin layout changes so cached PDFs are not reused
+BUILTIN_LAYOUT_VERSION = 1
+
+
+def _char_width(ch, bold):
+    widths = HELVETICA_BOLD_WIDTHS if bold else HELVETICA_WIDTHS
+    code = ord(ch)
+    if code < 32 or code > 126:
+        base = unicodedata.normalize('NFD', ch)[0]
+        code = ord(base)
+        if code < 32 or code > 126:
+            return 556
+    return widths[code - 32]
+
+
+def text_width(text, size, bold=False):
+    return sum(_char_width(ch, bold) for ch in text) * size / 1000.0
+
+
+def wrap_text(text, size, width, bold=False):
+    """Split `text` into lines no wider than `width` points (long words are kept whole)."""
+    lines, current = [], ''
+    for word in str(text).split():
+        candidate = f'{current} {word}' if current else word
+        if current and text_width(candidate, size, bold) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    lines.append(current)
+    return lines
+
+
+def _pdf_string(text):
+    # The fonts use WinAnsiEncoding (cp1252), which covers French text
+    raw = str(text).encode('cp1252', errors='replace')
+    return b'(' + raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+class ReportLayout:
+    """Top-down page layout writing PDF content-stream operators, one list per page."""
+
+    def __init__(self):
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.ops = []
+        self.pages.append(self.ops)
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def ensure(self, height):
+        if self.y - height < MARGIN:
+            self.new_page()
+
+    def text(self, x, y, runs, size):
+        """Draw `runs` [(text, bold), ...] one after another on the baseline `y`."""
+        parts = [b'BT', f'{x:.2f} {y:.2f} Td'.encode('ascii')]
+        for text, bold in runs:
+            parts.append(f"/{'F2' if bold else 'F1'} {size} Tf".encode('ascii'))
+            parts.append(_pdf_string(text) + b' Tj')
+        parts.append(b'ET')
+        self.ops.append(b' '.join(parts))
+
+    def centered(self, text, size, bold=False, space_after=0):
+        self.ensure(size * 1.4)
+        self.y -= size
+        self.text((PAGE_WIDTH - text_width(text, size, bold)) / 2, self.y, [(text, bold)], size)
+        self.y -= size * 0.4 + space_after
+
+    def heading(self, text, size=14):
+        # Keep a heading with at least a few lines of its section
+        self.ensure(size * 2 + 3 * LINE_HEIGHT)
+        self.y -= size * 2
+        self.text(MARGIN, self.y, [(text, True)], size)
+        self.y -= size * 0.6
+
+    def field_lines(self, label, value, x, width):
+        """Wrap a 'Label: value' pair into a list of line runs."""
+        label = f'{label}: '
+        indent = text_width(label, BODY_SIZE, True)
+        value_lines = wrap_text(value, BODY_SIZE, width - indent)
+        lines = [[(label, True), (value_lines[0], False)]]
+        lines += [[(line, False)] for line in value_lines[1:]]
+        return [(x if i == 0 else x + indent, runs) for i, runs in enumerate(lines)]
+
+    def field(self, label, value):
+        for x, runs in self.field_lines(label, value, MARGIN, PAGE_WIDTH - 2 * MARGIN):
+            self.ensure(LINE_HEIGHT)
+            self.y -= LINE_HEIGHT
+            self.text(x, self.y, runs, BODY_SIZE)
+
+    def boxed_fields(self, fields, padding=15, fill=(0.973, 0.976, 0.980)):
+        """Fields on a shaded background, like the `.diagnostic` block of the HTML template."""
+        inner = PAGE_WIDTH - 2 * MARGIN - 2 * padding
+        lines = []
+        for label, value in fields:
+            lines += self.field_lines(label, value, MARGIN + padding, inner)
+        height = len(lines) * LINE_HEIGHT + 2 * padding
+        if height <= PAGE_HEIGHT - 2 * MARGIN:
+            self.ensure(height)
+        self.ops.append(f'{fill[0]} {fill[1]} {fill[2]} rg {MARGIN:.2f} {self.y - height:.2f} '
+                        f'{PAGE_WIDTH - 2 * MARGIN:.2f} {height:.2f} re f 0 g'.encode('ascii'))
+        self.y -= padding
+        for x, runs in lines:
+            self.y -= LINE_HEIGHT
+            self.text(x, self.y, runs, BODY_SIZE)
+        self.y -= padding
+
+    def right_field(self, label, value):
+        runs = [(f'{label}: ', True), (str(value), False)]
+        width = sum(text_width(text, BODY_SIZE, bold) for text, bold in runs)
+        self.ensure(LINE_HEIGHT)
+        self.y -= LINE_HEIGHT
+        self.text(PAGE_WIDTH - MARGIN - width, self.y, runs, BODY_SIZE)
+
+
+def build_pdf(pages, title=''):
+    """Assemble a PDF file from per-page content streams, using Helvetica and Helvetica-Bold."""
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,  # page tree, filled in once page object numbers are known
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+        b'<< /Title ' + _pdf_string(title) + b' /Producer (medical_diagnostic_app) >>',
+    ]
+    page_refs = []
+    for ops in pages:
+        stream = zlib.compress(b'\n'.join(ops))
+        objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        content_number = len(objects)
+        objects.append((f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+                        f'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> '
+                        f'/Contents {content_number} 0 R >>').encode('ascii'))
+        page_refs.append(f'{len(objects)} 0 R')
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>".encode('ascii')
+
+    out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def build_report_pdf(result):
+    """Lay out the diagnostic report of `result` (the dict built by `/result`) as PDF bytes."""
+    patient = result.get('patient') or {}
+    symptoms = result.get('symptoms') or {}
+    diagnostic = result.get('diagnostic') or {}
+    medecin = result.get('medecin') or {}
+    date = result.get('date', '')
+    exams = diagnostic.get('examens') or []
+    if isinstance(exams, str):
+        exams = [exams]
+
+    layout = ReportLayout()
+    layout.centered('Rapport de Diagnostic Médical', 20, bold=True, space_after=6)
+    layout.centered(date, BODY_SIZE, space_after=12)
+
+    layout.heading('Information Patient')
+    layout.field('Nom', patient.get('nom', ''))
+    layout.field('Prénom', patient.get('prenom', ''))
+    layout.field('CNE', patient.get('cne', ''))
+    layout.field('Âge', f"{patient.get('age', '')} ans")
+    layout.field('Genre', patient.get('genre', ''))
+
+    layout.heading('Symptômes')
+    layout.field('Fièvre', symptoms.get('fievre', ''))
+    layout.field('Toux', symptoms.get('toux', ''))
+    layout.field('Fatigue', symptoms.get('fatigue', ''))
+    layout.field('Difficulté respiratoire', symptoms.get('respiration', ''))
+
+    layout.heading('Diagnostic')
+    layout.y -= 6
+    layout.boxed_fields([
+        ('Maladie diagnostiquée', diagnostic.get('maladie', '')),
+        ('Niveau de confiance', diagnostic.get('confiance', '')),
+        ('Service recommandé', diagnostic.get('service', '')),
+        ('Examens recommandés', ', '.join(str(e) for e in exams))
+    ])
+
+    # Feature contributions (ShapValues) to the predicted class, when app.py attached them
+    contributions = (result.get('explication') or {}).get('contributions') or []
+    if contributions:
+        layout.heading('Facteurs déterminants')
+        for item in contributions:
+            layout.field(f"{item.get('label', '')} ({item.get('valeur', '')})",
+                         f"{float(item.get('contribution', 0)):+.3f}")
+
+    layout.y -= 20
+    layout.right_field('Médecin', medecin.get('nom', ''))
+    layout.right_field('Spécialité', medecin.get('specialite', ''))
+    layout.right_field('Date', date)
+    return build_pdf(layout.pages, title='Rapport de Diagnostic Médical')
+
+
+class ReportRenderer(ABC):
+    """Interface of the report backends."""
+
+    name = None
+
+    def cache_namespace(self):
+        """Identifies this backend's output in the PDF cache key."""
+        return self.name
+
+    @abstractmethod
+    def document(self, result_data):
+        """Deterministic text the report is rendered from. Runs in the request context."""
+
+    @abstractmethod
+    def render(self, document):
+        """Return the PDF bytes of `document`. May run on any thread, outside Flask."""
+
+
+class BuiltinReportRenderer(ReportRenderer):
+    name = 'builtin'
+
+    def cache_namespace(self):
+        return f'{self.name}/{BUILTIN_LAYOUT_VERSION}'
+
+    def document(self, result_data):
+        return json.dumps(result_data, sort_keys=True, ensure_ascii=False)
+
+    def render(self, document):
+        return build_report_pdf(json.loads(document))
+
+
+class WkhtmltopdfReportRenderer(ReportRenderer):
+    """pdf_template.html converted by wkhtmltopdf; `render_html(result_data)` renders the template."""
+
+    name = 'wkhtmltopdf'
+
+    def __init__(self, render_html, command, options=None):
+        self.render_html = render_html
+        self.command = command
+        self.options = options or {}
+        self._configuration = None
+
+    def __getstate__(self):
+        # Worker processes only call render(); the template callable stays in the web process
+        state = self.__dict__.copy()
+        state['render_html'] = None
+        state['_configuration'] = None
+        return state
+
+    def cache_namespace(self):
+        return f'{self.name}/{json.dumps(self.options, sort_keys=True)}'
+
+    def document(self, result_data):
+        return self.render_html(result_data)
+
+    def render(self, document):
+        # pdfkit is only needed (and wkhtmltopdf only located) when this backend is used
+        import pdfkit
+        if self._configuration is None:
+            self._configuration = pdfkit.configuration(wkhtmltopdf=self.command)
+        return pdfkit.from_string(document, False, configuration=self._configuration, options=self.options)
+
+
+def wkhtmltopdf_available(command):
+    return bool(command) and (os.path.isfile(command) or shutil.which(command) is not None)
+
+
+def create_report_renderer(render_html, wkhtmltopdf_cmd, options=None, backend=None):
+    """Build the renderer selected by `backend` or the PDF_BACKEND environment variable."""
+    backend = backend or os.environ.get('PDF_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'wkhtmltopdf' if wkhtmltopdf_available(wkhtmltopdf_cmd) else 'builtin'
+    if backend == 'wkhtmltopdf':
+        return WkhtmltopdfReportRenderer(render_html, wkhtmltopdf_cmd, options)
+    if backend != 'builtin':
+        print(f"Warning: unknown PDF_BACKEND '{backend}', using the builtin renderer")
+    return BuiltinReportRenderer()
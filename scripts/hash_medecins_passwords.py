@@ -6,20 +6,20 @@ Usage (from project root):
   python scripts/hash_medecins_passwords.py
 
 This will replace any password value that does not look like a Werkzeug hash
-with a generated hash using Werkzeug's `generate_password_hash`.
+with a generated hash using Werkzeug's `generate_password_hash`. The hashes are
+computed in parallel on every core.
 """
 import json
 import os
-from werkzeug.security import generate_password_hash
+import sys
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
 
-DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'medecins.json')
+from doctor_directory import is_hashed_password  # noqa: E402
+from password_pool import hash_passwords  # noqa: E402
 
-
-def is_hashed(pwd: str) -> bool:
-    if not isinstance(pwd, str):
-        return False
-    return pwd.startswith('pbkdf2:') or pwd.startswith('argon2:')
+DATA_PATH = os.path.join(ROOT, 'data', 'medecins.json')
 
 
 def main():
@@ -30,18 +30,14 @@ def main():
     with open(DATA_PATH, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
-    changed = False
-    for username, info in data.items():
-        pwd = info.get('password')
-        if pwd is None:
-            continue
-        if not is_hashed(pwd):
-            new_hash = generate_password_hash(str(pwd))
-            data[username]['password'] = new_hash
-            changed = True
-            print(f"Hashed password for {username}")
-
-    if changed:
+    pending = [username for username, info in data.items()
+               if info.get('password') is not None and not is_hashed_password(info['password'])]
+    hashes = hash_passwords([str(data[username]['password']) for username in pending], nice=0)
+    for username, new_hash in zip(pending, hashes):
+        data[username]['password'] = new_hash
+        print(f"Hashed password for {username}")
+
+    if pending:
         with open(DATA_PATH, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=4)
         print(f"Updated {DATA_PATH} with hashed passwords.")
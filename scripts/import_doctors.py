@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Create doctor accounts in bulk from a CSV file.
+
+Usage (from project root):
+  python scripts/import_doctors.py doctors.csv [--dry-run] [--workers N]
+
+Columns: nom_complet, specialite, password (required), email, role
+(medecin/admin), numero_ordre (optional); `,` or `;` separated. The file is
+validated first and nothing is written if any row is invalid or clashes with an
+existing account. Passwords are hashed in parallel on every core and all the
+accounts are added to data/medecins.json in one atomic write (a backup is kept
+as medecins.json.bak). Safe to run while the app is serving: the write takes the
+same file lock as the app in SHARED_STATE mode, and the app picks up the new
+accounts on its next request.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from doctor_import import DoctorImportError, import_doctors, parse_doctors_csv  # noqa: E402
+from password_pool import hash_passwords  # noqa: E402
+from persistence import create_persistence  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path')
+    parser.add_argument('--dry-run', action='store_true', help='validate only')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='hashing processes')
+    args = parser.parse_args()
+
+    with open(args.csv_path, 'r', encoding='utf-8-sig') as f:
+        text = f.read()
+    try:
+        rows = parse_doctors_csv(text)
+    except DoctorImportError as e:
+        print('\n'.join(e.errors))
+        sys.exit(1)
+    if args.dry_run:
+        print(f"{len(rows)} doctors valid; nothing written (--dry-run)")
+        return
+
+    data_dir = os.path.join(ROOT, 'data')
+    persistence = create_persistence(data_dir, shared=True)
+    start = time.perf_counter()
+    try:
+        created = import_doctors(persistence, os.path.join(data_dir, 'medecins.json'), rows,
+                                 lambda passwords: hash_passwords(passwords, workers=args.workers, nice=0))
+    except DoctorImportError as e:
+        print('\n'.join(e.errors))
+        sys.exit(1)
+    finally:
+        persistence.stop()
+    for username, uid in created:
+        print(f"{username}\t{uid}")
+    print(f"Imported {len(created)} doctors in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
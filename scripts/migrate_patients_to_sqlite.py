@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+One-shot migration of data/patients.json into the SQLite patient history store.
+
+Usage (from project root):
+  python scripts/migrate_patients_to_sqlite.py [--db data/patients.db] [--force]
+
+The JSON file is left untouched. The script refuses to run against a database
+that already holds patients unless --force is given, to avoid duplicate rows.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from history_store import SqliteHistoryStore  # noqa: E402
+
+
+JSON_PATH = os.path.join(ROOT, 'data', 'patients.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import data/patients.json into SQLite')
+    parser.add_argument('--db', default=os.environ.get('PATIENT_DB_PATH', os.path.join(ROOT, 'data', 'patients.db')))
+    parser.add_argument('--json', default=JSON_PATH)
+    parser.add_argument('--force', action='store_true', help='import even if the database is not empty')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.json):
+        print(f"File not found: {args.json}")
+        return
+
+    store = SqliteHistoryStore(args.db)
+    existing = store.count()
+    if existing and not args.force:
+        print(f"{args.db} already contains {existing} patients; use --force to import anyway.")
+        return
+
+    imported = store.import_json(args.json)
+    print(f"Imported {imported} patients into {args.db} (total {store.count()}).")
+
+
+if __name__ == '__main__':
+    main()
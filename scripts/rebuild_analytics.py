@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Recompute data/stats.json (diagnosis counters) from the full patient history.
+
+Usage (from project root):
+  python scripts/rebuild_analytics.py
+
+Use it after restoring a backup, migrating history, or if the dashboard
+statistics drift from the stored diagnoses. It streams the history page by page.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from analytics import DiagnosisStats  # noqa: E402
+from history_store import create_history_store  # noqa: E402
+from persistence import create_persistence  # noqa: E402
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    data_dir = os.path.join(ROOT, 'data')
+    persistence = create_persistence(data_dir)
+    store = create_history_store(data_dir=data_dir, persistence=persistence)
+    stats = DiagnosisStats(persistence, os.path.join(data_dir, 'stats.json'))
+
+    total = stats.rebuild(store.iter_entries())
+    persistence.stop()
+    print(f"Rebuilt statistics from {total} diagnoses into {os.path.join(data_dir, 'stats.json')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -11,17 +11,18 @@ document.addEventListener('DOMContentLoaded', function(){
         const active = Array.from(links).find(l => l.dataset.target === id);
         if(active) active.classList.add('active');
 
-        // If opening activity section, load and start auto-refresh. Otherwise stop it.
+        // If opening activity section, follow its live stream. Otherwise close it.
         if(id === 'section-activity'){
-            // load immediately and start polling
-            loadRecentActivity();
             if(typeof startActivityAutoRefresh === 'function') startActivityAutoRefresh();
         } else if(id === 'section-services'){
             // load services when the services section is shown
             if(typeof loadServices === 'function') loadServices();
-        } else {
-            if(typeof stopActivityAutoRefresh === 'function') stopActivityAutoRefresh();
+        } else if(id === 'section-stats'){
+            if(typeof loadStats === 'function') loadStats();
+        } else if(id === 'section-profiler'){
+            if(typeof loadProfiler === 'function') loadProfiler();
         }
+        if(id !== 'section-activity' && typeof stopActivityAutoRefresh === 'function') stopActivityAutoRefresh();
     }
 
     links.forEach(l => {
@@ -50,12 +51,28 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
-// Fetch recent activity from API when activity section is shown
+// Recent activity: rendered from the snapshot/events of the SSE stream
+const ACTIVITY_MAX_ITEMS = 50;
+let activityItems = [];
+
+function activityNode(item) {
+    const node = document.createElement('div');
+    node.className = 'activity-item';
+    node.innerHTML = `
+        <div class="activity-icon">${escapeHtml(item.icon || 'ℹ️')}</div>
+        <div class="activity-content">
+            <div class="activity-title">${escapeHtml(item.title || '')}</div>
+            <div class="activity-time">${escapeHtml(item.time || '')}</div>
+        </div>`;
+    return node;
+}
+
 function renderActivity(list) {
     const container = document.querySelector('#section-activity .recent-activity');
     if(!container) return;
+    activityItems = (list || []).slice(0, ACTIVITY_MAX_ITEMS);
     container.innerHTML = '';
-    if(!list || list.length === 0) {
+    if(activityItems.length === 0) {
         container.innerHTML = `
             <div class="activity-item">
                 <div class="activity-icon">ℹ️</div>
@@ -63,28 +80,42 @@ function renderActivity(list) {
             </div>`;
         return;
     }
-    list.forEach(item => {
-        const node = document.createElement('div');
-        node.className = 'activity-item';
-        node.innerHTML = `
-            <div class="activity-icon">${item.icon || 'ℹ️'}</div>
-            <div class="activity-content">
-                <div class="activity-title">${item.title || ''}</div>
-                <div class="activity-time">${item.time || ''}</div>
-            </div>`;
-        container.appendChild(node);
-    });
+    activityItems.forEach(item => container.appendChild(activityNode(item)));
+}
+
+function prependActivity(item) {
+    const container = document.querySelector('#section-activity .recent-activity');
+    if(!container) return;
+    if(activityItems.length === 0) container.innerHTML = '';
+    activityItems.unshift(item);
+    container.insertBefore(activityNode(item), container.firstChild);
+    while(activityItems.length > ACTIVITY_MAX_ITEMS) {
+        activityItems.pop();
+        container.removeChild(container.lastChild);
+    }
+}
+
+// Revalidating JSON fetch: the last body and ETag of each URL are kept, and the request
+// carries If-None-Match, so an unchanged resource comes back as an empty 304.
+// Resolves to the parsed body, or null when it has not changed since the last call.
+const revalidationCache = new Map();
+async function fetchJsonRevalidated(url) {
+    const cached = revalidationCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    // no-store: the 304 must reach this code instead of being resolved by the HTTP cache
+    const resp = await fetch(url, { credentials: 'same-origin', cache: 'no-store', headers });
+    if(resp.status === 304 && cached) return null;
+    if(!resp.ok) throw new Error(`HTTP ${resp.status}`);
+    const data = await resp.json();
+    const etag = resp.headers.get('ETag');
+    if(etag) revalidationCache.set(url, { etag }); else revalidationCache.delete(url);
+    return data;
 }
 
 async function loadRecentActivity() {
     try {
-        const resp = await fetch('/api/admin/recent-activity', { credentials: 'same-origin' });
-        if(!resp.ok) {
-            console.warn('Could not fetch activity, status', resp.status);
-            return;
-        }
-        const data = await resp.json();
-        renderActivity(data.recent_activity || []);
+        const data = await fetchJsonRevalidated('/api/admin/recent-activity');
+        if(data) renderActivity(data.recent_activity || []);
     } catch (e) {
         console.warn('Error fetching recent activity', e);
     }
@@ -93,14 +124,6 @@ async function loadRecentActivity() {
 // Enhance showSection to automatically load activity when needed
 document.addEventListener('DOMContentLoaded', function(){
     const links = document.querySelectorAll('.sidebar-link');
-    links.forEach(l => {
-        if(l.dataset.target === 'section-activity'){
-            l.addEventListener('click', function(){
-                // load latest activity from API
-                loadRecentActivity();
-            });
-        }
-    });
     // If the hash has #activity, open it and load
     if(window.location.hash === '#activity'){
         const actLink = Array.from(links).find(l => l.dataset.target === 'section-activity');
@@ -113,49 +136,121 @@ document.addEventListener('DOMContentLoaded', function(){
         }
 });
 
-// Patients table filter by doctor
+// Patients: server-side filtered, cursor-paginated listing from /api/admin/patients
+function escapeHtml(value) {
+    return String(value == null ? '' : value).replace(/[&<>"']/g, c => ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#39;'}[c]));
+}
+
 document.addEventListener('DOMContentLoaded', function(){
-    const filter = document.getElementById('patient-doctor-filter');
-    if(!filter) return;
+    const form = document.getElementById('patient-filters');
     const table = document.getElementById('patients-table');
-    const rows = table ? Array.from(table.querySelectorAll('tbody tr')) : [];
-
-    function applyFilter() {
-        const v = filter.value.trim();
-        rows.forEach(r => {
-            const doctor = (r.dataset.doctor || '').trim();
-            if(!v || doctor === v) {
-                r.style.display = '';
-            } else {
-                r.style.display = 'none';
-            }
+    if(!form || !table) return;
+    const tbody = table.querySelector('tbody');
+    const moreBtn = document.getElementById('patients-load-more');
+    const empty = document.getElementById('patients-empty');
+    let nextCursor = table.dataset.nextCursor || '';
+
+    function appendRows(list) {
+        list.forEach(p => {
+            const tr = document.createElement('tr');
+            tr.dataset.doctor = p.doctor || '';
+            const name = (p.prenom || p.nom) ? `${p.prenom || ''} ${p.nom || ''}`.trim() : '';
+            tr.innerHTML = [name, p.cin, p.age, p.sex, p.disease, p.doctor, p.service, p.date]
+                .map(v => `<td>${escapeHtml(v)}</td>`).join('');
+            tbody.appendChild(tr);
         });
     }
 
-    filter.addEventListener('change', applyFilter);
+    function updateControls() {
+        if(moreBtn) moreBtn.style.display = nextCursor ? '' : 'none';
+        if(empty) empty.style.display = tbody.children.length ? 'none' : '';
+    }
+
+    async function loadPage(reset) {
+        const params = new URLSearchParams();
+        new FormData(form).forEach((v, k) => { if(v) params.append(k, v); });
+        if(!reset && nextCursor) params.append('cursor', nextCursor);
+        try {
+            const resp = await fetch('/api/admin/patients?' + params.toString(), {credentials: 'same-origin'});
+            if(!resp.ok) { console.warn('Could not fetch patients', resp.status); return; }
+            const data = await resp.json();
+            if(reset) tbody.innerHTML = '';
+            appendRows(data.patients || []);
+            nextCursor = data.next_cursor || '';
+            updateControls();
+        } catch (e) {
+            console.warn('Error fetching patients', e);
+        }
+    }
+
+    form.addEventListener('submit', function(e){
+        e.preventDefault();
+        loadPage(true);
+    });
+    ['patient-doctor-filter', 'patient-sort', 'patient-order'].forEach(id => {
+        const el = document.getElementById(id);
+        if(el) el.addEventListener('change', () => loadPage(true));
+    });
+    if(moreBtn) moreBtn.addEventListener('click', () => loadPage(false));
+
+    // Exports of the filtered patients (streamed CSV / ZIP of PDF reports, downloaded by the browser)
+    function exportUrl(path) {
+        const params = new URLSearchParams();
+        new FormData(form).forEach((v, k) => { if(v) params.append(k, v); });
+        return path + '?' + params.toString();
+    }
+    const csvBtn = document.getElementById('patients-export-csv');
+    if(csvBtn) csvBtn.addEventListener('click', () => { window.location.href = exportUrl('/api/admin/patients/export'); });
+    const exportBtn = document.getElementById('patients-export-pdf');
+    if(exportBtn) exportBtn.addEventListener('click', () => { window.location.href = exportUrl('/api/admin/reports/export'); });
 });
 
-let activityInterval = null;
+// Live activity over Server-Sent Events: the server pushes a snapshot, then each new
+// entry. EventSource reconnects by itself and resends the last id (Last-Event-ID),
+// so nothing is missed or repeated. The stream is closed while the section is hidden.
+// When the server has no stream slot left (503) or EventSource is missing, poll instead.
+const ACTIVITY_POLL_MS = 15000;
+let activitySource = null;
+let activityLastId = null;
+let activityPoll = null;
+function pollActivity() {
+  if(activityPoll) return;
+  loadRecentActivity();
+  activityPoll = setInterval(loadRecentActivity, ACTIVITY_POLL_MS);
+}
 function startActivityAutoRefresh() {
-  if(activityInterval) return;
-  activityInterval = setInterval(() => {
-    // only load if section visible
-    const section = document.getElementById('section-activity');
-    if(section && section.style.display !== 'none') loadRecentActivity();
-  }, 30000); // 30s
+  if(activitySource || activityPoll) return;
+  if(typeof EventSource === 'undefined') { pollActivity(); return; }
+  // After the section was closed, resume from the last entry seen instead of a new snapshot
+  const url = '/api/admin/activity/stream' + (activityLastId !== null ? `?last_event_id=${activityLastId}` : '');
+  activitySource = new EventSource(url, { withCredentials: true });
+  activitySource.addEventListener('snapshot', e => {
+    activityLastId = e.lastEventId;
+    renderActivity(JSON.parse(e.data));
+  });
+  activitySource.addEventListener('activity', e => {
+    activityLastId = e.lastEventId;
+    prependActivity(JSON.parse(e.data));
+  });
+  activitySource.addEventListener('error', () => {
+    // CLOSED means the browser gave up (the server refused the stream): it will not reconnect
+    if(activitySource && activitySource.readyState === EventSource.CLOSED) {
+      activitySource = null;
+      pollActivity();
+    }
+  });
 }
 function stopActivityAutoRefresh() {
-  if(activityInterval) { clearInterval(activityInterval); activityInterval = null; }
+  if(activitySource) { activitySource.close(); activitySource = null; }
+  if(activityPoll) { clearInterval(activityPoll); activityPoll = null; }
 }
-// call startActivityAutoRefresh() when activity section is shown
 
 // Services: load and render service cards, handle add-service
 async function loadServices() {
     try {
-        const resp = await fetch('/api/admin/services', {credentials: 'same-origin'});
-        if(!resp.ok) { console.warn('Could not fetch services', resp.status); return; }
-        const data = await resp.json();
-        renderServices(data.services || []);
+        // null: unchanged since the last load, the rendered cards are current
+        const data = await fetchJsonRevalidated('/api/admin/services');
+        if(data) renderServices(data.services || []);
     } catch (e) {
         console.warn('Error fetching services', e);
     }
@@ -254,4 +349,127 @@ document.addEventListener('DOMContentLoaded', function(){
             alert('Erreur réseau lors du rechargement.');
         }
     });
-});
\ No newline at end of file
+});
+
+// Statistics: rollups from /api/admin/stats rendered as simple bar charts
+function renderBars(containerId, counts, limit) {
+    const container = document.getElementById(containerId);
+    if(!container) return;
+    const entries = Object.entries(counts || {}).sort((a, b) => b[1] - a[1]).slice(0, limit || 10);
+    container.innerHTML = '';
+    if(entries.length === 0) {
+        container.innerHTML = '<p>Aucune donnée</p>';
+        return;
+    }
+    const max = entries[0][1] || 1;
+    entries.forEach(([label, count]) => {
+        const row = document.createElement('div');
+        row.className = 'stats-bar-row';
+        row.innerHTML = `
+            <span class="stats-bar-label">${escapeHtml(label)}</span>
+            <span class="stats-bar"><span style="width:${Math.round(100 * count / max)}%"></span></span>
+            <span class="stats-bar-value">${count}</span>`;
+        container.appendChild(row);
+    });
+}
+
+function renderDays(containerId, series) {
+    const container = document.getElementById(containerId);
+    if(!container) return;
+    const max = Math.max(1, ...series.map(d => d.count));
+    container.innerHTML = '';
+    series.forEach(d => {
+        const col = document.createElement('div');
+        col.className = 'stats-column';
+        col.title = `${d.day}: ${d.count}`;
+        col.innerHTML = `<span style="height:${Math.round(100 * d.count / max)}%"></span>`;
+        container.appendChild(col);
+    });
+}
+
+async function loadStats() {
+    try {
+        const resp = await fetch('/api/admin/stats?days=30', {credentials: 'same-origin'});
+        if(!resp.ok) { console.warn('Could not fetch stats', resp.status); return; }
+        const data = await resp.json();
+        const total = document.getElementById('stats-total');
+        if(total) total.textContent = data.total;
+        renderDays('stats-by-day', data.by_day || []);
+        renderBars('stats-by-disease', data.by_disease);
+        renderBars('stats-by-service', data.by_service);
+        renderBars('stats-by-doctor', data.by_doctor);
+    } catch (e) {
+        console.warn('Error fetching stats', e);
+    }
+}
+
+// Request profiler: arm sessions and download their results (see profiling.py)
+async function loadProfiler() {
+    try {
+        const resp = await fetch('/api/admin/profiler', {credentials: 'same-origin', cache: 'no-store'});
+        if(!resp.ok) { console.warn('Could not fetch profiler sessions', resp.status); return; }
+        const data = await resp.json();
+        const select = document.getElementById('profiler-route');
+        if(select && select.options.length <= 1) {
+            (data.routes || []).forEach(r => {
+                const opt = document.createElement('option');
+                opt.value = r;
+                opt.textContent = r;
+                select.appendChild(opt);
+            });
+        }
+        renderProfilerSessions(data.sessions || []);
+    } catch (e) {
+        console.warn('Error fetching profiler sessions', e);
+    }
+}
+
+function renderProfilerSessions(list) {
+    const tbody = document.querySelector('#profiler-sessions tbody');
+    if(!tbody) return;
+    tbody.innerHTML = '';
+    list.forEach(s => {
+        const tr = document.createElement('tr');
+        const base = '/api/admin/profiler/' + encodeURIComponent(s.id);
+        let actions = `<a class="btn btn-reset" href="${base}/download">Télécharger</a>`;
+        if(s.mode === 'cprofile') actions += ` <a class="btn btn-reset" href="${base}/download?format=text">Rapport</a>`;
+        if(s.status === 'armed') actions += ` <button type="button" class="btn btn-danger" data-stop="${escapeHtml(s.id)}">Arrêter</button>`;
+        tr.innerHTML = [s.created, s.route || 'toutes', s.mode, s.status, s.profiled, s.seconds]
+            .map(v => `<td>${escapeHtml(v)}</td>`).join('') + `<td>${actions}</td>`;
+        tbody.appendChild(tr);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', function(){
+    const form = document.getElementById('profiler-form');
+    if(!form) return;
+    const error = document.getElementById('profiler-error');
+
+    form.addEventListener('submit', async function(e){
+        e.preventDefault();
+        const payload = {};
+        new FormData(form).forEach((v, k) => { if(v) payload[k] = v; });
+        try {
+            const resp = await fetch('/api/admin/profiler', {
+                method: 'POST', credentials: 'same-origin',
+                headers: {'Content-Type': 'application/json'}, body: JSON.stringify(payload)
+            });
+            const data = await resp.json();
+            if(error) {
+                error.textContent = resp.ok ? '' : (data.error || 'Erreur');
+                error.style.display = resp.ok ? 'none' : '';
+            }
+            loadProfiler();
+        } catch (err) {
+            console.warn('Error arming profiler', err);
+        }
+    });
+
+    const table = document.getElementById('profiler-sessions');
+    if(table) table.addEventListener('click', async function(e){
+        const id = e.target.dataset && e.target.dataset.stop;
+        if(!id) return;
+        await fetch('/api/admin/profiler/' + encodeURIComponent(id) + '/stop', {method: 'POST', credentials: 'same-origin'});
+        loadProfiler();
+    });
+});
@@ -0,0 +1,301 @@
+"""Password reset tokens: an in-memory index persisted through an append-only journal.
+
+Tokens used to live in a plain dict whose whole file was rewritten on every
+issue and use, and expired tokens were only dropped when the file was reloaded.
+`TokenStore` keeps:
+
+- `_tokens`: token -> (username, expires), for lookups;
+- `_heap`: a min-heap of (expires, token), so expired tokens are purged in
+  O(log n) each, lazily, on the next issue (entries of tokens already used are
+  skipped when they reach the top);
+- `_by_user`: username -> tokens in issue order, to cap the live tokens of an
+  account at `max_per_user` (the oldest is revoked when a new one is issued).
+
+Changes are appended as JSON lines to `<name>.journal` next to the snapshot
+(`password_reset_tokens.json`, same format as before: token -> {'username',
+'expires'}), so issuing a token costs one short append whatever the number of
+tokens. Once the journal holds `compact_every` records (and at least twice as
+many as there are live tokens), the live tokens are written to the snapshot and
+the journal is replaced by an empty one. Replaying a journal over a snapshot is
+idempotent, so a crash between the two steps loses nothing.
+
+With several worker processes (`shared=True`) every change is made under the
+`<snapshot>.lock` file lock after reading the records other workers appended;
+`refresh()` (one stat() per file when nothing changed) picks them up between
+requests. A compaction creates a new journal file, which the other workers see
+as a new inode and answer with a full reload.
+"""
+import heapq
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from persistence import _process_lock
+
+
+def _parse_expires(value):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenStore:
+    def __init__(self, path, max_per_user=3, compact_every=256, shared=False):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + '.journal'
+        self.max_per_user = max_per_user
+        self.compact_every = compact_every
+        self.shared = shared
+        self._lock = threading.RLock()
+        self._tokens = {}
+        self._heap = []
+        self._by_user = {}
+        self._records = 0
+        # (inode, mtime, size) of the snapshot and (inode, bytes read) of the journal
+        self._snapshot_stamp = None
+        self._journal_stamp = None
+
+    # -- in-memory index -------------------------------------------------
+
+    def _add(self, token, username, expires):
+        self._discard(token)
+        self._tokens[token] = (username, expires)
+        heapq.heappush(self._heap, (expires, token))
+        self._by_user.setdefault(username, {})[token] = None
+
+    def _discard(self, token):
+        entry = self._tokens.pop(token, None)
+        if entry is None:
+            return False
+        user_tokens = self._by_user.get(entry[0])
+        if user_tokens is not None:
+            user_tokens.pop(token, None)
+            if not user_tokens:
+                del self._by_user[entry[0]]
+        return True
+
+    def _purge(self, now):
+        """Drop the tokens expired at `now`; heap entries of used tokens are skipped."""
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires, token = heapq.heappop(heap)
+            entry = self._tokens.get(token)
+            if entry is not None and entry[1] == expires:
+                self._discard(token)
+
+    def _replay(self, record):
+        op = record.get('op')
+        token = record.get('token')
+        if op == 'issue':
+            expires = _parse_expires(record.get('expires'))
+            if token and record.get('username') and expires:
+                self._add(token, record['username'], expires)
+        elif op in ('use', 'revoke'):
+            self._discard(token)
+        self._records += 1
+
+    # -- files -----------------------------------------------------------
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _reload(self):
+        """Rebuild the index from the snapshot and the whole journal. Caller holds self._lock."""
+        self._tokens, self._heap, self._by_user, self._records = {}, [], {}, 0
+        self._snapshot_stamp = self._stamp(self.path)
+        if self._snapshot_stamp is not None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    raw_tokens = json.load(f)
+                for token, info in (raw_tokens if isinstance(raw_tokens, dict) else {}).items():
+                    expires = _parse_expires(info.get('expires')) if isinstance(info, dict) else None
+                    if expires and info.get('username'):
+                        self._add(token, info['username'], expires)
+            except Exception as e:
+                print(f"Warning: could not load {self.path}: {e}")
+        self._journal_stamp = None
+        self._read_journal()
+        self._purge(datetime.now())
+
+    def _read_journal(self):
+        """Apply the journal records not read yet. Returns False if the journal was replaced."""
+        try:
+            with open(self.journal_path, 'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                offset = 0
+                if self._journal_stamp is not None and self._journal_stamp[0] is not None:
+                    if self._journal_stamp[0] != inode:
+                        return False
+                    offset = self._journal_stamp[1]
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            if self._journal_stamp is not None:
+                return False
+            self._journal_stamp = (None, 0)
+            return True
+        # Stop at the last complete line: a record may be half written by another worker
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                self._replay(json.loads(line))
+            except ValueError:
+                print(f"Warning: skipping unreadable record in {self.journal_path}")
+        self._journal_stamp = (inode, offset + end)
+        return True
+
+    def _catch_up(self):
+        """Pick up changes made by other workers (or tools). Caller holds self._lock."""
+        if self._snapshot_stamp is None and self._journal_stamp is None:
+            self._reload()
+            return
+        if self._stamp(self.path) != self._snapshot_stamp:
+            self._reload()
+            return
+        journal = self._stamp(self.journal_path)
+        inode, offset = self._journal_stamp
+        if journal is None and inode is None:
+            return
+        if journal is not None and journal[0] == inode and journal[2] == offset:
+            return
+        if not self._read_journal():
+            self._reload()
+
+    def _append(self, records, sync=False):
+        payload = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records).encode('utf-8')
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+        with open(self.journal_path, 'ab') as f:
+            f.write(payload)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+            inode = os.fstat(f.fileno()).st_ino
+            size = f.tell()
+        self._journal_stamp = (inode, size)
+        self._records += len(records)
+
+    def _maybe_compact(self):
+        if self._records < max(self.compact_every, 2 * len(self._tokens)):
+            return
+        try:
+            self._compact()
+        except Exception as e:
+            print(f"Warning: could not compact {self.journal_path}: {e}")
+
+    def _compact(self):
+        """Write the live tokens to the snapshot and start an empty journal. Caller holds the locks."""
+        snapshot = {token: {'username': username, 'expires': expires.isoformat()}
+                    for token, (username, expires) in self._tokens.items()}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        self._replace(self.path, json.dumps(snapshot, ensure_ascii=False, indent=4), directory)
+        self._replace(self.journal_path, '', directory)
+        self._snapshot_stamp = self._stamp(self.path)
+        journal = self._stamp(self.journal_path)
+        self._journal_stamp = (journal[0] if journal else None, 0)
+        self._records = 0
+
+    @staticmethod
+    def _replace(path, payload, directory):
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @contextmanager
+    def _locked(self):
+        """Thread lock (plus the file lock in shared mode) with the index caught up."""
+        if self.shared:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock, (_process_lock(self.path) if self.shared else nullcontext()):
+            self._catch_up()
+            yield
+
+    # -- API -------------------------------------------------------------
+
+    def refresh(self):
+        """Pick up tokens issued or used by other workers (one stat() per file if nothing changed)."""
+        try:
+            with self._lock:
+                self._catch_up()
+                self._purge(datetime.now())
+        except Exception as e:
+            print(f"Warning: could not load password tokens: {e}")
+
+    def issue(self, token, username, expires):
+        """Record a new token, revoking the oldest ones of `username` beyond `max_per_user`."""
+        with self._locked():
+            self._purge(datetime.now())
+            records = []
+            user_tokens = self._by_user.get(username, {})
+            excess = len(user_tokens) - self.max_per_user + 1
+            for old in list(user_tokens)[:max(excess, 0)]:
+                records.append({'op': 'revoke', 'token': old})
+            records.append({'op': 'issue', 'token': token, 'username': username,
+                            'expires': expires.isoformat()})
+            try:
+                self._append(records)
+            except Exception as e:
+                print(f"Warning: could not save password tokens: {e}")
+            for record in records[:-1]:
+                self._discard(record['token'])
+            self._add(token, username, expires)
+            self._maybe_compact()
+
+    def get(self, token):
+        """{'username', 'expires'} of a live token, or None if it is unknown, used or expired."""
+        with self._lock:
+            entry = self._tokens.get(token)
+        if entry is None or entry[1] <= datetime.now():
+            return None
+        return {'username': entry[0], 'expires': entry[1]}
+
+    def consume(self, token):
+        """Mark `token` used. Returns False if it was already gone (e.g. used by another worker) or expired."""
+        try:
+            with self._locked():
+                entry = self._tokens.get(token)
+                if entry is None:
+                    return False
+                if entry[1] <= datetime.now():
+                    # Expiry needs no journal record: replay drops it again
+                    self._discard(token)
+                    return False
+                # Synced: a used token must not come back after a crash
+                self._append([{'op': 'use', 'token': token}], sync=True)
+                self._discard(token)
+                self._maybe_compact()
+                return True
+        except Exception as e:
+            print(f"Warning: could not save password tokens: {e}")
+            return False
+
+    def compact(self):
+        """Write the live tokens to the snapshot and start an empty journal."""
+        with self._locked():
+            self._compact()
+
+    def tokens_of(self, username):
+        """Live tokens of `username`, oldest first."""
+        with self._lock:
+            now = datetime.now()
+            return [t for t in self._by_user.get(username, ()) if self._tokens[t][1] > now]
+
+    def __len__(self):
+        return len(self._tokens)